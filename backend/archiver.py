@@ -0,0 +1,118 @@
+"""
+Sold Account Archiver
+Runs in background and moves sold accounts (with their secrets) out of the
+hot accounts table into accounts_archive once they are old enough
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, delete, exists
+from .database import async_session
+from .models import Account, AccountSecret, AccountArchive, Purchase
+
+logger = logging.getLogger(__name__)
+
+
+class AccountArchiver:
+    def __init__(self, min_age_days: int = 30, check_interval: int = 3600, batch_size: int = 500):
+        """
+        Initialize archiver
+
+        Args:
+            min_age_days: Archive accounts sold more than this many days ago
+            check_interval: Run every N seconds (default: 3600 = 1 hour)
+            batch_size: Accounts moved per transaction
+        """
+        self.min_age_days = min_age_days
+        self.check_interval = check_interval
+        self.batch_size = batch_size
+        self.is_running = False
+
+    def _candidates_stmt(self, cutoff: datetime):
+        """Sold accounts whose latest sale (and creation) is before the cutoff"""
+        recent_sale = exists().where(
+            Purchase.account_id == Account.id,
+            Purchase.created_at >= cutoff
+        )
+        return (
+            select(Account.id)
+            .where(Account.is_sold == True, Account.created_at < cutoff, ~recent_sale)
+            .order_by(Account.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+
+    async def archive_batch(self) -> int:
+        """Move one batch in a single transaction. Returns how many were moved."""
+        cutoff = datetime.utcnow() - timedelta(days=self.min_age_days)
+
+        async with async_session() as session:
+            try:
+                result = await session.execute(self._candidates_stmt(cutoff))
+                ids = result.scalars().all()
+                if not ids:
+                    return 0
+
+                await session.execute(
+                    insert(AccountArchive).from_select(
+                        ["id", "country_id", "phone_number", "session_data", "type", "created_at", "twofa_password"],
+                        select(
+                            Account.id,
+                            Account.country_id,
+                            Account.phone_number,
+                            AccountSecret.session_data,
+                            Account.type,
+                            Account.created_at,
+                            Account.twofa_password
+                        )
+                        .outerjoin(AccountSecret, AccountSecret.account_id == Account.id)
+                        .where(Account.id.in_(ids))
+                    )
+                )
+                await session.execute(delete(AccountSecret).where(AccountSecret.account_id.in_(ids)))
+                await session.execute(delete(Account).where(Account.id.in_(ids)))
+                await session.commit()
+                return len(ids)
+            except Exception:
+                await session.rollback()
+                raise
+
+    async def archive_all(self) -> int:
+        """Drain every eligible account, batch by batch"""
+        total = 0
+        while True:
+            moved = await self.archive_batch()
+            total += moved
+            if moved < self.batch_size:
+                return total
+
+    async def archive_loop(self):
+        """Main archiving loop"""
+        logger.info(
+            f"🗄️ Account archiver started (sold > {self.min_age_days} days, "
+            f"every {self.check_interval}s)"
+        )
+
+        while self.is_running:
+            try:
+                moved = await self.archive_all()
+                if moved:
+                    logger.info(f"🗄️ Archived {moved} sold accounts")
+            except Exception as e:
+                logger.error(f"❌ Archiver error: {e}")
+
+            await asyncio.sleep(self.check_interval)
+
+    async def start(self):
+        """Start the archiver"""
+        if self.is_running:
+            logger.warning("⚠️ Archiver already running")
+            return
+
+        self.is_running = True
+        await self.archive_loop()
+
+    def stop(self):
+        """Stop the archiver"""
+        self.is_running = False
+        logger.info("🛑 Account archiver stopped")
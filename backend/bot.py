@@ -2,7 +2,7 @@ import os
 import logging
 import asyncio
 from datetime import datetime
-from aiogram import Bot, Dispatcher, types, F
+from aiogram import Bot, Dispatcher, types, F, flags
 from aiogram.filters import Command
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo
@@ -10,9 +10,13 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from dotenv import load_dotenv
 from .database import async_session
-from .models import User, Country, Account, Purchase, Deposit, Settings
+from . import db_metrics
+from .callback_answer import early_answer_middleware, DropLateAnswers
+from .models import User, Country, Account, Purchase, Deposit, Settings, CountryStock
 from .session_manager import get_session_manager
 from .device_manager import DeviceManager
+from .settings_cache import settings_cache, bump_settings_version
+from .inventory import purchase_account, countries_in_stock_stmt, get_stock, purchased_account_stmt, get_buyer_rank
 from sqlalchemy import select, update, func
 
 load_dotenv()
@@ -70,6 +74,40 @@ async def error_handler(event: types.ErrorEvent):
     # This prevents aiogram from crashing the bot
     return True
 
+# --- SQL attribution: tag queries with the handler that issued them ---
+async def db_source_middleware(handler, event, data):
+    token = db_metrics.current_source.set(f"bot:{data['handler'].callback.__name__}")
+    try:
+        return await handler(event, data)
+    finally:
+        db_metrics.current_source.reset(token)
+
+dp.message.middleware(db_source_middleware)
+dp.callback_query.middleware(db_source_middleware)
+
+# --- Answer callback queries before handler work (see backend/callback_answer.py) ---
+dp.callback_query.middleware(early_answer_middleware)
+bot.session.middleware(DropLateAnswers())
+
+# --- Background work ---
+# Handlers run in their chat's update lane (backend/update_queue.py); anything that
+# loops for seconds or minutes runs as a task so the lane and the worker are freed.
+_background_tasks = set()
+
+async def _log_failure(coro, name: str):
+    try:
+        await coro
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Background {name} failed: {e}", exc_info=True)
+
+def run_in_background(coro, name: str):
+    task = asyncio.create_task(_log_failure(coro, name))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
 # --- FSM States ---
 class DepositStates(StatesGroup):
     waiting_for_amount = State()
@@ -132,26 +170,22 @@ def get_back_to_main():
 async def check_channel_membership(user_id: int) -> bool:
     """Check if user is a member of the required channel"""
     try:
-        async with async_session() as session:
-            channel_setting = await session.execute(
-                select(Settings).where(Settings.key == "bot_channel_link")
-            )
-            setting = channel_setting.scalar_one_or_none()
-            
-            if not setting or not setting.value or not str(setting.value).strip():
-                return True  # No channel configured
-            
-            channel_username = setting.value
-            if "t.me/" in channel_username:
-                channel_username = channel_username.split("t.me/")[-1]
-            if not channel_username.startswith("@"):
-                channel_username = f"@{channel_username}"
-            
-            try:
-                member = await bot.get_chat_member(channel_username, user_id)
-                return member.status in ["creator", "administrator", "member"]
-            except:
-                return True  # Fail open on error
+        channel_link = await settings_cache.get("bot_channel_link")
+        
+        if not channel_link or not str(channel_link).strip():
+            return True  # No channel configured
+        
+        channel_username = channel_link
+        if "t.me/" in channel_username:
+            channel_username = channel_username.split("t.me/")[-1]
+        if not channel_username.startswith("@"):
+            channel_username = f"@{channel_username}"
+        
+        try:
+            member = await bot.get_chat_member(channel_username, user_id)
+            return member.status in ["creator", "administrator", "member"]
+        except:
+            return True  # Fail open on error
                 
     except Exception as e:
         logger.error(f"Error in check_channel_membership: {e}")
@@ -212,12 +246,7 @@ async def cmd_start(message: types.Message):
     is_member = await check_channel_membership(message.from_user.id)
     
     if not is_member:
-        async with async_session() as session:
-            channel_setting = await session.execute(
-                select(Settings).where(Settings.key == "bot_channel_link")
-            )
-            setting = channel_setting.scalar_one_or_none()
-            channel_link = setting.value if setting else "https://t.me/yourchannel"
+        channel_link = await settings_cache.get("bot_channel_link", "https://t.me/yourchannel")
         
         await show_force_join_message(message, channel_link)
         return
@@ -284,6 +313,7 @@ async def cmd_start(message: types.Message):
             pass  # If even fallback fails, log it but don't crash
 
 @dp.callback_query(F.data == "check_membership")
+@flags.callback_answer(disabled=True)
 async def handle_check_membership(callback: types.CallbackQuery):
     """Handle membership verification check"""
     await callback.answer("Checking membership...")
@@ -300,12 +330,7 @@ async def handle_check_membership(callback: types.CallbackQuery):
         
         await callback.message.edit_text(text, reply_markup=get_main_menu(is_admin), parse_mode="HTML")
     else:
-        async with async_session() as session:
-            channel_setting = await session.execute(
-                select(Settings).where(Settings.key == "bot_channel_link")
-            )
-            setting = channel_setting.scalar_one_or_none()
-            channel_link = setting.value if setting else "https://t.me/yourchannel"
+        channel_link = await settings_cache.get("bot_channel_link", "https://t.me/yourchannel")
         
         # Explicit feedback: 1. Alert 2. Refresh Message
         await callback.answer("❌ You have NOT joined the channel yet!\n\nPlease join and try again.", show_alert=True)
@@ -353,76 +378,71 @@ async def process_deposit_amount(message: types.Message, state: FSMContext):
     await state.update_data(deposit_amount=amount)
     await state.set_state(DepositStates.waiting_for_utr)
     
-    async with async_session() as session:
-        # Fetch Payment Settings
-        upi_res = await session.execute(select(Settings).where(Settings.key == "payment_upi_id"))
-        qr_res = await session.execute(select(Settings).where(Settings.key == "payment_qr_image"))
-        
-        upi_id = upi_res.scalar_one_or_none()
-        qr_image = qr_res.scalar_one_or_none()
-        
-        target_upi_id = upi_id.value if upi_id else "example@upi"
-        
-        # Check if custom QR image exists
-        custom_qr_path = qr_image.value if qr_image else None
-        
-        builder = InlineKeyboardBuilder()
-        builder.row(InlineKeyboardButton(text="🏠 Main Menu", callback_data="btn_main_menu"))
-        
-        if custom_qr_path:
-            # Check if it's a URL (Supabase) or Local File
-            photo_input = None
-            if custom_qr_path.startswith("http"):
-                photo_input = custom_qr_path
-            elif os.path.exists(custom_qr_path):
-                photo_input = FSInputFile(custom_qr_path)
-            
-            if photo_input:
-                # Send Custom QR
-                text = (
-                    f"<b>🏧 Deposit Amount: ₹{amount}</b>\n\n"
-                    f"📍 <b>UPI ID:</b> <code>{target_upi_id}</code>\n\n"
-                    "📸 <b>Scan the QR Code below to Pay</b>\n\n"
-                    "✅ <b>Instructions:</b>\n"
-                    "1. Open your UPI app.\n"
-                    "2. Scan this QR or pay to the UPI ID.\n"
-                    "3. Copy the <b>UTR / Transaction Ref ID</b>.\n\n"
-                    "👉 <b>Please enter the UTR / Ref ID here after payment:</b>"
-                )
-                await message.answer_photo(
-                    photo_input,
-                    caption=text,
-                    reply_markup=builder.as_markup(),
-                    parse_mode="HTML"
-                )
-            else:
-                 # Fallback if file not found
-                 pass # Fall through to dynamic generation logic below? No, duplicate logic.
-                 # Let's restructure properly
+    # Payment Settings (in-memory cache)
+    payment = await settings_cache.get_many("payment_upi_id", "payment_qr_image")
+    
+    target_upi_id = payment["payment_upi_id"] or "example@upi"
+    
+    # Check if custom QR image exists
+    custom_qr_path = payment["payment_qr_image"]
+    
+    builder = InlineKeyboardBuilder()
+    builder.row(InlineKeyboardButton(text="🏠 Main Menu", callback_data="btn_main_menu"))
+    
+    if custom_qr_path:
+        # Check if it's a URL (Supabase) or Local File
+        photo_input = None
+        if custom_qr_path.startswith("http"):
+            photo_input = custom_qr_path
+        elif os.path.exists(custom_qr_path):
+            photo_input = FSInputFile(custom_qr_path)
         
-        # If no custom QR or failed path, generate dynamic one
-        if not custom_qr_path or (not photo_input):
-            # Generate Dynamic QR
-            qr_data = f"upi://pay?pa={target_upi_id}&am={amount}&cu=INR&tn=Deposit"
-            qr_url = f"https://api.qrserver.com/v1/create-qr-code/?size=300x300&data={qr_data}"
-
+        if photo_input:
+            # Send Custom QR
             text = (
                 f"<b>🏧 Deposit Amount: ₹{amount}</b>\n\n"
                 f"📍 <b>UPI ID:</b> <code>{target_upi_id}</code>\n\n"
-                "📸 <b>Scan QR or use the UPI ID above</b>\n\n"
+                "📸 <b>Scan the QR Code below to Pay</b>\n\n"
                 "✅ <b>Instructions:</b>\n"
-                "1. Open your UPI app (PhonePe, GPay, Paytm, etc.)\n"
-                "2. Pay the above amount.\n"
+                "1. Open your UPI app.\n"
+                "2. Scan this QR or pay to the UPI ID.\n"
                 "3. Copy the <b>UTR / Transaction Ref ID</b>.\n\n"
                 "👉 <b>Please enter the UTR / Ref ID here after payment:</b>"
             )
-            
             await message.answer_photo(
-                qr_url,
+                photo_input,
                 caption=text,
                 reply_markup=builder.as_markup(),
                 parse_mode="HTML"
             )
+        else:
+             # Fallback if file not found
+             pass # Fall through to dynamic generation logic below? No, duplicate logic.
+             # Let's restructure properly
+    
+    # If no custom QR or failed path, generate dynamic one
+    if not custom_qr_path or (not photo_input):
+        # Generate Dynamic QR
+        qr_data = f"upi://pay?pa={target_upi_id}&am={amount}&cu=INR&tn=Deposit"
+        qr_url = f"https://api.qrserver.com/v1/create-qr-code/?size=300x300&data={qr_data}"
+
+        text = (
+            f"<b>🏧 Deposit Amount: ₹{amount}</b>\n\n"
+            f"📍 <b>UPI ID:</b> <code>{target_upi_id}</code>\n\n"
+            "📸 <b>Scan QR or use the UPI ID above</b>\n\n"
+            "✅ <b>Instructions:</b>\n"
+            "1. Open your UPI app (PhonePe, GPay, Paytm, etc.)\n"
+            "2. Pay the above amount.\n"
+            "3. Copy the <b>UTR / Transaction Ref ID</b>.\n\n"
+            "👉 <b>Please enter the UTR / Ref ID here after payment:</b>"
+        )
+        
+        await message.answer_photo(
+            qr_url,
+            caption=text,
+            reply_markup=builder.as_markup(),
+            parse_mode="HTML"
+        )
 
 @dp.message(DepositStates.waiting_for_utr)
 async def process_deposit_utr(message: types.Message, state: FSMContext):
@@ -628,31 +648,8 @@ async def process_accounts(callback: types.CallbackQuery):
     await callback.answer()
     
     async with async_session() as session:
-        # OPTIMIZED: Single query with JOIN and GROUP BY instead of 64 separate queries
-        # This reduces 8+ seconds to milliseconds!
-        query = select(
-            Country.id,
-            Country.name,
-            Country.emoji,
-            Country.price,
-            func.count(Account.id).label('stock')
-        ).outerjoin(
-            Account,
-            (Account.country_id == Country.id) & 
-            (Account.is_sold == False) & 
-            (Account.type == 'ID')
-        ).group_by(
-            Country.id,
-            Country.name,
-            Country.emoji,
-            Country.price
-        ).having(
-            func.count(Account.id) > 0
-        ).order_by(
-            Country.name
-        )
-        
-        result = await session.execute(query)
+        # Read the materialized counters - one row per country, no matter how big inventory gets
+        result = await session.execute(countries_in_stock_stmt("ID"))
         countries_with_stock = result.all()
     
     if not countries_with_stock:
@@ -692,20 +689,22 @@ async def process_country_selection(callback: types.CallbackQuery):
         country = result.scalar_one_or_none()
 
         if not country:
-            await callback.answer("Country not found.")
+            # Answered early: a toast here would be dropped
+            await callback.message.edit_text("❌ Country not found.", reply_markup=get_back_to_main())
             return
 
-        # Count available stock for IDs
-        stock_stmt = select(Account).where(
+        # Available stock from the counter, plus one preview row
+        available_stock = await get_stock(session, country_id, "ID")
+        preview_stmt = select(Account.phone_number).where(
             Account.country_id == country_id,
             Account.is_sold == False,
             Account.type == "ID"
-        )
-        stock_res = await session.execute(stock_stmt)
-        available_accounts = stock_res.scalars().all()
-        available_stock = len(available_accounts)
+        ).order_by(Account.id).limit(1)
+        preview_res = await session.execute(preview_stmt)
+        preview_phone = preview_res.scalar_one_or_none()
 
-        if available_stock == 0:
+        if available_stock == 0 or preview_phone is None:
+            available_stock = 0
             text = f"🏴 <b>Country:</b> {country.emoji} {country.name}\n"
             text += f"💵 <b>Price per ID:</b> ₹{country.price}\n"
             text += f"📦 <b>Available Stock:</b> {available_stock} IDs\n\n"
@@ -718,13 +717,10 @@ async def process_country_selection(callback: types.CallbackQuery):
             await callback.message.edit_text(text, reply_markup=builder.as_markup(), parse_mode="HTML")
             return
 
-        # Get first available account to show phone number
-        preview_account = available_accounts[0]
-        
         # Show confirmation with phone number and disclaimer
         text = f"🏴 <b>Country:</b> {country.emoji} {country.name}\n"
         text += f"💵 <b>Price:</b> ₹{country.price}\n"
-        text += f"📱 <b>Phone Number:</b> <code>{preview_account.phone_number}</code>\n"
+        text += f"📱 <b>Phone Number:</b> <code>{preview_phone}</code>\n"
         text += f"📦 <b>Stock:</b> {available_stock} available\n\n"
         text += "⚠️ <b>IMPORTANT DISCLAIMER:</b>\n"
         text += "• We are NOT responsible for banned/frozen accounts\n"
@@ -754,6 +750,7 @@ async def process_country_selection(callback: types.CallbackQuery):
         await callback.message.edit_text(text, reply_markup=builder.as_markup(), parse_mode="HTML")
 
 @dp.callback_query(F.data.startswith("confirm_buy_"))
+@flags.callback_answer(text="Processing purchase...")
 async def confirm_purchase_handler(callback: types.CallbackQuery):
     """CRITICAL HANDLER: Processes account purchases - This was MISSING!"""
     try:
@@ -787,47 +784,30 @@ async def confirm_purchase_handler(callback: types.CallbackQuery):
                 )
                 return
             
-            # Check balance
-            if user.balance < country.price:
-                text = f"❌ <b>Insufficient Balance!</b>\n\nRequired: ₹{country.price}\nYour Balance: ₹{user.balance}\nNeed: ₹{country.price - user.balance} more\n\n💰 Please add balance first!"
+            # Debit, claim and record in one transaction (race-free)
+            price = country.price  # a failed purchase rolls back and expires user/country
+            result = await purchase_account(session, user.id, country_id, price, "ID")
+
+            if result.get("status") == "INSUFFICIENT_BALANCE":
+                balance = result["balance"]
+                text = f"❌ <b>Insufficient Balance!</b>\n\nRequired: ₹{price}\nYour Balance: ₹{balance}\nNeed: ₹{price - balance} more\n\n💰 Please add balance first!"
                 builder = InlineKeyboardBuilder()
                 builder.row(InlineKeyboardButton(text="➕ Add Balance", callback_data="btn_deposit"))
                 builder.row(InlineKeyboardButton(text="🏠 Main Menu", callback_data="btn_main_menu"))
                 await callback.message.edit_text(text, reply_markup=builder.as_markup(), parse_mode="HTML")
                 return
-            
-            # Get available account
-            account_stmt = select(Account).where(
-                Account.country_id == country_id,
-                Account.is_sold == False,
-                Account.type == "ID"
-            ).limit(1)
-            account_result = await session.execute(account_stmt)
-            account = account_result.scalar_one_or_none()
-            
-            if not account:
+
+            if result.get("status") == "OUT_OF_STOCK":
                 await callback.message.edit_text(
                     "❌ <b>Out of Stock!</b>\n\nThis account was just sold. Please try another country.",
                     reply_markup=get_back_to_main(),
                     parse_mode="HTML"
                 )
                 return
-            
-            # Deduct balance & mark as sold
-            user.balance -= country.price
-            account.is_sold = True
-            
-            # Create purchase record
-            purchase = Purchase(
-                user_id=user.id,
-                account_id=account.id,
-                amount=country.price,
-                created_at=datetime.utcnow()
-            )
-            session.add(purchase)
-            await session.commit()
-            await session.refresh(user)
-        
+
+            account = result["account"]
+            new_balance = result["new_balance"]
+
         # Success message with OTP CODE
         text = "🎉 <b>Purchase Successful!</b>\n\n"
         text += f"📱 <b>Phone Number:</b> <code>{account.phone_number}</code>\n"
@@ -856,8 +836,8 @@ async def confirm_purchase_handler(callback: types.CallbackQuery):
         text += f"\n📨 <b>Login Code:</b> <code>{otp_code}</code>\n"
         text += "<i>(Tap 'Retry Code' if not received)</i>\n"
         
-        text += f"\n💰 <b>Amount Paid:</b> ₹{country.price}\n"
-        text += f"💵 <b>New Balance:</b> ₹{user.balance}\n\n"
+        text += f"\n💰 <b>Amount Paid:</b> ₹{price}\n"
+        text += f"💵 <b>New Balance:</b> ₹{new_balance}\n\n"
         text += "📋 <b>Next Steps:</b>\n1. Use the phone number to login\n2. Enter the code above\n3. Enter 2FA password if prompted\n\n✅ Account saved in your purchase history!"
         
         builder = InlineKeyboardBuilder()
@@ -868,7 +848,7 @@ async def confirm_purchase_handler(callback: types.CallbackQuery):
         builder.row(InlineKeyboardButton(text="🏠 Main Menu", callback_data="btn_main_menu"))
         
         await callback.message.edit_text(text, reply_markup=builder.as_markup(), parse_mode="HTML")
-        logger.info(f"✅ Purchase: User {user.telegram_id} bought {account.phone_number} for ₹{country.price}")
+        logger.info(f"✅ Purchase: User {user.telegram_id} bought {account.phone_number} for ₹{price}")
         
     except Exception as e:
         logger.error(f"❌ Purchase error: {e}", exc_info=True)
@@ -888,28 +868,12 @@ async def process_profile(callback: types.CallbackQuery):
         user = result.scalar_one_or_none()
 
         if not user:
-            await callback.answer("User not found.")
+            await callback.message.edit_text("❌ User not found. Send /start to register.", reply_markup=get_back_to_main())
             return
 
-        # Calculate Total Spent
-        spent_stmt = select(Purchase.amount).where(Purchase.user_id == user.id)
-        spent_res = await session.execute(spent_stmt)
-        total_spent = sum(spent_res.scalars().all())
-
-        # Calculate Ranking (all users sum of purchases)
-        all_users_stmt = select(User.id)
-        all_users_res = await session.execute(all_users_stmt)
-        all_user_ids = all_users_res.scalars().all()
-
-        rankings = []
-        for uid in all_user_ids:
-            u_spent_stmt = select(Purchase.amount).where(Purchase.user_id == uid)
-            u_spent_res = await session.execute(u_spent_stmt)
-            rankings.append((uid, sum(u_spent_res.scalars().all())))
-        
-        # Sort rankings descending
-        rankings.sort(key=lambda x: x[1], reverse=True)
-        user_rank = next((i + 1 for i, r in enumerate(rankings) if r[0] == user.id), "N/A")
+        # Total spent is kept on the user row; rank is one indexed count
+        total_spent = user.total_spent or 0
+        user_rank = await get_buyer_rank(session, total_spent)
 
         text = "👤 <b>Your Profile</b>\n\n"
         text += f"ID: <code>{user.telegram_id}</code>\n"
@@ -1005,6 +969,8 @@ async def process_help(callback: types.CallbackQuery):
 async def process_main_menu(callback: types.CallbackQuery, state: FSMContext):
     # Clear any FSM state
     await state.clear()
+    # "Stop Monitoring" / "Stop Waiting" on an OTP screen lands here
+    stop_otp_waiting(callback.message)
     
     # Check if user is admin
     is_admin = False
@@ -1044,6 +1010,7 @@ async def process_main_menu(callback: types.CallbackQuery, state: FSMContext):
 
 
 @dp.callback_query(F.data.startswith("buy_id_"))
+@flags.callback_answer(disabled=True)
 async def process_buy_id(callback: types.CallbackQuery):
     country_id = int(callback.data.split("_")[2])
     async with async_session() as session:
@@ -1061,30 +1028,19 @@ async def process_buy_id(callback: types.CallbackQuery):
             await callback.answer("Error: User or Country not found.")
             return
 
-        if user.balance < country.price:
-            await callback.answer(f"Insufficient balance. You need ₹{country.price - user.balance} more.", show_alert=True)
-            return
+        # Process purchase atomically
+        price = country.price  # a failed purchase rolls back and expires user/country
+        result = await purchase_account(session, user.id, country_id, price, "ID")
 
-        # Find available account
-        stmt = select(Account).where(Account.country_id == country_id, Account.is_sold == False, Account.type == "ID").limit(1)
-        result = await session.execute(stmt)
-        account = result.scalar_one_or_none()
+        if result.get("status") == "INSUFFICIENT_BALANCE":
+            await callback.answer(f"Insufficient balance. You need ₹{price - result['balance']} more.", show_alert=True)
+            return
 
-        if not account:
+        if result.get("status") == "OUT_OF_STOCK":
             await callback.answer("Out of stock for this country.", show_alert=True)
             return
 
-        # Process purchase
-        user.balance -= country.price
-        account.is_sold = True
-        
-        purchase = Purchase(
-            user_id=user.id,
-            account_id=account.id,
-            amount=country.price
-        )
-        session.add(purchase)
-        await session.commit()
+        account = result["account"]
 
         await callback.message.answer(
             f"✅ <b>Purchase Successful!</b>\n\n"
@@ -1098,28 +1054,9 @@ async def process_buy_id(callback: types.CallbackQuery):
 @dp.callback_query(F.data == "btn_sessions")
 async def process_sessions(callback: types.CallbackQuery):
     async with async_session() as session:
-        # Get all countries
-        stmt = select(Country)
-        result = await session.execute(stmt)
-        countries = result.scalars().all()
-        
-        # Calculate stock for each country (only Sessions)
-        countries_with_stock = []
-        for country in countries:
-            stock_stmt = select(Account).where(
-                Account.country_id == country.id,
-                Account.is_sold == False,
-                Account.type == "Session"
-            )
-            stock_res = await session.execute(stock_stmt)
-            stock_count = len(stock_res.scalars().all())
-            
-            # Only include countries with available stock
-            if stock_count > 0:
-                countries_with_stock.append({
-                    'country': country,
-                    'stock': stock_count
-                })
+        # Single read of the Session counters (only countries with stock)
+        result = await session.execute(countries_in_stock_stmt("Session"))
+        countries_with_stock = result.all()
 
     if not countries_with_stock:
         await callback.message.edit_text(
@@ -1131,11 +1068,9 @@ async def process_sessions(callback: types.CallbackQuery):
         return
 
     builder = InlineKeyboardBuilder()
-    for item in countries_with_stock:
-        country = item['country']
-        stock = item['stock']
-        button_text = f"{country.emoji} {country.name} | 📦 {stock} Sessions"
-        builder.row(InlineKeyboardButton(text=button_text, callback_data=f"session_{country.id}"))
+    for row in countries_with_stock:
+        button_text = f"{row.emoji} {row.name} | 📦 {row.stock} Sessions"
+        builder.row(InlineKeyboardButton(text=button_text, callback_data=f"session_{row.id}"))
     
     builder.row(InlineKeyboardButton(text="🏠 Main Menu", callback_data="btn_main_menu"))
     
@@ -1155,17 +1090,12 @@ async def process_session_country(callback: types.CallbackQuery):
         country = result.scalar_one_or_none()
 
         if not country:
-            await callback.answer("Country not found.")
+            # Answered early: a toast here would be dropped
+            await callback.message.edit_text("❌ Country not found.", reply_markup=get_back_to_main())
             return
 
-        # Count available stock for Sessions
-        stock_stmt = select(Account).where(
-            Account.country_id == country_id,
-            Account.is_sold == False,
-            Account.type == "Session"
-        )
-        stock_res = await session.execute(stock_stmt)
-        available_stock = len(stock_res.scalars().all())
+        # Available stock for Sessions from the counter
+        available_stock = await get_stock(session, country_id, "Session")
 
         # Show price, stock, and buy button
         text = f"🏴 <b>Country (Session):</b> {country.emoji} {country.name}\n"
@@ -1204,21 +1134,24 @@ async def process_confirm_purchase(callback: types.CallbackQuery):
         country = country_res.scalar_one_or_none()
         
         if not user or not country:
-            await callback.answer("Error: User or country not found")
+            await callback.message.edit_text("❌ User or country not found.", reply_markup=get_back_to_main())
             return
         
-        # Check if user has sufficient balance
-        if user.balance < country.price:
+        # Debit, claim and record in one transaction (race-free)
+        price, country_name = country.price, country.name  # a failed purchase rolls back and expires user/country
+        result = await purchase_account(session, user.id, country_id, price, "ID")
+
+        if result.get("status") == "INSUFFICIENT_BALANCE":
             try:
                 await callback.message.delete()
             except:
                 pass
-            await message.bot.send_message(
+            await callback.bot.send_message(
                 callback.message.chat.id,
                 f"❌ <b>Insufficient Balance!</b>\n\n"
-                f"💰 Your Balance: ₹{user.balance}\n"
-                f"💵 Required: ₹{country.price}\n"
-                f"💸 Short by: ₹{country.price - user.balance}\n\n"
+                f"💰 Your Balance: ₹{result['balance']}\n"
+                f"💵 Required: ₹{price}\n"
+                f"💸 Short by: ₹{price - result['balance']}\n\n"
                 "Please deposit to continue.",
                 reply_markup=InlineKeyboardBuilder()
                     .row(InlineKeyboardButton(text="💰 Deposit", callback_data="btn_deposit"))
@@ -1228,24 +1161,15 @@ async def process_confirm_purchase(callback: types.CallbackQuery):
             )
             return
         
-        # Find available account
-        account_stmt = select(Account).where(
-            Account.country_id == country_id,
-            Account.is_sold == False,
-            Account.type == "ID"
-        ).limit(1)
-        account_res = await session.execute(account_stmt)
-        account = account_res.scalar_one_or_none()
-        
-        if not account:
+        if result.get("status") == "OUT_OF_STOCK":
             try:
                 await callback.message.delete()
             except:
                 pass
-            await message.bot.send_message(
+            await callback.bot.send_message(
                 callback.message.chat.id,
                 "❌ <b>Out of Stock!</b>\n\n"
-                f"Sorry, no {country.name} IDs available right now.",
+                f"Sorry, no {country_name} IDs available right now.",
                 reply_markup=InlineKeyboardBuilder()
                     .row(InlineKeyboardButton(text="🔙 Back", callback_data="btn_accounts"))
                     .as_markup(),
@@ -1253,31 +1177,22 @@ async def process_confirm_purchase(callback: types.CallbackQuery):
             )
             return
         
-        # Process purchase
-        user.balance -= country.price
-        account.is_sold = True
-        
-        purchase = Purchase(
-            user_id=user.id,
-            account_id=account.id,
-            amount=country.price
-        )
-        session.add(purchase)
-        await session.commit()
-        await session.refresh(purchase)
-        
+        account = result["account"]
+        purchase_id = result["purchase_id"]
+        new_balance = result["new_balance"]
+
         # Show purchase success with OTP button (DELETE+SEND to prevent crash)
         try:
             await callback.message.delete()
         except:
             pass
-        await message.bot.send_message(
+        await callback.bot.send_message(
             callback.message.chat.id,
             f"✅ <b>Purchase Successful!</b>\n\n"
             f"📱 <b>Your Telegram ID:</b>\n"
             f"<code>{account.phone_number}</code>\n\n"
-            f"💰 <b>Paid:</b> ₹{country.price}\n"
-            f"💳 <b>Remaining Balance:</b> ₹{user.balance}\n\n"
+            f"💰 <b>Paid:</b> ₹{price}\n"
+            f"💳 <b>Remaining Balance:</b> ₹{new_balance}\n\n"
             f"📋 <b>How to Login:</b>\n"
             f"1️⃣ Open Telegram app\n"
             f"2️⃣ Enter the phone number above\n"
@@ -1288,7 +1203,7 @@ async def process_confirm_purchase(callback: types.CallbackQuery):
             reply_markup=InlineKeyboardBuilder()
                 .row(InlineKeyboardButton(
                     text="📲 Get OTP Code",
-                    callback_data=f"get_otp_{purchase.id}"
+                    callback_data=f"get_otp_{purchase_id}"
                 ))
                 .row(InlineKeyboardButton(
                     text="🏠 Main Menu",
@@ -1300,6 +1215,7 @@ async def process_confirm_purchase(callback: types.CallbackQuery):
 
 
 @dp.callback_query(F.data.startswith("get_otp_"))
+@flags.callback_answer(disabled=True)
 async def process_get_otp(callback: types.CallbackQuery):
     """Start OTP monitoring for a purchase"""
     purchase_id = int(callback.data.split("_")[2])
@@ -1315,9 +1231,9 @@ async def process_get_otp(callback: types.CallbackQuery):
             return
         
         # Get account
-        account_stmt = select(Account).where(Account.id == purchase.account_id)
+        account_stmt = purchased_account_stmt(purchase.account_id, with_secret=True)
         account_res = await session.execute(account_stmt)
-        account = account_res.scalar_one_or_none()
+        account = account_res.one_or_none()
         
         if not account or not account.session_data:
             try:
@@ -1360,7 +1276,7 @@ async def process_get_otp(callback: types.CallbackQuery):
             )
             
             # Start the OTP waiting loop with new message
-            await show_otp_waiting(new_message, account.phone_number, purchase_id)
+            start_otp_waiting(new_message, account.phone_number, purchase_id)
             
         except Exception as e:
             logger.error(f"Error starting OTP monitoring: {e}")
@@ -1381,6 +1297,22 @@ async def process_get_otp(callback: types.CallbackQuery):
                 await callback.answer("❌ Error occurred. Please try again.", show_alert=True)
 
 
+# Running OTP waits, by (chat_id, message_id) of the message they keep editing
+otp_waits = {}
+
+def start_otp_waiting(message: types.Message, phone_number: str, purchase_id: int):
+    """Poll for the OTP/login in the background so Stop, Resend and Check presses are not queued behind it"""
+    stop_otp_waiting(message)
+    key = (message.chat.id, message.message_id)
+    task = run_in_background(show_otp_waiting(message, phone_number, purchase_id), "OTP wait")
+    otp_waits[key] = task
+    task.add_done_callback(lambda done: otp_waits.pop(key, None) if otp_waits.get(key) is done else None)
+
+def stop_otp_waiting(message: types.Message):
+    task = otp_waits.pop((message.chat.id, message.message_id), None)
+    if task:
+        task.cancel()
+
 async def show_otp_waiting(message: types.Message, phone_number: str, purchase_id: int, attempt: int = 0):
     """Show OTP waiting screen with manual check button"""
     session_mgr = get_session_manager()
@@ -1424,9 +1356,9 @@ async def show_otp_waiting(message: types.Message, phone_number: str, purchase_i
             
             twofa_password = None
             if purchase:
-                account_stmt = select(Account).where(Account.id == purchase.account_id)
+                account_stmt = purchased_account_stmt(purchase.account_id)
                 account_res = await db_session.execute(account_stmt)
-                account = account_res.scalar_one_or_none()
+                account = account_res.one_or_none()
                 if account:
                     twofa_password = account.twofa_password
         
@@ -1532,6 +1464,7 @@ async def show_otp_waiting(message: types.Message, phone_number: str, purchase_i
 
 
 @dp.callback_query(F.data.startswith("resend_otp_"))
+@flags.callback_answer(text="Checking for new code...")
 async def process_resend_otp(callback: types.CallbackQuery):
     """Resend OTP request (clears cache and restarts monitoring)"""
     purchase_id = int(callback.data.split("_")[2])
@@ -1542,15 +1475,16 @@ async def process_resend_otp(callback: types.CallbackQuery):
         purchase = purchase_res.scalar_one_or_none()
         
         if not purchase:
-            await callback.answer("Purchase not found")
+            # Answered early: a toast here would be dropped, and an edit would hide the number
+            await callback.message.answer("❌ Purchase not found.")
             return
         
-        account_stmt = select(Account).where(Account.id == purchase.account_id)
+        account_stmt = purchased_account_stmt(purchase.account_id)
         account_res = await session.execute(account_stmt)
-        account = account_res.scalar_one_or_none()
+        account = account_res.one_or_none()
         
         if not account:
-            await callback.answer("Account not found")
+            await callback.message.answer("❌ Account not found.")
             return
         
         # Clear OTP cache and FORCE ACTIVE CHECK
@@ -1562,9 +1496,10 @@ async def process_resend_otp(callback: types.CallbackQuery):
         # Active check to get the new code immediately
         await session_mgr.check_latest_otp(account.phone_number)
         
-        await show_otp_waiting(callback.message, account.phone_number, purchase_id)
+        start_otp_waiting(callback.message, account.phone_number, purchase_id)
 # Handler for manual OTP check
 @dp.callback_query(F.data.startswith("check_otp_"))
+@flags.callback_answer(text="Checking Telegram messages...")
 async def handle_check_otp(callback: types.CallbackQuery):
     purchase_id = int(callback.data.split("_")[2])
     
@@ -1575,15 +1510,16 @@ async def handle_check_otp(callback: types.CallbackQuery):
         purchase = purchase_res.scalar_one_or_none()
         
         if not purchase:
-            await callback.answer("Purchase not found")
+            # Answered early: a toast here would be dropped, and an edit would hide the number
+            await callback.message.answer("❌ Purchase not found.")
             return
         
-        account_stmt = select(Account).where(Account.id == purchase.account_id)
+        account_stmt = purchased_account_stmt(purchase.account_id, with_secret=True)
         account_res = await session.execute(account_stmt)
-        account = account_res.scalar_one_or_none()
+        account = account_res.one_or_none()
         
         if not account:
-            await callback.answer("Account not found")
+            await callback.message.answer("❌ Account not found.")
             return
         
         # Check if monitoring is active
@@ -1601,17 +1537,18 @@ async def handle_check_otp(callback: types.CallbackQuery):
                 await asyncio.sleep(2)
             except Exception as e:
                 logger.error(f"Failed to restart monitoring: {e}")
-                await callback.answer("Failed to reconnect session")
+                await callback.message.answer("❌ Failed to reconnect the session. Please try again.")
                 return
 
         # FORCE ACTIVE CHECK: actively fetch history from 777000
         await callback.answer("Checking Telegram messages...")
         await session_mgr.check_latest_otp(account.phone_number)
         
-        await show_otp_waiting(callback.message, account.phone_number, purchase_id)
+        start_otp_waiting(callback.message, account.phone_number, purchase_id)
 
 # Handler for login status check
 @dp.callback_query(F.data.startswith("check_login_"))
+@flags.callback_answer(text="Checking login status...")
 async def handle_check_login(callback: types.CallbackQuery):
     purchase_id = int(callback.data.split("_")[2])
     
@@ -1621,19 +1558,20 @@ async def handle_check_login(callback: types.CallbackQuery):
         purchase = purchase_res.scalar_one_or_none()
         
         if not purchase:
-            await callback.answer("Purchase not found")
+            # Answered early: a toast here would be dropped, and an edit would hide the number
+            await callback.message.answer("❌ Purchase not found.")
             return
         
-        account_stmt = select(Account).where(Account.id == purchase.account_id)
+        account_stmt = purchased_account_stmt(purchase.account_id)
         account_res = await session.execute(account_stmt)
-        account = account_res.scalar_one_or_none()
+        account = account_res.one_or_none()
         
         if not account:
-            await callback.answer("Account not found")
+            await callback.message.answer("❌ Account not found.")
             return
         
         await callback.answer("Checking login status...")
-        await show_otp_waiting(callback.message, account.phone_number, purchase_id)
+        start_otp_waiting(callback.message, account.phone_number, purchase_id)
 
 # --- Device Management Handlers ---
 
@@ -1654,9 +1592,9 @@ async def process_manage_session(callback: types.CallbackQuery):
             await callback.message.edit_text("❌ Purchase not found.", reply_markup=get_back_to_main())
             return
             
-        stmt_acc = select(Account).where(Account.id == purchase.account_id)
+        stmt_acc = purchased_account_stmt(purchase.account_id, with_secret=True)
         res_acc = await session.execute(stmt_acc)
-        account = res_acc.scalar_one_or_none()
+        account = res_acc.one_or_none()
         
         if not account or not account.session_data:
             await callback.message.edit_text("❌ No session data found for this account.", reply_markup=get_back_to_main())
@@ -1715,6 +1653,7 @@ async def process_manage_session(callback: types.CallbackQuery):
             )
 
 @dp.callback_query(F.data.startswith("kill_sess_"))
+@flags.callback_answer(disabled=True)
 async def process_kill_session(callback: types.CallbackQuery):
     """Terminate a session"""
     parts = callback.data.split("_")
@@ -1731,9 +1670,9 @@ async def process_kill_session(callback: types.CallbackQuery):
         
         if not purchase: return
         
-        stmt_acc = select(Account).where(Account.id == purchase.account_id)
+        stmt_acc = purchased_account_stmt(purchase.account_id, with_secret=True)
         res_acc = await session.execute(stmt_acc)
-        account = res_acc.scalar_one_or_none()
+        account = res_acc.one_or_none()
         
         if not account: return
 
@@ -1833,19 +1772,9 @@ async def process_deposit_amount(message: types.Message, state: FSMContext):
 
         
 
-        # Get payment settings from database
-
-        async with async_session() as session:
-
-            # Get UPI ID from settings
+        # Get payment settings (cached)
 
-            upi_stmt = select(Settings).where(Settings.key == "upi_id")
-
-            upi_res = await session.execute(upi_stmt)
-
-            upi_setting = upi_res.scalar_one_or_none()
-
-            upi_id = upi_setting.value if upi_setting else "Not configured"
+        upi_id = await settings_cache.get("upi_id", "Not configured")
 
         
 
@@ -2115,23 +2044,15 @@ async def process_accounts_button(callback: types.CallbackQuery):
 
         
 
-        for country in countries:
-
-            # Count available stock
-
-            stock_stmt = select(Account).where(
-
-                Account.country_id == country.id,
-
-                Account.is_sold == False,
-
-                Account.type == "ID"
-
-            )
+        # Counters for every country in one read
+        stock_res = await session.execute(
+            select(CountryStock.country_id, CountryStock.available).where(CountryStock.type == "ID")
+        )
+        stock_by_country = dict(stock_res.all())
 
-            stock_res = await session.execute(stock_stmt)
+        for country in countries:
 
-            stock_count = len(stock_res.scalars().all())
+            stock_count = max(stock_by_country.get(country.id, 0), 0)
 
             
 
@@ -2259,15 +2180,7 @@ async def process_deposit_amount(message: types.Message, state: FSMContext):
 
         # Get UPI ID from settings
 
-        async with async_session() as session:
-
-            upi_stmt = select(Settings).where(Settings.key == "upi_id")
-
-            upi_res = await session.execute(upi_stmt)
-
-            upi_setting = upi_res.scalar_one_or_none()
-
-            upi_id = upi_setting.value if upi_setting else "payment@upi"
+        upi_id = await settings_cache.get("upi_id", "payment@upi")
 
         
 
@@ -2475,6 +2388,7 @@ async def process_deposit_screenshot(message: types.Message, state: FSMContext):
 # === SESSION MANAGEMENT HANDLERS ===
 
 @dp.callback_query(F.data.startswith("manage_session_"))
+@flags.callback_answer(disabled=True)
 async def manage_session_handler(callback: types.CallbackQuery):
     """Show session management options - Get OTP code"""
     try:
@@ -2503,9 +2417,9 @@ async def manage_session_handler(callback: types.CallbackQuery):
                 return
             
             # Get account details
-            account_stmt = select(Account).where(Account.id == account_id)
+            account_stmt = purchased_account_stmt(account_id)
             account_result = await session.execute(account_stmt)
-            account = account_result.scalar_one_or_none()
+            account = account_result.one_or_none()
             
             if not account:
                 await callback.answer("❌ Account not found!", show_alert=True)
@@ -2535,6 +2449,7 @@ async def manage_session_handler(callback: types.CallbackQuery):
 
 
 @dp.callback_query(F.data == "btn_my_purchases")
+@flags.callback_answer(disabled=True)
 async def show_my_purchases(callback: types.CallbackQuery):
     """Show user's purchase history"""
     try:
@@ -2566,9 +2481,9 @@ async def show_my_purchases(callback: types.CallbackQuery):
             builder = InlineKeyboardBuilder()
             for i, purchase in enumerate(purchases[:10], 1):  # Show latest 10
                 # Get account details
-                account_stmt = select(Account).where(Account.id == purchase.account_id)
+                account_stmt = purchased_account_stmt(purchase.account_id)
                 account_result = await session.execute(account_stmt)
-                account = account_result.scalar_one_or_none()
+                account = account_result.one_or_none()
                 
                 if account:
                     # Get country
@@ -2618,15 +2533,16 @@ async def get_otp_code(callback: types.CallbackQuery):
 
 
 @dp.callback_query(F.data.startswith("view_session_"))
+@flags.callback_answer(disabled=True)
 async def view_full_session(callback: types.CallbackQuery):
     """View the full session string/code"""
     try:
         account_id = int(callback.data.split("_")[2])
         
         async with async_session() as session:
-            account_stmt = select(Account).where(Account.id == account_id)
+            account_stmt = purchased_account_stmt(account_id, with_secret=True)
             account_result = await session.execute(account_stmt)
-            account = account_result.scalar_one_or_none()
+            account = account_result.one_or_none()
             
             if not account:
                 await callback.answer("❌ Account not found!", show_alert=True)
@@ -2675,15 +2591,16 @@ async def retry_login(callback: types.CallbackQuery):
 # === RETRY CODE AND DEVICE MANAGEMENT HANDLERS ===
 
 @dp.callback_query(F.data.startswith("retry_code_"))
+@flags.callback_answer(disabled=True)
 async def retry_code_handler(callback: types.CallbackQuery):
     """Retry getting OTP code for login"""
     try:
         account_id = int(callback.data.split("_")[2])
         
         async with async_session() as session:
-            account_stmt = select(Account).where(Account.id == account_id)
+            account_stmt = purchased_account_stmt(account_id, with_secret=True)
             account_result = await session.execute(account_stmt)
-            account = account_result.scalar_one_or_none()
+            account = account_result.one_or_none()
             
             if not account:
                 await callback.answer("âŒ Account not found!", show_alert=True)
@@ -2734,6 +2651,7 @@ async def retry_code_handler(callback: types.CallbackQuery):
 
 
 @dp.callback_query(F.data.startswith("manage_devices_"))
+@flags.callback_answer(disabled=True)
 async def manage_devices_handler(callback: types.CallbackQuery):
     """Show active devices/sessions for this account"""
     try:
@@ -2762,9 +2680,9 @@ async def manage_devices_handler(callback: types.CallbackQuery):
                 return
             
             # Get account details
-            account_stmt = select(Account).where(Account.id == account_id)
+            account_stmt = purchased_account_stmt(account_id, with_secret=True)
             account_result = await session.execute(account_stmt)
-            account = account_result.scalar_one_or_none()
+            account = account_result.one_or_none()
             
             if not account:
                 await callback.answer("âŒ Account not found!", show_alert=True)
@@ -2864,6 +2782,7 @@ class BroadcastMessageStates(StatesGroup):
     waiting_for_message = State()
 
 @dp.callback_query(F.data == "btn_broadcast")
+@flags.callback_answer(disabled=True)
 async def process_broadcast_button(callback: types.CallbackQuery, state: FSMContext):
     """Admin clicked Broadcast button"""
     admin_id = int(os.getenv("ADMIN_TELEGRAM_ID", "0"))
@@ -2893,7 +2812,11 @@ async def process_broadcast_button(callback: types.CallbackQuery, state: FSMCont
 async def process_broadcast_message(message: types.Message, state: FSMContext):
     """Send broadcast message to all users"""
     await state.clear()
-    
+    # ~40ms per user: far too long to hold the admin's update lane
+    run_in_background(broadcast_to_all(message), "broadcast")
+
+
+async def broadcast_to_all(message: types.Message):
     # Get all users
     async with async_session() as session:
         stmt = select(User)
@@ -2979,6 +2902,7 @@ async def process_broadcast_message(message: types.Message, state: FSMContext):
 
 
 @dp.callback_query(F.data.startswith("terminate_device_"))
+@flags.callback_answer(disabled=True)
 async def terminate_device_handler(callback: types.CallbackQuery):
     """Terminate a specific device session"""
     try:
@@ -2988,9 +2912,9 @@ async def terminate_device_handler(callback: types.CallbackQuery):
         
         # Get account
         async with async_session() as session:
-            account_stmt = select(Account).where(Account.id == account_id)
+            account_stmt = purchased_account_stmt(account_id, with_secret=True)
             account_result = await session.execute(account_stmt)
-            account = account_result.scalar_one_or_none()
+            account = account_result.one_or_none()
             
             if not account:
                 await callback.answer("❌ Account not found!", show_alert=True)
@@ -3025,6 +2949,7 @@ async def terminate_device_handler(callback: types.CallbackQuery):
 
 
 @dp.callback_query(F.data.startswith("terminate_all_"))
+@flags.callback_answer(disabled=True)
 async def terminate_all_handler(callback: types.CallbackQuery):
     """Terminate all other devices except current"""
     try:
@@ -3032,9 +2957,9 @@ async def terminate_all_handler(callback: types.CallbackQuery):
         
         # Get account
         async with async_session() as session:
-            account_stmt = select(Account).where(Account.id == account_id)
+            account_stmt = purchased_account_stmt(account_id, with_secret=True)
             account_result = await session.execute(account_stmt)
-            account = account_result.scalar_one_or_none()
+            account = account_result.one_or_none()
             
             if not account:
                 await callback.answer("âŒ Account not found!", show_alert=True)
@@ -3134,6 +3059,7 @@ async def process_channel_link(message: types.Message, state: FSMContext):
             session.add(setting)
             logger.info(f"Created new setting with value '{channel_link}'")
         
+        await bump_settings_version(session)
         await session.commit()
         logger.info("✅ Database commit successful for channel_link")
         
@@ -3224,6 +3150,7 @@ async def process_owner_username(message: types.Message, state: FSMContext):
             session.add(setting)
             logger.info(f"Created new setting with value '{username}'")
         
+        await bump_settings_version(session)
         await session.commit()
         logger.info("✅ Database commit successful for bot_owner_username")
         
@@ -3248,6 +3175,7 @@ async def process_owner_username(message: types.Message, state: FSMContext):
 # === BROADCAST HANDLERS ===
 
 @dp.callback_query(F.data == "btn_broadcast")
+@flags.callback_answer(disabled=True)
 async def cmd_broadcast(callback: types.CallbackQuery, state: FSMContext):
     """ULTRA SIMPLE - Just show it works!"""
     await callback.answer("✅ BROADCAST BUTTON WORKS!", show_alert=True)
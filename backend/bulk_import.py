@@ -0,0 +1,205 @@
+"""
+Bulk Account Import
+Loads inventory from a CSV or JSONL upload: rows are parsed as a stream,
+checked against unsold stock in one indexed query per batch, and inserted
+with multi-row INSERTs. Each batch commits on its own, so a bad row or a
+failure late in a large file never loses the batches before it.
+
+Columns (CSV header or JSON keys): country, phone, session, twofa, type
+(country_id / phone_number / session_data / twofa_password also accepted).
+"""
+import io
+import csv
+import json
+import logging
+from sqlalchemy import select, insert
+from .database import async_session
+from .models import Country, Account, AccountSecret, digits_only
+from .inventory import adjust_stock
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+MIN_PHONE_DIGITS = 7
+
+ALIASES = {
+    "country_id": "country",
+    "phone_number": "phone",
+    "session_data": "session",
+    "session_string": "session",
+    "twofa_password": "twofa",
+    "2fa": "twofa",
+}
+
+
+def _normalize_keys(record: dict) -> dict:
+    normalized = {}
+    for key, value in record.items():
+        if key is None:
+            continue
+        key = key.strip().lower()
+        normalized[ALIASES.get(key, key)] = value.strip() if isinstance(value, str) else value
+    return normalized
+
+
+def iter_records(binary_file, fmt: str):
+    """
+    Yield (row_number, record or error message) from the upload without
+    reading it into memory. row_number counts data rows from 1.
+    """
+    text_file = io.TextIOWrapper(binary_file, encoding="utf-8-sig", newline="")
+    if fmt == "jsonl":
+        row = 0
+        for line in text_file:
+            if not line.strip():
+                continue
+            row += 1
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield row, "Invalid JSON"
+                continue
+            yield row, _normalize_keys(record) if isinstance(record, dict) else "Expected a JSON object"
+    else:
+        for row, record in enumerate(csv.DictReader(text_file), start=1):
+            yield row, _normalize_keys(record)
+
+
+class BulkImporter:
+    def __init__(self, default_type: str = "ID"):
+        self.default_type = default_type
+        self.countries = {}
+        self.seen = set()
+        self.report = []
+        self.inserted = 0
+        self.skipped = 0
+        self.failed = 0
+
+    async def load_countries(self):
+        async with async_session() as session:
+            result = await session.execute(select(Country.id, Country.name))
+            for country_id, name in result.all():
+                self.countries[str(country_id)] = country_id
+                if name:
+                    self.countries[name.strip().lower()] = country_id
+
+    def _fail(self, row: int, phone, detail: str):
+        self.failed += 1
+        self.report.append({"row": row, "phone": phone, "status": "ERROR", "detail": detail})
+
+    def validate(self, row: int, record):
+        """Turn one parsed record into Account values, or report why not"""
+        if isinstance(record, str):
+            return self._fail(row, None, record)
+
+        phone = record.get("phone")
+        digits = digits_only(str(phone)) if phone else None
+        if not digits or len(digits) < MIN_PHONE_DIGITS:
+            return self._fail(row, phone, "Missing or invalid phone number")
+
+        country_id = self.countries.get(str(record.get("country") or "").strip().lower())
+        if country_id is None:
+            return self._fail(row, phone, f"Unknown country: {record.get('country')}")
+
+        account_type = record.get("type") or self.default_type
+        return {
+            "row": row,
+            "country_id": country_id,
+            "phone_number": str(phone),
+            "phone_digits": digits,
+            "type": account_type,
+            "twofa_password": record.get("twofa") or None,
+            "session_data": record.get("session") or None,
+        }
+
+    async def insert_batch(self, batch: list):
+        """Drop duplicates, then one multi-row INSERT for accounts and one for secrets"""
+        async with async_session() as session:
+            # Same number already unsold in stock (restocking a sold number is allowed)
+            existing = await session.execute(
+                select(Account.phone_digits, Account.type)
+                .where(Account.phone_digits.in_({item["phone_digits"] for item in batch}), Account.is_sold == False)
+            )
+            duplicates = set(existing.all())
+
+            fresh = []
+            for item in batch:
+                key = (item["phone_digits"], item["type"])
+                if key in duplicates or key in self.seen:
+                    self.skipped += 1
+                    self.report.append({
+                        "row": item["row"], "phone": item["phone_number"], "status": "DUPLICATE",
+                        "detail": "Already in unsold stock" if key in duplicates else "Repeated in file"
+                    })
+                    continue
+                self.seen.add(key)
+                fresh.append(item)
+            if not fresh:
+                return
+
+            try:
+                result = await session.execute(
+                    insert(Account).returning(Account.id, sort_by_parameter_order=True),
+                    [
+                        {
+                            "country_id": item["country_id"],
+                            "phone_number": item["phone_number"],
+                            "phone_digits": item["phone_digits"],
+                            "type": item["type"],
+                            "twofa_password": item["twofa_password"],
+                            "is_sold": False,
+                        }
+                        for item in fresh
+                    ]
+                )
+                ids = result.scalars().all()
+
+                secrets = [
+                    {"account_id": account_id, "session_data": item["session_data"]}
+                    for account_id, item in zip(ids, fresh)
+                    if item["session_data"]
+                ]
+                if secrets:
+                    await session.execute(insert(AccountSecret), secrets)
+
+                deltas = {}
+                for item in fresh:
+                    key = (item["country_id"], item["type"])
+                    deltas[key] = deltas.get(key, 0) + 1
+                await adjust_stock(session, deltas)
+                await session.commit()
+            except Exception as e:
+                await session.rollback()
+                logger.error(f"❌ Bulk import batch failed: {e}")
+                for item in fresh:
+                    self.seen.discard((item["phone_digits"], item["type"]))
+                    self._fail(item["row"], item["phone_number"], f"Batch insert failed: {e}")
+                return
+
+        self.inserted += len(fresh)
+        for account_id, item in zip(ids, fresh):
+            self.report.append({"row": item["row"], "phone": item["phone_number"], "status": "INSERTED", "id": account_id})
+
+    async def run(self, binary_file, fmt: str) -> dict:
+        await self.load_countries()
+
+        batch = []
+        for row, record in iter_records(binary_file, fmt):
+            item = self.validate(row, record)
+            if item:
+                batch.append(item)
+            if len(batch) >= BATCH_SIZE:
+                await self.insert_batch(batch)
+                batch = []
+        if batch:
+            await self.insert_batch(batch)
+
+        self.report.sort(key=lambda entry: entry["row"])
+        logger.info(f"📦 Bulk import: {self.inserted} inserted, {self.skipped} duplicates, {self.failed} errors")
+        return {
+            "status": "SUCCESS" if not self.failed else "PARTIAL",
+            "inserted": self.inserted,
+            "duplicates": self.skipped,
+            "errors": self.failed,
+            "rows": self.report
+        }
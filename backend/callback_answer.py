@@ -0,0 +1,56 @@
+"""
+Early Callback Answers
+Answers every callback query as soon as its handler is resolved, before any
+DB or MTProto work, so the client's loading spinner stops immediately.
+
+Handlers that answer themselves to show an alert opt out with
+@flags.callback_answer(disabled=True). A fixed toast for the early answer can
+be set with @flags.callback_answer(text="..."). Once a query has been
+answered early, the handler's own callback.answer() calls are dropped rather
+than failing on an already answered query, so such handlers report errors by
+editing or replying to the message, not with a toast.
+"""
+import logging
+import contextvars
+from aiogram.dispatcher.flags import get_flag
+from aiogram.exceptions import TelegramAPIError
+from aiogram.methods import AnswerCallbackQuery
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+logger = logging.getLogger(__name__)
+
+# Callback query answered early by the handler running in the current task
+_answered_query = contextvars.ContextVar("early_answered_query", default=None)
+
+
+async def early_answer_middleware(handler, event, data):
+    """Inner callback_query middleware: flags are known once the handler is resolved"""
+    options = get_flag(data, "callback_answer")
+    if not isinstance(options, dict):
+        options = {}
+    if options.get("disabled"):
+        return await handler(event, data)
+
+    try:
+        await event.answer(text=options.get("text"))
+    except TelegramAPIError as e:
+        # Usually an expired query; the handler's own answer (if any) still goes out
+        logger.warning(f"⚠️ Early answer failed for callback {event.id}: {e}")
+        return await handler(event, data)
+
+    token = _answered_query.set(event.id)
+    try:
+        return await handler(event, data)
+    finally:
+        _answered_query.reset(token)
+
+
+class DropLateAnswers(BaseRequestMiddleware):
+    """Bot session middleware that skips answers to a query already answered early"""
+
+    async def __call__(self, make_request, bot, method):
+        if isinstance(method, AnswerCallbackQuery) and method.callback_query_id == _answered_query.get():
+            if method.text:
+                logger.debug(f"Dropped late callback answer: {method.text}")
+            return True
+        return await make_request(bot, method)
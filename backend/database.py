@@ -2,7 +2,11 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
 from .models import Base
+from .migrations import run_migrations
+from . import db_metrics
 import os
+import uuid
+from sqlalchemy import event
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -17,20 +21,94 @@ if not DB_URL:
 if "postgresql" in DB_URL and "asyncpg" not in DB_URL:
     DB_URL = DB_URL.replace("postgresql://", "postgresql+asyncpg://")
 
-# CRITICAL: Increased pool size and added recycling for bot + admin panel stability
-# This prevents connection exhaustion when both bot and admin panel are active
+SQL_ECHO = os.getenv("SQL_ECHO", "false").lower() == "true"  # Per-statement metrics live in db_metrics
+
+# Transaction-mode poolers (Supabase Supavisor/PgBouncer on :6543) hand each transaction
+# to any backend, so server-side prepared statements cannot be cached or reused by name.
+# DB_POOLER_MODE=transaction forces it on, =off forces it off; default: detect port 6543.
+_pooler_setting = os.getenv("DB_POOLER_MODE", "auto").lower()
+POOLER_MODE = (
+    _pooler_setting in ("transaction", "true", "on", "1")
+    or (_pooler_setting == "auto" and ":6543/" in DB_URL)
+)
+
+
+def _connect_args(url: str) -> dict:
+    if "asyncpg" not in url or not POOLER_MODE:
+        return {}
+    return {
+        "statement_cache_size": 0,            # asyncpg's own cache
+        "prepared_statement_cache_size": 0,   # SQLAlchemy dialect cache
+        # Unique names so a statement prepared on one backend never clashes on another
+        "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__"
+    }
+
+
+def _pool_kwargs(**kwargs):
+    """QueuePool sizing only applies to server databases; SQLite uses its own pool"""
+    if DB_URL.startswith("sqlite"):
+        return {}
+    return {"poolclass": db_metrics.InstrumentedPool, **kwargs}
+
+
+# The pooler multiplexes for us, so the local pool only needs to cover in-flight work.
+# Direct connections keep the larger pool sized for bot + admin panel.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10" if POOLER_MODE else "40"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5" if POOLER_MODE else "20"))
+
 engine = create_async_engine(
     DB_URL, 
-    echo=True,
-    pool_size=40,          # Increased to 40 to handle bot + admin panel concurrently
-    max_overflow=20,       # Allow up to 20 additional connections (60 total)
-    pool_pre_ping=True,    # Verify connections before using them
-    pool_recycle=3600,     # Recycle connections every hour to prevent stale connections
-    pool_timeout=15        # Increased timeout to 15 seconds for high load scenarios
+    echo=SQL_ECHO,
+    connect_args=_connect_args(DB_URL),
+    **_pool_kwargs(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_pre_ping=True,    # Verify connections before using them
+        pool_recycle=3600,     # Recycle connections every hour to prevent stale connections
+        pool_timeout=15        # Fail fast instead of queueing forever under load
+    )
 )
+db_metrics.install(engine)
 async_session = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
+# Read-only engine for admin listings/analytics: a replica if READ_DATABASE_URL is set,
+# otherwise the primary through its own small pool. Dashboard refreshes queue here
+# instead of taking connections from purchases, deposits and balance writes.
+READ_DB_URL = os.getenv("READ_DATABASE_URL") or DB_URL
+if "postgresql" in READ_DB_URL and "asyncpg" not in READ_DB_URL:
+    READ_DB_URL = READ_DB_URL.replace("postgresql://", "postgresql+asyncpg://")
+
+READ_STATEMENT_TIMEOUT_MS = int(os.getenv("READ_STATEMENT_TIMEOUT_MS", "15000"))
+
+_read_connect_args = _connect_args(READ_DB_URL)
+if "asyncpg" in READ_DB_URL and not POOLER_MODE:
+    _read_connect_args["server_settings"] = {
+        "statement_timeout": str(READ_STATEMENT_TIMEOUT_MS),
+        "default_transaction_read_only": "on"
+    }
+
+read_engine = create_async_engine(
+    READ_DB_URL,
+    echo=SQL_ECHO,
+    connect_args=_read_connect_args,
+    **_pool_kwargs(
+        pool_size=int(os.getenv("READ_POOL_SIZE", "5")),
+        max_overflow=0,        # Hard cap: analytics never grows past its share
+        pool_pre_ping=True,
+        pool_recycle=3600,
+        pool_timeout=30
+    )
+)
+db_metrics.install(read_engine)
+
+if "asyncpg" in READ_DB_URL and POOLER_MODE:
+    # Poolers reject startup parameters, so apply the limits per transaction instead
+    @event.listens_for(read_engine.sync_engine, "begin")
+    def _read_only_transaction(conn):
+        conn.exec_driver_sql("SET TRANSACTION READ ONLY")
+        conn.exec_driver_sql(f"SET LOCAL statement_timeout = {READ_STATEMENT_TIMEOUT_MS}")
+async_read_session = async_sessionmaker(read_engine, expire_on_commit=False, class_=AsyncSession)
+
 async def init_db():
-    async with engine.begin() as conn:
-        # await conn.run_sync(Base.metadata.drop_all) # Careful with this
-        await conn.run_sync(Base.metadata.create_all)
+    """Apply pending schema migrations (a single version check when up to date)"""
+    await run_migrations(engine, use_advisory_lock=not POOLER_MODE)
@@ -0,0 +1,197 @@
+"""
+SQL Instrumentation
+Engine event hooks that time every statement and aggregate latency and row
+counts per normalized statement and per calling source (bot handler or
+HTTP route), plus a bounded slow-query log. Replaces engine echo.
+"""
+import os
+import re
+import time
+import logging
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy import exc as sa_exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+MAX_STATEMENTS = 500  # Distinct statements tracked before folding into "<other>"
+
+# Who is running the query: set by the bot middleware / HTTP middleware
+current_source: ContextVar[str] = ContextVar("db_current_source", default="<background>")
+
+_statements = {}
+_sources = {}
+_slow_queries = deque(maxlen=100)
+
+_IN_LIST = re.compile(r"\((\s*(\?|\$\d+|%\(\w+\)s)\s*,)+\s*(\?|\$\d+|%\(\w+\)s)\s*\)")
+_NUMBERED_PARAM = re.compile(r"\$\d+")
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(\.\d+)?\b")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_statement(statement: str) -> str:
+    """Collapse whitespace, parameters, literals and expanded IN lists"""
+    text = _WHITESPACE.sub(" ", statement).strip()
+    text = _NUMBERED_PARAM.sub("?", text)
+    text = _STRING_LITERAL.sub("?", text)
+    text = _NUMBER_LITERAL.sub("?", text)
+    return _IN_LIST.sub("(...)", text)
+
+
+def _row_count(cursor):
+    if cursor.rowcount is not None and cursor.rowcount >= 0:
+        return cursor.rowcount
+    # The async adapters prefetch SELECT results into _rows and report rowcount -1
+    rows = getattr(cursor, "_rows", None)
+    return len(rows) if rows is not None else 0
+
+
+def _record(bucket: dict, key: str, elapsed_ms: float, rows: int):
+    stats = bucket.get(key)
+    if stats is None:
+        stats = bucket[key] = {"calls": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0}
+    stats["calls"] += 1
+    stats["total_ms"] += elapsed_ms
+    stats["rows"] += rows
+    if elapsed_ms > stats["max_ms"]:
+        stats["max_ms"] = elapsed_ms
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("query_start")
+    if not starts:
+        return
+    elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+    rows = _row_count(cursor)
+    source = current_source.get()
+
+    key = normalize_statement(statement)
+    if key not in _statements and len(_statements) >= MAX_STATEMENTS:
+        key = "<other>"
+    _record(_statements, key, elapsed_ms, rows)
+    _record(_sources, source, elapsed_ms, rows)
+
+    if elapsed_ms >= SLOW_QUERY_MS:
+        _slow_queries.append({
+            "at": datetime.utcnow().isoformat(),
+            "ms": round(elapsed_ms, 1),
+            "rows": rows,
+            "source": source,
+            "statement": key[:1000]
+        })
+        logger.warning(f"🐢 Slow query {elapsed_ms:.0f}ms ({rows} rows) from {source}: {key[:300]}")
+
+
+def _handle_error(context):
+    # Failed statements never reach after_cursor_execute; drop their start time
+    conn = context.connection
+    if conn is not None and conn.info.get("query_start"):
+        conn.info["query_start"].pop()
+
+
+def install(engine):
+    """Attach the timing hooks to an (async) engine"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+
+def _top(bucket: dict, limit: int, label: str):
+    ranked = sorted(bucket.items(), key=lambda item: item[1]["total_ms"], reverse=True)[:limit]
+    return [
+        {
+            label: key,
+            "calls": stats["calls"],
+            "total_ms": round(stats["total_ms"], 1),
+            "avg_ms": round(stats["total_ms"] / stats["calls"], 2),
+            "max_ms": round(stats["max_ms"], 1),
+            "rows": stats["rows"]
+        }
+        for key, stats in ranked
+    ]
+
+
+def snapshot(limit: int = 20) -> dict:
+    """Top statements and sources by total time, plus recent slow queries"""
+    return {
+        "slow_query_ms": SLOW_QUERY_MS,
+        "statements": _top(_statements, limit, "statement"),
+        "sources": _top(_sources, limit, "source"),
+        "slow_queries": list(_slow_queries)[::-1]
+    }
+
+
+def reset():
+    _statements.clear()
+    _sources.clear()
+    _slow_queries.clear()
+
+
+# --- Pool telemetry ---
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Async queue pool that records how long each checkout waited"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.peak_checked_out = 0
+        self.recent_waits = deque(maxlen=1000)
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except sa_exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        wait_ms = (time.perf_counter() - start) * 1000
+        self.checkouts += 1
+        self.total_wait_ms += wait_ms
+        self.recent_waits.append(wait_ms)
+        if wait_ms > self.max_wait_ms:
+            self.max_wait_ms = wait_ms
+        in_use = self.checkedout()
+        if in_use > self.peak_checked_out:
+            self.peak_checked_out = in_use
+        return conn
+
+
+def pool_snapshot(engine) -> dict:
+    """Current occupancy and checkout wait stats for an engine's pool"""
+    pool = engine.pool
+    stats = {"pool": type(pool).__name__}
+    if not isinstance(pool, AsyncAdaptedQueuePool):
+        return stats
+
+    stats.update({
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": pool._max_overflow
+    })
+    if isinstance(pool, InstrumentedPool):
+        waits = sorted(pool.recent_waits)
+        stats.update({
+            "peak_checked_out": pool.peak_checked_out,
+            "checkouts": pool.checkouts,
+            "timeouts": pool.timeouts,
+            "avg_wait_ms": round(pool.total_wait_ms / pool.checkouts, 2) if pool.checkouts else 0.0,
+            "p95_wait_ms": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 2) if waits else 0.0,
+            "max_wait_ms": round(pool.max_wait_ms, 2)
+        })
+    return stats
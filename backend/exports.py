@@ -0,0 +1,116 @@
+"""
+Table Exports
+Streams whole tables as CSV or NDJSON (optionally gzipped) for accounting.
+
+Rows come through a server-side cursor on the read engine and are encoded
+one batch at a time, so memory stays flat regardless of table size.
+"""
+import io
+import os
+import csv
+import json
+import zlib
+import asyncio
+import logging
+from datetime import date, datetime
+from sqlalchemy import select
+from .database import read_engine
+from .models import User, Account, Purchase, Deposit
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+# Each running export holds a read-pool connection for its whole duration
+MAX_CONCURRENT_EXPORTS = int(os.getenv("MAX_CONCURRENT_EXPORTS", "2"))
+
+# Secrets (session strings, 2FA passwords) are deliberately left out
+EXPORTS = {
+    "users": (User, [
+        User.id, User.telegram_id, User.username, User.full_name,
+        User.balance, User.total_spent, User.is_admin, User.created_at
+    ]),
+    "purchases": (Purchase, [
+        Purchase.id, Purchase.user_id, Purchase.account_id, Purchase.amount, Purchase.created_at
+    ]),
+    "deposits": (Deposit, [
+        Deposit.id, Deposit.user_id, Deposit.amount, Deposit.upi_ref_id, Deposit.status, Deposit.created_at
+    ]),
+    "stock": (Account, [
+        Account.id, Account.country_id, Account.phone_number, Account.type,
+        Account.is_sold, Account.session_status, Account.created_at
+    ]),
+}
+
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+export_slots = asyncio.Semaphore(MAX_CONCURRENT_EXPORTS)
+
+
+def export_stmt(table: str, created_from: datetime = None, created_to: datetime = None):
+    model, columns = EXPORTS[table]
+    stmt = select(*columns).order_by(model.id)
+    if created_from:
+        stmt = stmt.where(model.created_at >= created_from)
+    if created_to:
+        stmt = stmt.where(model.created_at < created_to)
+    return stmt
+
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _encode_csv(header, rows) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(header)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def _encode_ndjson(rows, keys) -> str:
+    return "".join(
+        json.dumps({key: _json_value(value) for key, value in zip(keys, row)}, ensure_ascii=False) + "\n"
+        for row in rows
+    )
+
+
+async def stream_export(stmt, fmt: str, gzip: bool = False):
+    """Async generator of encoded (and optionally gzipped) chunks"""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if gzip else None
+    keys = [column.key for column in stmt.selected_columns]
+    exported = 0
+
+    # Taken inside the generator so a response that never starts cannot leak a slot
+    async with export_slots:
+        async with read_engine.connect() as conn:
+            result = await conn.stream(stmt.execution_options(yield_per=BATCH_SIZE))
+            first = True
+            async for rows in result.partitions(BATCH_SIZE):
+                if fmt == "csv":
+                    chunk = _encode_csv(keys if first else None, rows)
+                else:
+                    chunk = _encode_ndjson(rows, keys)
+                first = False
+                exported += len(rows)
+
+                data = chunk.encode()
+                if compressor:
+                    data = compressor.compress(data)
+                if data:
+                    yield data
+
+            if first and fmt == "csv":
+                # Empty table still gets a header row
+                data = _encode_csv(keys, []).encode()
+                yield compressor.compress(data) if compressor else data
+
+    if compressor:
+        yield compressor.flush()
+    logger.info(f"📤 Export finished: {exported} rows ({fmt}{', gzip' if gzip else ''})")
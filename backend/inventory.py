@@ -0,0 +1,219 @@
+"""
+Stock Allocation & Counters
+Claims unsold accounts for buyers without races or retry loops, and keeps
+the per-country stock counters (country_stock) in step with inventory
+"""
+import logging
+from sqlalchemy import select, update, insert, delete, func, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+from .models import User, Country, Account, AccountSecret, AccountArchive, Purchase, CountryStock
+from . import wallet
+
+logger = logging.getLogger(__name__)
+
+
+# --- Stock Counters ---
+
+def upsert_insert(session):
+    """Dialect-specific INSERT that supports ON CONFLICT"""
+    if session.bind.dialect.name == "postgresql":
+        return postgresql.insert
+    return sqlite.insert
+
+
+async def adjust_stock(session, deltas: dict):
+    """
+    Apply counter changes in the caller's transaction (does not commit).
+
+    Args:
+        deltas: {(country_id, account_type): change} e.g. {(3, "ID"): -1}
+    """
+    rows = [
+        {"country_id": country_id, "type": account_type, "available": delta}
+        for (country_id, account_type), delta in deltas.items()
+        if delta
+    ]
+    if not rows:
+        return
+
+    stmt = upsert_insert(session)(CountryStock)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CountryStock.country_id, CountryStock.type],
+        set_={"available": CountryStock.available + stmt.excluded.available}
+    )
+    await session.execute(stmt, rows)
+
+
+async def rebuild_country_stock(session):
+    """Recount every counter from the accounts table (one GROUP BY) and commit"""
+    counts = await session.execute(
+        select(Account.country_id, Account.type, func.count(Account.id))
+        .where(Account.is_sold == False, Account.country_id.is_not(None))
+        .group_by(Account.country_id, Account.type)
+    )
+    rows = [
+        {"country_id": country_id, "type": account_type, "available": available}
+        for country_id, account_type, available in counts.all()
+    ]
+
+    await session.execute(delete(CountryStock))
+    if rows:
+        await session.execute(insert(CountryStock), rows)
+    await session.commit()
+    logger.info(f"📦 Rebuilt country_stock ({len(rows)} counters)")
+
+
+def countries_in_stock_stmt(account_type: str = "ID"):
+    """Countries that currently have stock of a type - reads O(countries) rows"""
+    return (
+        select(
+            Country.id,
+            Country.name,
+            Country.emoji,
+            Country.price,
+            CountryStock.available.label("stock")
+        )
+        .join(CountryStock, CountryStock.country_id == Country.id)
+        .where(CountryStock.type == account_type, CountryStock.available > 0)
+        .order_by(Country.name)
+    )
+
+
+async def get_stock(session, country_id: int, account_type: str = "ID") -> int:
+    """Available count for one country/type (primary-key lookup)"""
+    result = await session.execute(
+        select(CountryStock.available).where(
+            CountryStock.country_id == country_id,
+            CountryStock.type == account_type
+        )
+    )
+    return max(result.scalar_one_or_none() or 0, 0)
+
+
+# --- Sold Accounts ---
+
+def purchased_account_stmt(account_id: int, with_secret: bool = False):
+    """
+    Look up a bought account whether it is still in accounts or was moved to
+    accounts_archive. Rows expose id, country_id, phone_number, type and
+    twofa_password, plus session_data when with_secret=True.
+    """
+    live_columns = [Account.id, Account.country_id, Account.phone_number, Account.type, Account.twofa_password]
+    cold_columns = [
+        AccountArchive.id, AccountArchive.country_id, AccountArchive.phone_number,
+        AccountArchive.type, AccountArchive.twofa_password
+    ]
+    live = select(*live_columns).where(Account.id == account_id)
+    cold = select(*cold_columns).where(AccountArchive.id == account_id)
+    if with_secret:
+        live = live.add_columns(AccountSecret.session_data).outerjoin(
+            AccountSecret, AccountSecret.account_id == Account.id
+        )
+        cold = cold.add_columns(AccountArchive.session_data)
+    return union_all(live, cold)
+
+
+# --- Allocation ---
+
+
+def claim_account_stmt(country_id: int, account_type: str = "ID"):
+    """
+    Build the UPDATE that claims one unsold account and returns it.
+
+    On Postgres the candidate row is picked with FOR UPDATE SKIP LOCKED, so
+    concurrent buyers each lock a different row instead of queueing on the
+    same one. SQLite ignores the locking clause; there the single-writer lock
+    plus the is_sold guard in the UPDATE makes the claim atomic.
+    """
+    candidate = (
+        select(Account.id)
+        .where(
+            Account.country_id == country_id,
+            Account.is_sold == False,
+            Account.type == account_type
+        )
+        .order_by(Account.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    # The secret is read in the same round trip, only for the account being delivered
+    session_data = (
+        select(AccountSecret.session_data)
+        .where(AccountSecret.account_id == Account.id)
+        .scalar_subquery()
+        .label("session_data")
+    )
+    return (
+        update(Account)
+        .where(Account.id == candidate, Account.is_sold == False)
+        .values(is_sold=True)
+        .returning(Account.id, Account.phone_number, Account.twofa_password, session_data)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def _purchase_failed(session, user_id: int, status: str) -> dict:
+    await session.rollback()
+    balance = await session.scalar(select(User.balance).where(User.id == user_id))
+    return {"success": False, "status": status, "balance": balance or 0.0}
+
+
+async def purchase_account(session, user_id: int, country_id: int, price: float, account_type: str = "ID") -> dict:
+    """
+    Debit the buyer, claim an account and record the Purchase (plus its
+    ledger entry) in one transaction.
+
+    Returns:
+        {"success": True, "account": row, "purchase_id": int, "new_balance": float}
+        or {"success": False, "status": "INSUFFICIENT_BALANCE" | "OUT_OF_STOCK", "balance": float}
+
+    Nothing is written unless all three steps succeed. A failure rolls the
+    session back, which expires ORM objects the caller loaded from it; read
+    what the failure message needs before calling, or use "balance".
+    """
+    try:
+        # Conditional debit - fails instead of going negative; also bumps total_spent
+        new_balance = await wallet.change_balance(session, user_id, -price, count_as_spent=True)
+        if new_balance is None:
+            return await _purchase_failed(session, user_id, "INSUFFICIENT_BALANCE")
+
+        claim_res = await session.execute(claim_account_stmt(country_id, account_type))
+        account = claim_res.one_or_none()
+        if account is None:
+            return await _purchase_failed(session, user_id, "OUT_OF_STOCK")
+
+        purchase_res = await session.execute(
+            insert(Purchase)
+            .values(user_id=user_id, account_id=account.id, amount=price)
+            .returning(Purchase.id)
+        )
+        purchase_id = purchase_res.scalar_one()
+
+        await adjust_stock(session, {(country_id, account_type): -1})
+
+        await wallet.record_transaction(
+            session, user_id, wallet.PURCHASE, -price, new_balance, reference_id=purchase_id
+        )
+
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+
+    return {
+        "success": True,
+        "account": account,
+        "purchase_id": purchase_id,
+        "new_balance": new_balance
+    }
+
+
+# --- Leaderboard ---
+
+async def get_buyer_rank(session, total_spent: float) -> int:
+    """1 + number of users who spent more (range scan on ix_users_total_spent)"""
+    ahead = await session.scalar(
+        select(func.count(User.id)).where(User.total_spent > (total_spent or 0))
+    )
+    return ahead + 1
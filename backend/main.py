@@ -1,19 +1,37 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, BackgroundTasks, Depends, HTTPException, Request, Response, status
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from .database import init_db, async_session
+from .database import init_db, async_session, async_read_session, engine, read_engine, POOLER_MODE
 from .bot import bot, dp
-from .models import User, Country, Account, Purchase, Deposit, Settings
+from .models import User, Country, Account, AccountSecret, Purchase, Deposit, Settings, BalanceTransaction, CountryStock, digits_only
+from . import wallet
+from . import db_metrics
+from .inventory import adjust_stock, rebuild_country_stock
+from .archiver import AccountArchiver
+from .rollups import RollupJob, get_timeseries
+from .settings_cache import bump_settings_version
+from .search import admin_search, digits_prefix_range, name_prefix
+from .stats import stats_snapshot
+from .bulk_import import BulkImporter
+from .update_queue import UpdateQueue
+from .update_dedup import update_dedup
+from .webhook_reply import WebhookReplies
+from .exports import EXPORTS, FORMATS, export_slots, export_stmt, stream_export
+from .pagination import DEFAULT_PAGE_SIZE, keyset_page, resolve_sort, set_page_headers
 from aiogram.types import Update
 from .session_manager import get_session_manager
 from .session_generator_service import get_session_generator
-from sqlalchemy import select, update, delete
-from pydantic import BaseModel
-from typing import List, Optional
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.orm import joinedload
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Annotated, Dict, List, Literal, Optional, Union
 import asyncio
 import os
+import re
+import threading
+from datetime import date, datetime, timedelta
 from fastapi import UploadFile, File, Form
 import aiohttp # For webhook setup in startup event
 import logging
@@ -37,6 +55,10 @@ class AccountCreate(BaseModel):
 class DepositUpdate(BaseModel):
     status: str # APPROVED, REJECTED
 
+class DepositBatchUpdate(BaseModel):
+    ids: List[int]
+    status: str # APPROVED, REJECTED
+
 class LoginRequest(BaseModel):
     password: str
 
@@ -44,6 +66,152 @@ class BalanceAdjustment(BaseModel):
     amount: float
     reason: str  # "admin_add" or "admin_deduct"
 
+# --- Response Schemas ---
+# Explicit fields: secrets (session strings) can never leak through an ORM object,
+# and pydantic-core serializes lists far faster than jsonable_encoder
+class ORMModel(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+class CountryOut(ORMModel):
+    id: int
+    name: Optional[str] = None
+    emoji: Optional[str] = None
+    price: Optional[float] = None
+
+class AccountOut(ORMModel):
+    id: int
+    country_id: Optional[int] = None
+    phone_number: Optional[str] = None
+    is_sold: Optional[bool] = None
+    type: Optional[str] = None
+    created_at: Optional[datetime] = None
+    twofa_password: Optional[str] = None
+    session_status: Optional[str] = None
+    last_health_check: Optional[datetime] = None
+    health_check_message: Optional[str] = None
+
+class UserOut(ORMModel):
+    id: int
+    telegram_id: Optional[int] = None
+    username: Optional[str] = None
+    full_name: Optional[str] = None
+    balance: Optional[float] = None
+    total_spent: Optional[float] = None
+    is_admin: Optional[bool] = None
+    created_at: Optional[datetime] = None
+
+class PurchaseOut(ORMModel):
+    id: int
+    user_id: Optional[int] = None
+    account_id: Optional[int] = None
+    amount: Optional[float] = None
+    created_at: Optional[datetime] = None
+
+class DepositOut(ORMModel):
+    id: int
+    user_id: Optional[int] = None
+    amount: Optional[float] = None
+    upi_ref_id: Optional[str] = None
+    screenshot_path: Optional[str] = None
+    status: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+class DepositUserOut(ORMModel):
+    id: int
+    telegram_id: Optional[int] = None
+    username: Optional[str] = None
+    full_name: Optional[str] = None
+
+class DepositWithUserOut(ORMModel):
+    id: int
+    amount: Optional[float] = None
+    upi_ref_id: Optional[str] = None
+    screenshot_path: Optional[str] = None
+    status: Optional[str] = None
+    created_at: Optional[datetime] = None
+    user: Optional[DepositUserOut] = None
+
+class BalanceTransactionOut(ORMModel):
+    id: int
+    user_id: Optional[int] = None
+    type: Optional[str] = None
+    amount: Optional[float] = None
+    balance_after: Optional[float] = None
+    reference_id: Optional[int] = None
+    note: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+class CountryStockOut(ORMModel):
+    country_id: int
+    type: str
+    available: int
+
+class BalanceAdjustmentOut(BaseModel):
+    status: str
+    user: UserOut
+    new_balance: float
+
+class DepositBatchItemOut(BaseModel):
+    id: int
+    user_id: Optional[int] = None
+    amount: Optional[float] = None
+    status: str
+
+class DepositBatchOut(BaseModel):
+    status: str
+    updated: int
+    skipped: List[int]
+    deposits: List[DepositBatchItemOut]
+
+class UserSearchHitOut(BaseModel):
+    kind: Literal["user"]
+    id: int
+    score: float
+    title: str
+    subtitle: str
+    telegram_id: Optional[int] = None
+    username: Optional[str] = None
+    full_name: Optional[str] = None
+    balance: Optional[float] = None
+
+class AccountSearchHitOut(BaseModel):
+    kind: Literal["account"]
+    id: int
+    score: float
+    title: Optional[str] = None
+    subtitle: str
+    country_id: Optional[int] = None
+    is_sold: Optional[bool] = None
+    type: Optional[str] = None
+
+SearchHitOut = Annotated[Union[UserSearchHitOut, AccountSearchHitOut], Field(discriminator="kind")]
+
+class StockEntryOut(BaseModel):
+    country_id: int
+    name: Optional[str] = None
+    emoji: Optional[str] = None
+    available: int
+    by_type: Dict[str, int]
+
+class AdminStatsOut(BaseModel):
+    total_users: int
+    total_sales: float
+    pending_deposits: int
+    today_sales: int
+    today_revenue: float
+    total_available: int
+    stock: List[StockEntryOut]
+    generated_at: str
+
+class UserDetailsOut(BaseModel):
+    user: UserOut
+    purchases: List[PurchaseOut]
+    deposits: List[DepositOut]
+    purchases_total: Optional[int] = None
+    deposits_total: Optional[int] = None
+    purchases_next_cursor: Optional[str] = None
+    deposits_next_cursor: Optional[str] = None
+
 # Webhook Configuration
 WEBHOOK_PATH = "/webhook"
 # BASE_URL from env var (for Railway/Render), default to actual Koyeb URL if missing
@@ -54,6 +222,20 @@ BASE_WEBHOOK_URL = os.getenv("BASE_WEBHOOK_URL", "https://shallow-reggie-telegra
 async def lifespan(app: FastAPI):
     # Initialize DB
     await init_db()
+
+    # Move old sold accounts out of the hot table in the background
+    archiver = AccountArchiver(
+        min_age_days=int(os.getenv("ARCHIVE_SOLD_AFTER_DAYS", "30")),
+        check_interval=int(os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600"))
+    )
+    archiver_task = asyncio.create_task(archiver.start())
+
+    # Workers that run bot handlers for queued webhook updates
+    await update_queue.start()
+
+    # Fold new purchases / deposit approvals into the daily rollups
+    rollup_job = RollupJob(check_interval=int(os.getenv("ROLLUP_INTERVAL_SECONDS", "60")))
+    rollup_task = asyncio.create_task(rollup_job.start())
     
     # Set Webhook on Startup with error handling
     try:
@@ -82,6 +264,12 @@ async def lifespan(app: FastAPI):
         print(f"   Bot will continue but webhook may not work!", flush=True)
     
     yield
+
+    archiver.stop()
+    archiver_task.cancel()
+    rollup_job.stop()
+    rollup_task.cancel()
+    await update_queue.stop()
     
     # Delete Webhook on Shutdown
     try:
@@ -90,7 +278,7 @@ async def lifespan(app: FastAPI):
         pass
     await bot.session.close()
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 @app.on_event("startup")
 async def startup_event():
@@ -216,16 +404,87 @@ async def health_check():
 
 # === CRITICAL: WEBHOOK ENDPOINT ===
 
+# Opt-in: the webhook response carries a handler's first eligible Bot API call (see backend/webhook_reply.py)
+webhook_replies = None
+if os.getenv("WEBHOOK_REPLY", "0") == "1":
+    webhook_replies = WebhookReplies(wait_seconds=float(os.getenv("WEBHOOK_REPLY_WAIT_SECONDS", "2")))
+    bot.session.middleware(webhook_replies)
+
+async def process_update(telegram_update: Update):
+    if webhook_replies is None:
+        await dp.feed_update(bot=bot, update=telegram_update)
+        return
+    with webhook_replies.handling(telegram_update.update_id):
+        await dp.feed_update(bot=bot, update=telegram_update)
+
+def parse_update(body: bytes) -> Update:
+    """Validate the raw webhook body straight into an Update (no intermediate dict)"""
+    return Update.model_validate_json(body, context={"bot": bot})
+
+# Webhook requests only enqueue; handlers run on these workers (see backend/update_queue.py)
+update_queue = UpdateQueue(
+    process_update,
+    workers=int(os.getenv("UPDATE_WORKERS", "16")),
+    max_pending=int(os.getenv("UPDATE_QUEUE_SIZE", "1000"))
+)
+
+# Opt-in capture of raw update bodies, the corpus for benchmark_webhook_parsing.py
+# (contains user messages: point it outside the repo and remove it after use)
+WEBHOOK_RECORD_FILE = os.getenv("WEBHOOK_RECORD_FILE")
+_record_lock = threading.Lock()
+
+def record_update(body: bytes):
+    """Append one update; runs in a worker thread so file I/O stays off the event loop"""
+    try:
+        with _record_lock, open(WEBHOOK_RECORD_FILE, "ab") as f:
+            # Raw newlines can only be insignificant JSON whitespace; keep one update per line
+            f.write(body.replace(b"\r", b"").replace(b"\n", b"") + b"\n")
+    except OSError as e:
+        logger.warning(f"⚠️ Could not record update: {e}")
+
 @app.post(WEBHOOK_PATH)
-async def webhook_handler(update: dict):
-    """Receive and process Telegram updates"""
+async def webhook_handler(request: Request):
+    """Receive Telegram updates and acknowledge as soon as they are queued (or carry the handler's first call in reply mode)"""
+    body = await request.body()
     try:
-        telegram_update = Update(**update)
-        await dp.feed_update(bot=bot, update=telegram_update)
-        return {"ok": True}
+        telegram_update = parse_update(body)
     except Exception as e:
+        # Malformed update: retrying will not help, so acknowledge it
         logger.error(f"Webhook error: {e}", exc_info=True)
         return {"ok": False}
+    if WEBHOOK_RECORD_FILE:
+        await asyncio.to_thread(record_update, body)
+
+    if await update_dedup.is_duplicate(telegram_update.update_id):
+        # Redelivery of an update we already accepted (handler outlived Telegram's timeout)
+        logger.info(f"🔁 Dropping duplicate update {telegram_update.update_id}")
+        return {"ok": True}
+
+    if webhook_replies:
+        webhook_replies.open(telegram_update.update_id)
+
+    if not update_queue.put(telegram_update):
+        # Non-2xx makes Telegram redeliver later instead of us dropping it
+        logger.warning(f"⚠️ Update queue full, refusing update {telegram_update.update_id}")
+        await update_dedup.release(telegram_update.update_id)
+        if webhook_replies:
+            webhook_replies.discard(telegram_update.update_id)
+        return ORJSONResponse({"ok": False, "detail": "Update queue full"}, status_code=503)
+
+    if webhook_replies:
+        body = await webhook_replies.wait(telegram_update.update_id)
+        if body:
+            return Response(content=body, media_type="application/x-www-form-urlencoded")
+    return {"ok": True}
+
+@app.get("/admin/webhook/queue")
+async def get_update_queue_stats():
+    return {
+        **update_queue.snapshot(),
+        "duplicates": update_dedup.duplicates,
+        "dedup_shared": update_dedup.use_db,
+        "replies": webhook_replies.snapshot() if webhook_replies else None
+    }
 
 
 @app.post("/api/fix-webhook")
@@ -334,6 +593,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count"],  # Keyset paging metadata
 )
 
 # Add timeout middleware for request protection
@@ -376,24 +636,47 @@ class TimeoutMiddleware(BaseHTTPMiddleware):
 app.add_middleware(TimeoutMiddleware)
 
 
-# Webhook Handler
-from aiogram.types import Update
+class QuerySourceMiddleware(BaseHTTPMiddleware):
+    """Tags SQL issued while serving a request with its route (see db_metrics)"""
+    async def dispatch(self, request: Request, call_next):
+        path = re.sub(r"/\d+", "/{id}", request.url.path)
+        token = db_metrics.current_source.set(f"http:{request.method} {path}")
+        try:
+            return await call_next(request)
+        finally:
+            db_metrics.current_source.reset(token)
+
+app.add_middleware(QuerySourceMiddleware)
+
+# Compress large admin payloads (lists, exports); small responses pass through untouched
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder
+
+# Bodies that are compressed files already (e.g. /admin/export?gzip=true)
+PRECOMPRESSED_TYPES = {"application/gzip", "application/zip"}
+
+
+class SkipCompressedGZipResponder(GZipResponder):
+    async def send_with_gzip(self, message):
+        await super().send_with_gzip(message)
+        if message["type"] == "http.response.start":
+            content_type = Headers(raw=message["headers"]).get("content-type", "")
+            if content_type.split(";")[0].strip() in PRECOMPRESSED_TYPES:
+                # Same pass-through Starlette uses when Content-Encoding is already set
+                self.content_encoding_set = True
+
+
+class SkipCompressedGZipMiddleware(GZipMiddleware):
+    """GZip that leaves already-compressed bodies alone instead of gzipping them twice"""
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and "gzip" in Headers(scope=scope).get("Accept-Encoding", ""):
+            responder = SkipCompressedGZipResponder(self.app, self.minimum_size, compresslevel=self.compresslevel)
+            await responder(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+app.add_middleware(SkipCompressedGZipMiddleware, minimum_size=int(os.getenv("GZIP_MIN_BYTES", "1024")))
 
-@app.post(WEBHOOK_PATH)
-@app.post(WEBHOOK_PATH)
-async def bot_webhook(update: dict):
-    """
-    Handler for Telegram Webhook updates
-    """
-    print(f"📥 Received Webhook Update: {update}")
-    try:
-        # Convert dict to aiogram Update object manually to debug validation errors
-        aiogram_update = Update(**update)
-        return await dp.feed_update(bot, aiogram_update)
-    except Exception as e:
-        print(f"❌ Error processing webhook: {e}")
-        # Return 200 OK anyway to stop Telegram from retrying endlessly
-        return {"status": "error", "message": str(e)}
 
 # Add CORS middleware to allow frontend dev server
 app.add_middleware(
@@ -402,6 +685,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count"],  # Keyset paging metadata
 )
 
 # Admin API and Frontend serving below
@@ -417,13 +701,13 @@ async def admin_login(req: LoginRequest):
 
 # --- Admin API Routes ---
 
-@app.get("/admin/countries")
+@app.get("/admin/countries", response_model=List[CountryOut])
 async def get_countries():
     async with async_session() as session:
         result = await session.execute(select(Country))
         return result.scalars().all()
 
-@app.post("/admin/countries")
+@app.post("/admin/countries", response_model=CountryOut)
 async def create_country(country: CountryCreate):
     async with async_session() as session:
         db_country = Country(**country.model_dump())
@@ -434,17 +718,77 @@ async def create_country(country: CountryCreate):
 @app.delete("/admin/countries/{country_id}")
 async def delete_country(country_id: int):
     async with async_session() as session:
+        await session.execute(delete(CountryStock).where(CountryStock.country_id == country_id))
         await session.execute(delete(Country).where(Country.id == country_id))
         await session.commit()
         return {"message": "Country deleted"}
 
-@app.get("/admin/accounts")
-async def get_accounts():
-    async with async_session() as session:
-        result = await session.execute(select(Account))
-        return result.scalars().all()
-
-@app.post("/admin/accounts")
+@app.get("/admin/accounts", response_model=List[AccountOut])
+async def get_accounts(
+    response: Response,
+    country_id: Optional[int] = None,
+    is_sold: Optional[bool] = None,
+    type: Optional[str] = None,
+    phone: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    sort: str = "id",
+    order: str = "desc",
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE
+):
+    """Keyset-paginated inventory; cursor/total in X-Next-Cursor / X-Total-Count"""
+    sort_col = resolve_sort(sort, {"id": Account.id, "created_at": Account.created_at})
+    stmt = select(Account)
+    if country_id is not None:
+        stmt = stmt.where(Account.country_id == country_id)
+    if is_sold is not None:
+        stmt = stmt.where(Account.is_sold == is_sold)
+    if type:
+        stmt = stmt.where(Account.type == type)
+    if phone and digits_only(phone):
+        stmt = stmt.where(digits_prefix_range(Account.phone_digits, digits_only(phone)))
+    if created_from:
+        stmt = stmt.where(Account.created_at >= created_from)
+    if created_to:
+        stmt = stmt.where(Account.created_at < created_to)
+
+    async with async_read_session() as session:
+        items, next_cursor, total = await keyset_page(
+            session, stmt, sort_col, Account.id, cursor, limit, descending=(order != "asc")
+        )
+    set_page_headers(response, next_cursor, total)
+    return items
+
+@app.get("/admin/search", response_model=List[SearchHitOut])
+async def search_admin(q: str, limit: int = 20):
+    """Ranked users and accounts for the admin search box"""
+    async with async_read_session() as session:
+        return await admin_search(session, q, max(1, min(limit, 50)))
+
+@app.get("/admin/accounts/summary")
+async def get_accounts_summary():
+    """Per-country available/sold counts from the stock counters plus one indexed GROUP BY"""
+    async with async_read_session() as session:
+        totals = await session.execute(
+            select(Account.country_id, func.count(Account.id)).group_by(Account.country_id)
+        )
+        available = await session.execute(
+            select(CountryStock.country_id, func.sum(CountryStock.available)).group_by(CountryStock.country_id)
+        )
+    available_by_country = {cid: max(int(n or 0), 0) for cid, n in available.all()}
+    by_country = []
+    for cid, total in totals.all():
+        avail = available_by_country.get(cid, 0)
+        by_country.append({"country_id": cid, "total": total, "available": avail, "sold": total - avail})
+    return {
+        "total": sum(c["total"] for c in by_country),
+        "available": sum(c["available"] for c in by_country),
+        "sold": sum(c["sold"] for c in by_country),
+        "by_country": by_country
+    }
+
+@app.post("/admin/accounts", response_model=AccountOut)
 async def add_account(account: AccountCreate):
     async with async_session() as session:
         # REMOVED duplicate check - allows restocking same number after sold
@@ -458,33 +802,102 @@ async def add_account(account: AccountCreate):
             is_sold=False  # Explicitly ensure new accounts are available
         )
         session.add(db_account)
+        await adjust_stock(session, {(account.country_id, account.type): 1})
         await session.commit()
         await session.refresh(db_account)
         return db_account
 
-@app.get("/admin/stats")
-async def get_admin_stats():
+@app.post("/admin/accounts/import")
+async def import_accounts(
+    file: UploadFile = File(...),
+    format: Optional[str] = Form(None),
+    type: str = Form("ID")
+):
+    """Bulk-load accounts from CSV/JSONL (country, phone, session, twofa[, type]) with a per-row report"""
+    fmt = format or ("jsonl" if (file.filename or "").lower().endswith((".jsonl", ".ndjson", ".json")) else "csv")
+    if fmt not in ("csv", "jsonl"):
+        raise HTTPException(status_code=400, detail="format must be csv or jsonl")
+    return await BulkImporter(default_type=type).run(file.file, fmt)
+
+@app.delete("/admin/accounts/{account_id}")
+async def delete_account(account_id: int):
     async with async_session() as session:
-        # Total Users
-        users_stmt = select(User)
-        users_res = await session.execute(users_stmt)
-        total_users = len(users_res.scalars().all())
-        
-        # Total Sales (sum of all purchases)
-        purchases_stmt = select(Purchase.amount)
-        purchases_res = await session.execute(purchases_stmt)
-        total_sales = sum(purchases_res.scalars().all())
-        
-        # Pending Deposits
-        pending_stmt = select(Deposit).where(Deposit.status == "PENDING")
-        pending_res = await session.execute(pending_stmt)
-        pending_deposits = len(pending_res.scalars().all())
-        
-        return {
-            "total_users": total_users,
-            "total_sales": total_sales,
-            "pending_deposits": pending_deposits
-        }
+        # Row lock so a concurrent purchase cannot sell it between the check and the delete
+        account = (await session.execute(
+            select(Account.country_id, Account.type, Account.is_sold)
+            .where(Account.id == account_id)
+            .with_for_update()
+        )).one_or_none()
+        if not account:
+            raise HTTPException(status_code=404, detail="Account not found")
+        if account.is_sold:
+            # Buyers still need it for delivery, OTPs and their purchase history
+            raise HTTPException(status_code=409, detail="Sold accounts cannot be deleted")
+
+        await session.execute(delete(AccountSecret).where(AccountSecret.account_id == account_id))
+        await session.execute(delete(Account).where(Account.id == account_id))
+        await adjust_stock(session, {(account.country_id, account.type): -1})
+        await session.commit()
+        return {"message": "Account deleted"}
+
+@app.post("/admin/stock/rebuild", response_model=List[CountryStockOut])
+async def rebuild_stock():
+    """Recount country_stock from the accounts table (repairs drift)"""
+    async with async_session() as session:
+        await rebuild_country_stock(session)
+        result = await session.execute(select(CountryStock))
+        return result.scalars().all()
+
+@app.get("/admin/stats", response_model=AdminStatsOut)
+async def get_admin_stats():
+    # Shared snapshot: rebuilt at most once per STATS_CACHE_SECONDS across all viewers
+    return await stats_snapshot.get()
+
+@app.get("/admin/export/{table}")
+async def export_table(
+    table: str,
+    format: str = "csv",
+    gzip: bool = False,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None
+):
+    """Stream a whole table as CSV/NDJSON through a server-side cursor"""
+    if table not in EXPORTS:
+        raise HTTPException(status_code=404, detail=f"Unknown export, expected one of: {', '.join(EXPORTS)}")
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(FORMATS)}")
+    if export_slots.locked():
+        raise HTTPException(status_code=429, detail="Too many exports running, try again shortly")
+
+    filename = f"{table}-{datetime.utcnow():%Y%m%d-%H%M%S}.{format}"
+    media_type = FORMATS[format]
+    if gzip:
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        stream_export(export_stmt(table, created_from, created_to), format, gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+MAX_TIMESERIES_DAYS = 366
+
+@app.get("/admin/timeseries")
+async def get_admin_timeseries(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    country_id: Optional[int] = None,
+    type: Optional[str] = None
+):
+    """Daily units/revenue/deposit approvals from the rollup tables (default: last 30 days)"""
+    end = end or datetime.utcnow().date()
+    start = start or end - timedelta(days=29)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must be on or before end")
+    if (end - start).days >= MAX_TIMESERIES_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range is limited to {MAX_TIMESERIES_DAYS} days")
+    async with async_read_session() as session:
+        return await get_timeseries(session, start, end, country_id, type)
 
 @app.get("/admin/settings/payment")
 async def get_payment_settings():
@@ -561,18 +974,149 @@ async def update_payment_settings(
             else:
                 session.add(Settings(key="payment_qr_image", value=data_uri))
         
+        await bump_settings_version(session)
         await session.commit()
         return {"status": "success"}
 
-@app.get("/admin/deposits")
-async def get_deposits():
+USER_HISTORY_PAGE_SIZE = 50
+DEPOSIT_SORTS = {"created_at": Deposit.created_at, "amount": Deposit.amount, "id": Deposit.id}
+
+def deposits_filter_stmt(status: Optional[str], user_id: Optional[int],
+                         created_from: Optional[datetime], created_to: Optional[datetime]):
+    stmt = select(Deposit)
+    if status:
+        stmt = stmt.where(Deposit.status == status.upper())
+    if user_id is not None:
+        stmt = stmt.where(Deposit.user_id == user_id)
+    if created_from:
+        stmt = stmt.where(Deposit.created_at >= created_from)
+    if created_to:
+        stmt = stmt.where(Deposit.created_at < created_to)
+    return stmt
+
+@app.get("/admin/deposits", response_model=List[DepositOut])
+async def get_deposits(
+    response: Response,
+    status: Optional[str] = None,
+    user_id: Optional[int] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    sort: str = "created_at",
+    order: str = "desc",
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE
+):
+    async with async_read_session() as session:
+        items, next_cursor, total = await keyset_page(
+            session, deposits_filter_stmt(status, user_id, created_from, created_to),
+            resolve_sort(sort, DEPOSIT_SORTS), Deposit.id, cursor, limit, descending=(order != "asc")
+        )
+    set_page_headers(response, next_cursor, total)
+    return items
+
+@app.get("/admin/deposits/{deposit_id:int}", response_model=DepositWithUserOut)
+async def get_deposit(deposit_id: int):
+    async with async_read_session() as session:
+        result = await session.execute(
+            select(Deposit).options(joinedload(Deposit.user)).where(Deposit.id == deposit_id)
+        )
+        deposit = result.scalar_one_or_none()
+        if not deposit:
+            raise HTTPException(status_code=404, detail="Deposit not found")
+        return deposit
+
+
+
+MAX_DEPOSIT_BATCH = 500
+NOTIFY_INTERVAL_SECONDS = 0.05  # Stay under Telegram's ~30 messages/second
+
+async def send_deposit_notifications(notifications: list):
+    """Runs after the response: [(telegram_id, text, reply_markup), ...], paced for Telegram"""
+    sent = 0
+    for telegram_id, text, reply_markup in notifications:
+        try:
+            await bot.send_message(telegram_id, text, parse_mode="HTML", reply_markup=reply_markup)
+            sent += 1
+        except Exception as e:
+            logger.warning(f"⚠️ Deposit notification to {telegram_id} failed: {e}")
+        await asyncio.sleep(NOTIFY_INTERVAL_SECONDS)
+    logger.info(f"📨 Sent {sent}/{len(notifications)} deposit notifications")
+
+def contact_owner_markup():
+    from aiogram.types import InlineKeyboardButton
+    from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+    builder = InlineKeyboardBuilder()
+    builder.row(InlineKeyboardButton(text="📞 Contact Owner", url="https://t.me/akhilportal"))
+    return builder.as_markup()
+
+@app.post("/admin/deposits/batch", response_model=DepositBatchOut)
+async def update_deposits_batch(update_data: DepositBatchUpdate, background_tasks: BackgroundTasks):
+    """
+    Approve or reject many PENDING deposits in one transaction; user
+    notifications are sent after the response
+    """
+    new_status = update_data.status.upper()
+    if new_status not in ("APPROVED", "REJECTED"):
+        raise HTTPException(status_code=400, detail="status must be APPROVED or REJECTED")
+    ids = sorted(set(update_data.ids))
+    if not ids:
+        return {"status": "SUCCESS", "updated": 0, "skipped": [], "deposits": []}
+    if len(ids) > MAX_DEPOSIT_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_DEPOSIT_BATCH} deposits per batch")
+
     async with async_session() as session:
-        result = await session.execute(select(Deposit).order_by(Deposit.created_at.desc()))
-        return result.scalars().all()
+        # Only PENDING rows flip, so a repeated or overlapping batch cannot credit twice
+        result = await session.execute(
+            update(Deposit)
+            .where(Deposit.id.in_(ids), Deposit.status == "PENDING")
+            .values(status=new_status)
+            .returning(Deposit.id, Deposit.user_id, Deposit.amount)
+            .execution_options(synchronize_session=False)
+        )
+        changed = sorted(result.all())
 
+        balances = {}
+        if new_status == "APPROVED" and changed:
+            balances = await wallet.credit_many(
+                session, [(user_id, amount, deposit_id) for deposit_id, user_id, amount in changed], wallet.DEPOSIT
+            )
 
+        user_ids = {user_id for _, user_id, _ in changed}
+        telegram_ids = {}
+        if user_ids:
+            users_res = await session.execute(select(User.id, User.telegram_id).where(User.id.in_(user_ids)))
+            telegram_ids = dict(users_res.all())
+        await session.commit()
+    stats_snapshot.invalidate()
+
+    notifications = []
+    for deposit_id, user_id, amount in changed:
+        if user_id not in telegram_ids:
+            continue
+        if new_status == "APPROVED":
+            text = f"<i>✅ Your deposit of ₹{amount} has been approved! Your new balance is ₹{balances.get(user_id)}.</i>"
+            notifications.append((telegram_ids[user_id], text, None))
+        else:
+            text = (f"<i>❌ Your deposit of ₹{amount} was rejected.\n\n"
+                    "Please contact the owner if you think this is a mistake.</i>")
+            notifications.append((telegram_ids[user_id], text, contact_owner_markup()))
+    if notifications:
+        background_tasks.add_task(send_deposit_notifications, notifications)
+
+    changed_ids = {deposit_id for deposit_id, _, _ in changed}
+    logger.info(f"💳 Batch {new_status.lower()} {len(changed_ids)} deposits")
+    return {
+        "status": "SUCCESS",
+        "updated": len(changed_ids),
+        "skipped": [deposit_id for deposit_id in ids if deposit_id not in changed_ids],
+        "deposits": [
+            {"id": deposit_id, "user_id": user_id, "amount": amount, "status": new_status}
+            for deposit_id, user_id, amount in changed
+        ]
+    }
 
-@app.patch("/admin/deposits/{deposit_id}")
+@app.patch("/admin/deposits/{deposit_id}", response_model=DepositOut)
 async def update_deposit(deposit_id: int, update_data: DepositUpdate):
     async with async_session() as session:
         stmt = select(Deposit).where(Deposit.id == deposit_id)
@@ -582,51 +1126,63 @@ async def update_deposit(deposit_id: int, update_data: DepositUpdate):
         if not deposit:
             raise HTTPException(status_code=404, detail="Deposit not found")
         
-        deposit.status = update_data.status
-        
         if update_data.status == "APPROVED":
-            # Add balance to user
+            # Flip status only if not already approved, so a double click can't credit twice
+            approve_res = await session.execute(
+                update(Deposit)
+                .where(Deposit.id == deposit_id, Deposit.status != "APPROVED")
+                .values(status="APPROVED")
+                .returning(Deposit.id)
+            )
+            if approve_res.scalar_one_or_none() is None:
+                return deposit
+
+            # Add balance to user (SQL-side) and record it in the ledger
+            new_balance = await wallet.credit(
+                session, deposit.user_id, deposit.amount, wallet.DEPOSIT, reference_id=deposit.id
+            )
+            await session.commit()
+            stats_snapshot.invalidate()  # Pending count changed
+
             user_stmt = select(User).where(User.id == deposit.user_id)
             user_res = await session.execute(user_stmt)
             user = user_res.scalar_one_or_none()
             if user:
-                user.balance += deposit.amount
                 # Notify user via bot
                 try:
                     await bot.send_message(
                         user.telegram_id, 
-                        f"<i>✅ Your deposit of ₹{deposit.amount} has been approved! Your new balance is ₹{user.balance}.</i>",
+                        f"<i>✅ Your deposit of ₹{deposit.amount} has been approved! Your new balance is ₹{new_balance}.</i>",
                         parse_mode="HTML"
                     )
                 except:
                     pass
-        elif update_data.status == "REJECTED":
+            return deposit
+
+        deposit.status = update_data.status
+
+        if update_data.status == "REJECTED":
             # Notify user about rejection with Contact Owner button
             user_stmt = select(User).where(User.id == deposit.user_id)
             user_res = await session.execute(user_stmt)
             user = user_res.scalar_one_or_none()
             if user:
                 try:
-                    from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-                    from aiogram.utils.keyboard import InlineKeyboardBuilder
-                    
-                    builder = InlineKeyboardBuilder()
-                    builder.row(InlineKeyboardButton(text="📞 Contact Owner", url="https://t.me/akhilportal"))
-                    
                     await bot.send_message(
                         user.telegram_id,
                         f"<i>❌ Your deposit of ₹{deposit.amount} was rejected.\n\n"
                         "Please contact the owner if you think this is a mistake.</i>",
                         parse_mode="HTML",
-                        reply_markup=builder.as_markup()
+                        reply_markup=contact_owner_markup()
                     )
                 except:
                     pass
         
         await session.commit()
+        stats_snapshot.invalidate()
         return deposit
 
-@app.post("/admin/users/{user_id}/adjust-balance")
+@app.post("/admin/users/{user_id}/adjust-balance", response_model=BalanceAdjustmentOut)
 async def adjust_user_balance(user_id: int, adjustment: BalanceAdjustment):
     async with async_session() as session:
         # Get user
@@ -637,12 +1193,19 @@ async def adjust_user_balance(user_id: int, adjustment: BalanceAdjustment):
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
-        # Update balance
-        old_balance = user.balance
-        user.balance += adjustment.amount
-        new_balance = user.balance
+        # Update balance in SQL (debits can't go below zero) and record it in the ledger
+        if adjustment.amount >= 0:
+            new_balance = await wallet.credit(session, user.id, adjustment.amount, wallet.ADMIN_ADD, note=adjustment.reason)
+        else:
+            new_balance = await wallet.debit(session, user.id, adjustment.amount, wallet.ADMIN_DEDUCT, note=adjustment.reason)
+        
+        if new_balance is None:
+            await session.rollback()
+            raise HTTPException(status_code=400, detail="Insufficient balance for this deduction")
         
         await session.commit()
+        old_balance = new_balance - adjustment.amount
+        user.balance = new_balance
         
         # Send notification to user via bot
         try:
@@ -682,15 +1245,79 @@ async def adjust_user_balance(user_id: int, adjustment: BalanceAdjustment):
         return {"status": "success", "user": user, "new_balance": new_balance}
 
 
-@app.get("/admin/users")
-async def get_users():
-    async with async_session() as session:
-        result = await session.execute(select(User).order_by(User.created_at.desc()))
+@app.get("/admin/users/{user_id}/transactions", response_model=List[BalanceTransactionOut])
+async def get_user_transactions(user_id: int, limit: int = 100):
+    """Ledger entries for a user, newest first"""
+    async with async_read_session() as session:
+        stmt = (
+            select(BalanceTransaction)
+            .where(BalanceTransaction.user_id == user_id)
+            .order_by(BalanceTransaction.id.desc())
+            .limit(min(limit, 1000))
+        )
+        result = await session.execute(stmt)
         return result.scalars().all()
 
-@app.get("/admin/users/{user_id}")
+@app.get("/admin/db/stats")
+async def get_db_stats(limit: int = 20):
+    """Top SQL statements and callers by total time, plus recent slow queries"""
+    return db_metrics.snapshot(limit)
+
+@app.get("/admin/db/pool")
+async def get_db_pool_stats():
+    """Pool occupancy and checkout wait times for the primary and read engines"""
+    return {
+        "pooler_mode": POOLER_MODE,
+        "primary": db_metrics.pool_snapshot(engine),
+        "read": db_metrics.pool_snapshot(read_engine)
+    }
+
+@app.delete("/admin/db/stats")
+async def reset_db_stats():
+    db_metrics.reset()
+    return {"message": "DB stats reset"}
+
+@app.get("/admin/users", response_model=List[UserOut])
+async def get_users(
+    response: Response,
+    search: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    sort: str = "created_at",
+    order: str = "desc",
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE
+):
+    """Keyset-paginated users; search matches telegram id exactly or username/name prefix"""
+    sort_col = resolve_sort(sort, {
+        "created_at": User.created_at,
+        "balance": User.balance,
+        "total_spent": User.total_spent,
+        "id": User.id
+    })
+    stmt = select(User)
+    term = (search or "").strip().lstrip("@").lower()
+    if term.isdigit():
+        stmt = stmt.where(User.telegram_id == int(term))
+    elif term:
+        # Matches the lower(username) / lower(full_name) indexes; % and _ are literal
+        is_postgres = read_engine.dialect.name == "postgresql"
+        stmt = stmt.where(name_prefix(User.username, term, is_postgres) | name_prefix(User.full_name, term, is_postgres))
+    if created_from:
+        stmt = stmt.where(User.created_at >= created_from)
+    if created_to:
+        stmt = stmt.where(User.created_at < created_to)
+
+    async with async_read_session() as session:
+        items, next_cursor, total = await keyset_page(
+            session, stmt, sort_col, User.id, cursor, limit, descending=(order != "asc")
+        )
+    set_page_headers(response, next_cursor, total)
+    return items
+
+@app.get("/admin/users/{user_id}", response_model=UserDetailsOut)
 async def get_user_details(user_id: int):
-    async with async_session() as session:
+    async with async_read_session() as session:
         # Get user
         user_stmt = select(User).where(User.id == user_id)
         user_res = await session.execute(user_stmt)
@@ -698,29 +1325,53 @@ async def get_user_details(user_id: int):
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
-        # Get purchases
-        pur_stmt = select(Purchase).where(Purchase.user_id == user_id).order_by(Purchase.created_at.desc())
-        pur_res = await session.execute(pur_stmt)
-        purchases = pur_res.scalars().all()
-        
-        # Get deposits
-        dep_stmt = select(Deposit).where(Deposit.user_id == user_id).order_by(Deposit.created_at.desc())
-        dep_res = await session.execute(dep_stmt)
-        deposits = dep_res.scalars().all()
+        # Latest page of each history; older rows via /admin/users/{id}/purchases|deposits
+        purchases, purchases_cursor, purchases_total = await keyset_page(
+            session, select(Purchase).where(Purchase.user_id == user_id),
+            Purchase.created_at, Purchase.id, limit=USER_HISTORY_PAGE_SIZE
+        )
+        deposits, deposits_cursor, deposits_total = await keyset_page(
+            session, select(Deposit).where(Deposit.user_id == user_id),
+            Deposit.created_at, Deposit.id, limit=USER_HISTORY_PAGE_SIZE
+        )
         
         return {
             "user": user,
             "purchases": purchases,
-            "deposits": deposits
+            "deposits": deposits,
+            "purchases_total": purchases_total,
+            "deposits_total": deposits_total,
+            "purchases_next_cursor": purchases_cursor,
+            "deposits_next_cursor": deposits_cursor
         }
 
+@app.get("/admin/users/{user_id}/purchases", response_model=List[PurchaseOut])
+async def get_user_purchases(user_id: int, response: Response, cursor: Optional[str] = None, limit: int = USER_HISTORY_PAGE_SIZE):
+    async with async_read_session() as session:
+        items, next_cursor, total = await keyset_page(
+            session, select(Purchase).where(Purchase.user_id == user_id),
+            Purchase.created_at, Purchase.id, cursor, limit
+        )
+    set_page_headers(response, next_cursor, total)
+    return items
+
+@app.get("/admin/users/{user_id}/deposits", response_model=List[DepositOut])
+async def get_user_deposits(user_id: int, response: Response, cursor: Optional[str] = None, limit: int = USER_HISTORY_PAGE_SIZE):
+    async with async_read_session() as session:
+        items, next_cursor, total = await keyset_page(
+            session, select(Deposit).where(Deposit.user_id == user_id),
+            Deposit.created_at, Deposit.id, cursor, limit
+        )
+    set_page_headers(response, next_cursor, total)
+    return items
+
 # --- Session Testing & OTP Monitoring Endpoints ---
 
 @app.post("/admin/test-session/{account_id}")
 async def test_session(account_id: int):
     """Test if a Telegram session is still active"""
     async with async_session() as session:
-        stmt = select(Account).where(Account.id == account_id)
+        stmt = select(Account).options(joinedload(Account.secret)).where(Account.id == account_id)
         result = await session.execute(stmt)
         account = result.scalar_one_or_none()
         
@@ -764,7 +1415,7 @@ async def test_session(account_id: int):
 async def start_otp_monitoring(account_id: int):
     """Start listening for OTP codes on a specific account"""
     async with async_session() as session:
-        stmt = select(Account).where(Account.id == account_id)
+        stmt = select(Account).options(joinedload(Account.secret)).where(Account.id == account_id)
         result = await session.execute(stmt)
         account = result.scalar_one_or_none()
         
@@ -1025,6 +1676,7 @@ async def update_payment_settings(
                     # Don't crash full request if upload fails, but log it
                     pass
 
+            await bump_settings_version(session)
             await session.commit()
             return {"success": True, "message": "Settings updated successfully"}
             
@@ -1032,32 +1684,26 @@ async def update_payment_settings(
         print(f"Error updating settings: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/admin/deposits/enhanced")
-async def get_deposits_enhanced():
-    async with async_session() as session:
+@app.get("/admin/deposits/enhanced", response_model=List[DepositWithUserOut])
+async def get_deposits_enhanced(
+    response: Response,
+    status: Optional[str] = None,
+    user_id: Optional[int] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    sort: str = "created_at",
+    order: str = "desc",
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE
+):
+    async with async_read_session() as session:
         # Join with User to get username/id
-        from sqlalchemy.orm import joinedload
-        result = await session.execute(
-            select(Deposit).options(joinedload(Deposit.user)).order_by(Deposit.created_at.desc())
+        stmt = deposits_filter_stmt(status, user_id, created_from, created_to).options(joinedload(Deposit.user))
+        deposits, next_cursor, total = await keyset_page(
+            session, stmt, resolve_sort(sort, DEPOSIT_SORTS), Deposit.id, cursor, limit, descending=(order != "asc")
         )
-        deposits = result.scalars().all()
-        return [
-            {
-                "id": d.id,
-                "amount": d.amount,
-                "upi_ref_id": d.upi_ref_id,
-                "screenshot_path": d.screenshot_path,
-                "status": d.status,
-                "created_at": d.created_at,
-                "user": {
-                    "id": d.user.id,
-                    "telegram_id": d.user.telegram_id,
-                    "username": d.user.username,
-                    "full_name": d.user.full_name
-                }
-            }
-            for d in deposits
-        ]
+    set_page_headers(response, next_cursor, total)
+    return deposits
 
 # --- Serve Frontend ---
 dist_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "frontend", "dist"))
@@ -1151,6 +1797,8 @@ async def create_account(account: AccountCreate):
 
         session.add(new_account)
 
+        await adjust_stock(session, {(account.country_id, account.type): 1})
+
         await session.commit()
 
         await session.refresh(new_account)
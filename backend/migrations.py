@@ -0,0 +1,457 @@
+"""
+Schema Migrations
+Versioned, forward-only migrations tracked in the schema_version table.
+
+Boot only reads max(version); the runner does work only when the code is
+ahead of the database. Online migrations run on an AUTOCOMMIT connection so
+Postgres can build indexes CONCURRENTLY without locking writes.
+
+Run manually with:  python -m backend.migrations
+"""
+import uuid
+import asyncio
+import logging
+from sqlalchemy import select, insert, update, func, text, inspect, bindparam, exists, Date, MetaData
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.schema import CreateIndex, CreateTable
+from .models import digits_only, Base, User, Country, Account, AccountSecret, AccountArchive, Purchase, Deposit, Settings, SchemaVersion, BalanceTransaction, DailySales, DailyDeposits, RollupWatermark, ProcessedUpdate, SETTINGS_VERSION_KEY
+from .inventory import rebuild_country_stock
+from . import wallet
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key for pg_advisory_lock so only one replica migrates at a time
+MIGRATION_LOCK_KEY = 7_204_311
+
+MIGRATIONS = []
+
+
+def migration(version: int, name: str, online: bool = False):
+    """
+    Register an upgrade step.
+
+    Regular steps run in one transaction together with their schema_version
+    row. Online steps get an AUTOCOMMIT connection and must be idempotent,
+    since a crash before the version row is written re-runs them.
+    """
+    def register(upgrade):
+        MIGRATIONS.append((version, name, upgrade, online))
+        return upgrade
+    return register
+
+
+# --- Helpers ---
+
+async def _add_column(conn, column):
+    """ALTER TABLE ... ADD COLUMN for a model column, skipped if it already exists"""
+    table = column.table.name
+    existing = await conn.run_sync(
+        lambda sync_conn: [c["name"] for c in inspect(sync_conn).get_columns(table)]
+    )
+    if column.name in existing:
+        return
+    column_type = column.type.compile(dialect=conn.dialect)
+    await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column.name} {column_type}"))
+    logger.info(f"➕ Added column {table}.{column.name}")
+
+
+def _index(model, name: str):
+    """Look up a declared Index on a model by name"""
+    for index in model.__table__.indexes:
+        if index.name == name:
+            return index
+    raise KeyError(f"{model.__tablename__} has no index {name}")
+
+
+async def _create_index_online(conn, index):
+    """
+    CREATE INDEX IF NOT EXISTS, CONCURRENTLY on Postgres.
+
+    A failed concurrent build leaves an INVALID index behind that IF NOT
+    EXISTS would skip, so such leftovers are dropped and rebuilt.
+    """
+    ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=conn.dialect))
+    await _run_index_ddl(conn, index.name, ddl)
+
+
+async def _run_index_ddl(conn, name: str, ddl: str):
+    """Execute a "CREATE INDEX IF NOT EXISTS ..." statement the same way, for indexes not declared on a model"""
+    if conn.dialect.name == "postgresql":
+        invalid = await conn.scalar(
+            text(
+                "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = :name AND NOT i.indisvalid"
+            ),
+            {"name": name}
+        )
+        if invalid:
+            await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        ddl = ddl.replace("CREATE INDEX", "CREATE INDEX CONCURRENTLY", 1)
+    await conn.execute(text(ddl))
+    logger.info(f"🗂️ Index ready: {name}")
+
+
+# --- Migrations ---
+
+@migration(1, "baseline")
+async def baseline(conn):
+    # Creates any missing tables; on an empty database this is the full schema
+    await conn.run_sync(Base.metadata.create_all)
+
+
+@migration(2, "account health check columns")
+async def account_health_columns(conn):
+    columns = Account.__table__.c
+    for column in (columns.session_status, columns.last_health_check, columns.health_check_message):
+        await _add_column(conn, column)
+
+
+@migration(3, "hot path indexes", online=True)
+async def hot_path_indexes(conn):
+    for model, name in (
+        (Account, "ix_accounts_country_type_sold"),
+        (Account, "ix_accounts_unsold"),
+        (Purchase, "ix_purchases_user_created"),
+        (Purchase, "ix_purchases_account_id"),
+        (Deposit, "ix_deposits_status_created"),
+        (Deposit, "ix_deposits_user_created"),
+    ):
+        await _create_index_online(conn, _index(model, name))
+
+
+@migration(4, "backfill country stock")
+async def backfill_country_stock(conn):
+    # Session joins the migration transaction; its commit only releases a savepoint
+    session = AsyncSession(bind=conn)
+    await rebuild_country_stock(session)
+    await session.close()
+
+
+@migration(5, "move session_data to account_secrets")
+async def move_session_data(conn):
+    await conn.run_sync(AccountSecret.__table__.create, checkfirst=True)
+    existing = await conn.run_sync(
+        lambda sync_conn: [c["name"] for c in inspect(sync_conn).get_columns("accounts")]
+    )
+    if "session_data" not in existing:
+        return
+    await conn.execute(text(
+        "INSERT INTO account_secrets (account_id, session_data) "
+        "SELECT id, session_data FROM accounts "
+        "WHERE session_data IS NOT NULL "
+        "AND id NOT IN (SELECT account_id FROM account_secrets)"
+    ))
+    await conn.execute(text("ALTER TABLE accounts DROP COLUMN session_data"))
+    logger.info("🔐 Moved accounts.session_data to account_secrets")
+
+
+@migration(6, "accounts archive")
+async def accounts_archive(conn):
+    await conn.run_sync(AccountArchive.__table__.create, checkfirst=True)
+    # Archived accounts leave accounts, so purchases can no longer reference it by FK.
+    # SQLite cannot drop constraints but does not enforce them (foreign_keys pragma is off).
+    if conn.dialect.name != "postgresql":
+        return
+    foreign_keys = await conn.run_sync(
+        lambda sync_conn: inspect(sync_conn).get_foreign_keys("purchases")
+    )
+    for fk in foreign_keys:
+        if fk["referred_table"] == "accounts" and fk.get("name"):
+            await conn.execute(text(f'ALTER TABLE purchases DROP CONSTRAINT "{fk["name"]}"'))
+            logger.info(f"🔓 Dropped purchases FK {fk['name']}")
+
+
+@migration(7, "users total_spent")
+async def users_total_spent(conn):
+    await _add_column(conn, User.__table__.c.total_spent)
+    await conn.execute(text(
+        "UPDATE users SET total_spent = COALESCE("
+        "(SELECT SUM(amount) FROM purchases WHERE purchases.user_id = users.id), 0)"
+    ))
+
+
+@migration(8, "users total_spent index", online=True)
+async def users_total_spent_index(conn):
+    await _create_index_online(conn, _index(User, "ix_users_total_spent"))
+
+
+@migration(9, "settings version row")
+async def settings_version_row(conn):
+    # Seeded once so writers only ever UPDATE it (see settings_cache.bump_settings_version)
+    exists_ = await conn.scalar(select(Settings.id).where(Settings.key == SETTINGS_VERSION_KEY))
+    if exists_ is None:
+        await conn.execute(insert(Settings).values(key=SETTINGS_VERSION_KEY, value=uuid.uuid4().hex))
+
+
+@migration(10, "admin list keyset indexes", online=True)
+async def admin_list_indexes(conn):
+    for model, name in (
+        (User, "ix_users_created_id"),
+        (Deposit, "ix_deposits_created_id"),
+    ):
+        await _create_index_online(conn, _index(model, name))
+
+
+
+@migration(11, "account phone digits")
+async def account_phone_digits(conn):
+    await _add_column(conn, Account.__table__.c.phone_digits)
+    if conn.dialect.name == "postgresql":
+        await conn.execute(text(
+            "UPDATE accounts SET phone_digits = regexp_replace(phone_number, '\\D', '', 'g') "
+            "WHERE phone_digits IS NULL AND phone_number IS NOT NULL"
+        ))
+        return
+    # No regexp_replace in SQLite; normalize in Python
+    result = await conn.execute(
+        select(Account.id, Account.phone_number)
+        .where(Account.phone_digits.is_(None), Account.phone_number.isnot(None))
+    )
+    rows = [{"row_id": row_id, "digits": digits_only(phone)} for row_id, phone in result.all()]
+    if rows:
+        await conn.execute(
+            update(Account.__table__)
+            .where(Account.__table__.c.id == bindparam("row_id"))
+            .values(phone_digits=bindparam("digits")),
+            rows
+        )
+
+
+@migration(12, "admin search indexes", online=True)
+async def admin_search_indexes(conn):
+    await _create_index_online(conn, _index(Account, "ix_accounts_phone_digits"))
+    if conn.dialect.name != "postgresql":
+        # SQLite fallback searches names by prefix only
+        for name, column in (("ix_users_username_lower", "username"), ("ix_users_full_name_lower", "full_name")):
+            await _run_index_ddl(conn, name, f"CREATE INDEX IF NOT EXISTS {name} ON users (lower({column}))")
+        return
+    # Trigram GIN indexes serve ILIKE '%fragment%'; kept out of the models so
+    # create_all never needs the extension
+    await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    for name, column in (("ix_users_username_trgm", "username"), ("ix_users_full_name_trgm", "full_name")):
+        await _run_index_ddl(
+            conn, name, f"CREATE INDEX IF NOT EXISTS {name} ON users USING gin (lower({column}) gin_trgm_ops)"
+        )
+
+
+
+@migration(13, "purchases created_at index", online=True)
+async def purchases_created_at_index(conn):
+    await _create_index_online(conn, _index(Purchase, "ix_purchases_created_at"))
+
+
+
+@migration(14, "daily rollup tables")
+async def daily_rollup_tables(conn):
+    # Filled by backend/rollups.py from watermark 0. Deposit rollups read the ledger, so
+    # approvals from before the ledger existed are backfilled separately (migration 16)
+    for model in (DailySales, DailyDeposits, RollupWatermark):
+        await conn.run_sync(model.__table__.create, checkfirst=True)
+
+
+@migration(15, "processed update ids for webhook dedup")
+async def processed_updates_table(conn):
+    await conn.run_sync(ProcessedUpdate.__table__.create, checkfirst=True)
+
+
+@migration(16, "daily deposits from pre-ledger approvals")
+async def backfill_legacy_deposit_rollups(conn):
+    # Deposits approved before the ledger existed have no deposit credit, so the rollup
+    # job never sees them. Their approval time was not recorded; created_at is the
+    # closest day available.
+    credited = exists().where(
+        BalanceTransaction.type == wallet.DEPOSIT,
+        BalanceTransaction.reference_id == Deposit.id
+    )
+    day = func.date(Deposit.created_at, type_=Date)
+    result = await conn.execute(
+        select(day, func.count(Deposit.id), func.coalesce(func.sum(Deposit.amount), 0.0))
+        .where(Deposit.status == "APPROVED", ~credited)
+        .group_by(day)
+    )
+    rows = [{"day": d, "approved": approved, "amount": amount} for d, approved, amount in result.all() if d]
+    if not rows:
+        return
+
+    # Additive: the rollup job may already hold ledger-based totals for the same days
+    stmt = (postgresql.insert if conn.dialect.name == "postgresql" else sqlite.insert)(DailyDeposits)
+    await conn.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[DailyDeposits.day],
+            set_={
+                "approved": DailyDeposits.approved + stmt.excluded.approved,
+                "amount": DailyDeposits.amount + stmt.excluded.amount
+            }
+        ),
+        rows
+    )
+    logger.info(f"📊 Backfilled {sum(row['approved'] for row in rows)} pre-ledger deposits into daily_deposits")
+
+
+@migration(17, "never reuse account ids on SQLite")
+async def accounts_sqlite_autoincrement(conn):
+    # Postgres ids come from a sequence. A plain SQLite INTEGER PRIMARY KEY hands out
+    # max(id) + 1, so archiving the newest account let the next insert reuse its id.
+    # Rebuild accounts with AUTOINCREMENT and start its sequence past every archived id.
+    if conn.dialect.name != "sqlite":
+        return
+    table_sql = await conn.scalar(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'accounts'"))
+    if "AUTOINCREMENT" not in table_sql.upper():
+        index_sql = (await conn.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'accounts' AND sql IS NOT NULL"
+        ))).scalars().all()
+        existing = await conn.run_sync(
+            lambda sync_conn: {c["name"] for c in inspect(sync_conn).get_columns("accounts")}
+        )
+        columns = ", ".join(c.name for c in Account.__table__.columns if c.name in existing)
+
+        metadata = MetaData()
+        Country.__table__.to_metadata(metadata)  # so the copied foreign key resolves
+        await conn.execute(CreateTable(Account.__table__.to_metadata(metadata, name="accounts_new")))
+        await conn.execute(text(f"INSERT INTO accounts_new ({columns}) SELECT {columns} FROM accounts"))
+        await conn.execute(text("DROP TABLE accounts"))
+        await conn.execute(text("ALTER TABLE accounts_new RENAME TO accounts"))
+        for sql in index_sql:
+            await conn.execute(text(sql))
+
+    highest = await conn.scalar(text(
+        "SELECT max(coalesce((SELECT max(id) FROM accounts), 0), coalesce((SELECT max(id) FROM accounts_archive), 0))"
+    ))
+
+    # Ids already reused: renumber the unsold ones (nothing references them but their secret)
+    clashes = (await conn.execute(text(
+        "SELECT a.id, a.is_sold FROM accounts a JOIN accounts_archive x ON x.id = a.id ORDER BY a.id"
+    ))).all()
+    for account_id, is_sold in clashes:
+        if is_sold:
+            logger.warning(f"⚠️ Sold account {account_id} shares its id with an archived account; left as is")
+            continue
+        highest += 1
+        await conn.execute(text("UPDATE accounts SET id = :new WHERE id = :old"), {"new": highest, "old": account_id})
+        await conn.execute(text("UPDATE account_secrets SET account_id = :new WHERE account_id = :old"), {"new": highest, "old": account_id})
+        logger.info(f"🔢 Renumbered unsold account {account_id} -> {highest} (id clashed with the archive)")
+
+    await conn.execute(text("DELETE FROM sqlite_sequence WHERE name = 'accounts'"))
+    await conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('accounts', :seq)"), {"seq": highest})
+
+
+LATEST_VERSION = max(version for version, _, _, _ in MIGRATIONS)
+
+
+# --- Runner ---
+
+async def get_schema_version(engine) -> int:
+    """Applied version, 0 if the schema_version table does not exist yet"""
+    try:
+        async with engine.connect() as conn:
+            return await conn.scalar(select(func.coalesce(func.max(SchemaVersion.version), 0)))
+    except DBAPIError:
+        return 0
+
+
+async def _claim(conn, version: int) -> bool:
+    """
+    Serialize with other workers for the rest of this transaction and report
+    whether version still needs applying. The lock is transaction-scoped, so
+    unlike the session-level one it is safe behind a transaction-mode pooler.
+    """
+    if conn.dialect.name == "postgresql":
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+    # The baseline migration runs before schema_version exists
+    if not await conn.run_sync(lambda sync_conn: inspect(sync_conn).has_table(SchemaVersion.__tablename__)):
+        return True
+    applied = await conn.scalar(select(SchemaVersion.version).where(SchemaVersion.version == version))
+    return applied is None
+
+
+async def _record(engine, version: int, name: str):
+    async with engine.begin() as conn:
+        if await _claim(conn, version):
+            await conn.execute(insert(SchemaVersion).values(version=version, name=name))
+
+
+async def run_migrations(engine, use_advisory_lock: bool = True) -> int:
+    """
+    Bring the database up to LATEST_VERSION. Returns the resulting version.
+
+    use_advisory_lock must be off behind a transaction-mode pooler: the
+    session-level lock would stay on whichever backend served the call.
+    Each migration still claims its version under a transaction-scoped lock,
+    so workers racing without the session lock skip what another applied.
+    """
+    current = await get_schema_version(engine)
+    if current >= LATEST_VERSION:
+        return current
+
+    is_postgres = engine.dialect.name == "postgresql" and use_advisory_lock
+    async with engine.connect() as lock_conn:
+        lock_conn = await lock_conn.execution_options(isolation_level="AUTOCOMMIT")
+        if is_postgres:
+            await lock_conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        try:
+            # Another replica may have migrated while we waited for the lock
+            current = await get_schema_version(engine)
+
+            for version, name, upgrade, online in sorted(MIGRATIONS, key=lambda m: m[0]):
+                if version <= current:
+                    continue
+
+                if online:
+                    # CONCURRENTLY cannot run in a transaction, so the build itself is unlocked;
+                    # its DDL is IF NOT EXISTS and only the version row is claimed
+                    async with engine.connect() as conn:
+                        pending = await _claim(conn, version)
+                    if pending:
+                        logger.info(f"🔄 Applying migration {version}: {name}")
+                        try:
+                            async with engine.connect() as conn:
+                                conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                                await upgrade(conn)
+                        except DBAPIError:
+                            # Fine if a concurrent worker built it and recorded the version meanwhile
+                            async with engine.connect() as conn:
+                                if await _claim(conn, version):
+                                    raise
+                        await _record(engine, version, name)
+                else:
+                    try:
+                        async with engine.begin() as conn:
+                            pending = await _claim(conn, version)
+                            if pending:
+                                logger.info(f"🔄 Applying migration {version}: {name}")
+                                await upgrade(conn)
+                                await conn.execute(insert(SchemaVersion).values(version=version, name=name))
+                    except IntegrityError:
+                        # Where no lock is available (SQLite), a version-row conflict means
+                        # another worker committed it first; ours was rolled back whole
+                        async with engine.connect() as conn:
+                            if await _claim(conn, version):
+                                raise
+                        pending = False
+
+                current = version
+                if pending:
+                    logger.info(f"✅ Migration {version} applied")
+                else:
+                    logger.info(f"⏭️ Migration {version} already applied by another worker")
+        finally:
+            if is_postgres:
+                await lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+
+    return current
+
+
+if __name__ == "__main__":
+    from .database import engine
+
+    logging.basicConfig(level=logging.INFO)
+
+    async def main():
+        before = await get_schema_version(engine)
+        after = await run_migrations(engine)
+        print(f"Schema version: {before} -> {after} (latest {LATEST_VERSION})")
+        await engine.dispose()
+
+    asyncio.run(main())
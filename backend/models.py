@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Boolean, BigInteger, Text
-from sqlalchemy.orm import relationship, declarative_base
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Date, DateTime, Boolean, BigInteger, Text, Index, text
+from sqlalchemy.orm import relationship, declarative_base, validates
 from datetime import datetime
+import re
 
 Base = declarative_base()
 
@@ -11,11 +12,17 @@ class User(Base):
     username = Column(String, nullable=True)
     full_name = Column(String, nullable=True)
     balance = Column(Float, default=0.0)
+    total_spent = Column(Float, default=0.0, index=True) # Sum of purchases, kept in step by purchase_account
     is_admin = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     purchases = relationship("Purchase", back_populates="user")
     deposits = relationship("Deposit", back_populates="user")
+    transactions = relationship("BalanceTransaction", back_populates="user")
+
+    __table_args__ = (
+        Index("ix_users_created_id", "created_at", "id"),  # Admin list keyset order
+    )
 
 class Country(Base):
     __tablename__ = "countries"
@@ -26,30 +33,111 @@ class Country(Base):
 
     accounts = relationship("Account", back_populates="country")
 
+def digits_only(value):
+    """Strip phone formatting: '+91 98765-43210' -> '919876543210'"""
+    return re.sub(r"\D", "", value) if value else value
+
 class Account(Base):
     __tablename__ = "accounts"
     id = Column(Integer, primary_key=True, index=True)
     country_id = Column(Integer, ForeignKey("countries.id"))
     phone_number = Column(String, index=True) # Removed unique=True to allow restocking same number
-    session_data = Column(Text, nullable=True) # Can be session file path or string
+    phone_digits = Column(String, index=True) # phone_number without formatting, for prefix search
     is_sold = Column(Boolean, default=False)
     type = Column(String, default="ID") # ID or SESSION
     created_at = Column(DateTime, default=datetime.utcnow)
     twofa_password = Column(String, nullable=True)  # 2FA password (optional)
+    session_status = Column(String, nullable=True) # ACTIVE / ERROR from the last session test
+    last_health_check = Column(DateTime, nullable=True)
+    health_check_message = Column(String, nullable=True)
 
     country = relationship("Country", back_populates="accounts")
-    purchase = relationship("Purchase", back_populates="account", uselist=False)
+    purchase = relationship(
+        "Purchase", back_populates="account", uselist=False,
+        primaryjoin="Account.id == foreign(Purchase.account_id)"
+    )
+    # Session strings live in account_secrets; load explicitly with joinedload(Account.secret)
+    secret = relationship(
+        "AccountSecret", back_populates="account", uselist=False,
+        lazy="raise_on_sql", cascade="all, delete-orphan"
+    )
+
+    @validates("phone_number")
+    def _normalize_phone(self, key, value):
+        self.phone_digits = digits_only(value)
+        return value
+
+    @property
+    def session_data(self):
+        return self.secret.session_data if self.secret else None
+
+    @session_data.setter
+    def session_data(self, value):
+        if self.secret is None:
+            self.secret = AccountSecret(session_data=value)
+        else:
+            self.secret.session_data = value
+
+    __table_args__ = (
+        Index("ix_accounts_country_type_sold", "country_id", "type", "is_sold"),
+        # Partial index over unsold stock only - serves the claim query (ORDER BY id LIMIT 1)
+        Index(
+            "ix_accounts_unsold", "country_id", "type", "id",
+            postgresql_where=text("is_sold = false"),
+            sqlite_where=text("is_sold = 0")
+        ),
+        # Archived ids must never be handed out again (accounts_archive keeps them as its key)
+        {"sqlite_autoincrement": True},
+    )
+
+class AccountSecret(Base):
+    """Session string for an account, kept out of the hot accounts row"""
+    __tablename__ = "account_secrets"
+    account_id = Column(Integer, ForeignKey("accounts.id", ondelete="CASCADE"), primary_key=True)
+    session_data = Column(Text, nullable=True) # Can be session file path or string
+
+    account = relationship("Account", back_populates="secret")
+
+class AccountArchive(Base):
+    """Sold accounts moved out of the hot accounts table (see backend/archiver.py)"""
+    __tablename__ = "accounts_archive"
+    id = Column(Integer, primary_key=True) # Same id the account had in accounts
+    country_id = Column(Integer)
+    phone_number = Column(String)
+    session_data = Column(Text, nullable=True)
+    type = Column(String)
+    created_at = Column(DateTime)
+    twofa_password = Column(String, nullable=True)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+class CountryStock(Base):
+    """Materialized count of unsold accounts per (country, type)"""
+    __tablename__ = "country_stock"
+    country_id = Column(Integer, ForeignKey("countries.id"), primary_key=True)
+    type = Column(String, primary_key=True) # Same values as Account.type
+    available = Column(Integer, default=0, nullable=False)
+
+    country = relationship("Country")
 
 class Purchase(Base):
     __tablename__ = "purchases"
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"))
-    account_id = Column(Integer, ForeignKey("accounts.id"))
+    account_id = Column(Integer) # accounts.id or accounts_archive.id once archived (no FK)
     amount = Column(Float)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     user = relationship("User", back_populates="purchases")
-    account = relationship("Account", back_populates="purchase")
+    account = relationship(
+        "Account", back_populates="purchase",
+        primaryjoin="foreign(Purchase.account_id) == Account.id"
+    )
+
+    __table_args__ = (
+        Index("ix_purchases_user_created", "user_id", "created_at"),
+        Index("ix_purchases_account_id", "account_id"),
+        Index("ix_purchases_created_at", "created_at"),  # Today's revenue on the dashboard
+    )
 
 class Deposit(Base):
     __tablename__ = "deposits"
@@ -63,8 +151,66 @@ class Deposit(Base):
 
     user = relationship("User", back_populates="deposits")
 
+    __table_args__ = (
+        Index("ix_deposits_status_created", "status", "created_at"),
+        Index("ix_deposits_user_created", "user_id", "created_at"),
+        Index("ix_deposits_created_id", "created_at", "id"),  # Admin list keyset order
+    )
+
 class Settings(Base):
     __tablename__ = "settings"
     id = Column(Integer, primary_key=True)
     key = Column(String, unique=True)
     value = Column(String)
+
+# Settings row whose value changes on every settings write (cache invalidation)
+SETTINGS_VERSION_KEY = "settings_version"
+
+class BalanceTransaction(Base):
+    __tablename__ = "balance_transactions"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    type = Column(String) # deposit, purchase, admin_add, admin_deduct
+    amount = Column(Float) # Signed: credits positive, debits negative
+    balance_after = Column(Float) # Running balance after this entry
+    reference_id = Column(Integer, nullable=True) # Deposit or Purchase id
+    note = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    user = relationship("User", back_populates="transactions")
+
+class DailySales(Base):
+    """Purchases rolled up per day x country x account type (see backend/rollups.py)"""
+    __tablename__ = "daily_sales"
+    day = Column(Date, primary_key=True)
+    country_id = Column(Integer, primary_key=True) # 0 when the account no longer exists
+    type = Column(String, primary_key=True)
+    units = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0.0, nullable=False)
+
+class DailyDeposits(Base):
+    """Approved deposits rolled up per day of approval"""
+    __tablename__ = "daily_deposits"
+    day = Column(Date, primary_key=True)
+    approved = Column(Integer, default=0, nullable=False)
+    amount = Column(Float, default=0.0, nullable=False)
+
+class RollupWatermark(Base):
+    """Highest source row id already folded into a rollup"""
+    __tablename__ = "rollup_watermarks"
+    name = Column(String, primary_key=True)
+    last_id = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class ProcessedUpdate(Base):
+    """Telegram update_ids already accepted by the webhook (see backend/update_dedup.py)"""
+    __tablename__ = "processed_updates"
+    update_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    received_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class SchemaVersion(Base):
+    """One row per applied migration (see backend/migrations.py)"""
+    __tablename__ = "schema_version"
+    version = Column(Integer, primary_key=True)
+    name = Column(String)
+    applied_at = Column(DateTime, default=datetime.utcnow)
@@ -114,9 +114,9 @@ async def process_get_otp(callback: types.CallbackQuery):
             return
         
         # Get account
-        account_stmt = select(Account).where(Account.id == purchase.account_id)
+        account_stmt = purchased_account_stmt(purchase.account_id, with_secret=True)
         account_res = await session.execute(account_stmt)
-        account = account_res.scalar_one_or_none()
+        account = account_res.one_or_none()
         
         if not account or not account.session_data:
             await callback.message.edit_text(
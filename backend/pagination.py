@@ -0,0 +1,93 @@
+"""
+Keyset Pagination
+Cursor-based paging for the admin list endpoints. A cursor encodes the
+(sort value, id) of the last row served, so every page is an index range
+scan no matter how deep the admin scrolls.
+"""
+import json
+import base64
+from datetime import datetime
+from fastapi import HTTPException
+from sqlalchemy import select, func, tuple_, DateTime
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(sort_value, row_id: int) -> str:
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    raw = json.dumps([sort_value, row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str, sort_col):
+    try:
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if isinstance(sort_col.type, DateTime) and sort_value is not None:
+            sort_value = datetime.fromisoformat(sort_value)
+        return sort_value, int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def resolve_sort(sort: str, allowed: dict):
+    """Map a ?sort= name to its column, rejecting anything not whitelisted"""
+    if sort not in allowed:
+        raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(allowed)}")
+    return allowed[sort]
+
+
+async def keyset_page(session, stmt, sort_col, id_col, cursor: str = None,
+                      limit: int = DEFAULT_PAGE_SIZE, descending: bool = True, with_total: bool = None):
+    """
+    Run one page of a filtered select.
+
+    Args:
+        stmt: select() with filters applied but no ORDER BY / LIMIT
+        sort_col, id_col: keyset columns; id breaks ties so pages never overlap
+        with_total: count matching rows (defaults to first page only)
+
+    Returns:
+        (items, next_cursor, total) - next_cursor is None on the last page,
+        total is None when not computed
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    if with_total is None:
+        with_total = cursor is None
+
+    total = None
+    if with_total:
+        total = await session.scalar(
+            select(func.count()).select_from(stmt.order_by(None).subquery())
+        )
+
+    page_stmt = stmt
+    if cursor:
+        sort_value, last_id = decode_cursor(cursor, sort_col)
+        key = tuple_(sort_col, id_col)
+        page_stmt = page_stmt.where(key < (sort_value, last_id) if descending else key > (sort_value, last_id))
+
+    if descending:
+        page_stmt = page_stmt.order_by(sort_col.desc(), id_col.desc())
+    else:
+        page_stmt = page_stmt.order_by(sort_col.asc(), id_col.asc())
+
+    result = await session.execute(page_stmt.limit(limit + 1))
+    items = result.unique().scalars().all()
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, sort_col.key), getattr(last, id_col.key))
+
+    return items, next_cursor, total
+
+
+def set_page_headers(response, next_cursor: str, total: int = None):
+    """List endpoints keep a JSON array body; paging metadata travels in headers"""
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if total is not None:
+        response.headers["X-Total-Count"] = str(total)
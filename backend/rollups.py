@@ -0,0 +1,274 @@
+"""
+Daily Rollups
+Runs in background and folds new purchases and approved deposits into the
+daily_sales / daily_deposits tables, so charts never scan the raw tables.
+
+Each source has a watermark (highest row id already counted). A batch adds
+its increments and advances the watermark in one transaction, so every row
+is counted exactly once even across restarts or several workers.
+"""
+import asyncio
+import logging
+from datetime import date, datetime, timedelta
+from sqlalchemy import select, update, func, Date, union_all
+from .database import async_session
+from .models import Account, AccountArchive, Purchase, BalanceTransaction, DailySales, DailyDeposits, RollupWatermark
+from .inventory import upsert_insert
+from . import wallet
+
+logger = logging.getLogger(__name__)
+
+SALES = "daily_sales"
+DEPOSITS = "daily_deposits"
+
+
+def _day(column):
+    # date() exists on both Postgres and SQLite; type_ makes SQLite results come back as date objects
+    return func.date(column, type_=Date)
+
+
+async def _lock_watermark(session, name: str) -> int:
+    """Current watermark, row-locked on Postgres so concurrent jobs serialize"""
+    stmt = select(RollupWatermark.last_id).where(RollupWatermark.name == name)
+    if session.bind.dialect.name == "postgresql":
+        stmt = stmt.with_for_update()
+    last_id = await session.scalar(stmt)
+    if last_id is None:
+        await session.execute(
+            upsert_insert(session)(RollupWatermark)
+            .values(name=name, last_id=0)
+            .on_conflict_do_nothing(index_elements=[RollupWatermark.name])
+        )
+        last_id = await session.scalar(stmt)
+    return last_id
+
+
+async def _batch_upper(session, id_col, created_col, last_id: int, cutoff: datetime, batch_size: int):
+    """
+    Highest id of the next batch. The batch stops before the first row newer
+    than cutoff, so an id handed out just before a slow commit is not skipped,
+    and neither is an older row whose created_at lands after a newer id's.
+    """
+    blocker = await session.scalar(
+        select(func.min(id_col)).where(id_col > last_id, created_col >= cutoff)
+    )
+    window = select(id_col.label("id")).where(id_col > last_id)
+    if blocker is not None:
+        window = window.where(id_col < blocker)
+    window = window.order_by(id_col).limit(batch_size).subquery()
+    return await session.scalar(select(func.max(window.c.id)))
+
+
+async def _advance(session, name: str, upper: int):
+    await session.execute(
+        update(RollupWatermark)
+        .where(RollupWatermark.name == name)
+        .values(last_id=upper, updated_at=datetime.utcnow())
+    )
+
+
+async def get_timeseries(session, start: date, end: date, country_id: int = None, account_type: str = None) -> dict:
+    """
+    Per-day units/revenue/deposits for [start, end] read only from the rollups,
+    zero-filled, plus per country/type totals over the range
+    """
+    sales_filter = [DailySales.day >= start, DailySales.day <= end]
+    if country_id is not None:
+        sales_filter.append(DailySales.country_id == country_id)
+    if account_type:
+        sales_filter.append(DailySales.type == account_type)
+
+    days = {}
+    current = start
+    while current <= end:
+        days[current] = {"day": current.isoformat(), "units": 0, "revenue": 0.0, "deposits_approved": 0, "deposit_amount": 0.0}
+        current += timedelta(days=1)
+
+    sales = await session.execute(
+        select(DailySales.day, func.sum(DailySales.units), func.sum(DailySales.revenue))
+        .where(*sales_filter)
+        .group_by(DailySales.day)
+    )
+    for day, units, revenue in sales.all():
+        days[day]["units"] = int(units or 0)
+        days[day]["revenue"] = round(float(revenue or 0), 2)
+
+    # Deposits are wallet top-ups and carry no country/type
+    deposits = await session.execute(
+        select(DailyDeposits.day, DailyDeposits.approved, DailyDeposits.amount)
+        .where(DailyDeposits.day >= start, DailyDeposits.day <= end)
+    )
+    for day, approved, amount in deposits.all():
+        days[day]["deposits_approved"] = approved
+        days[day]["deposit_amount"] = round(float(amount or 0), 2)
+
+    breakdown = await session.execute(
+        select(DailySales.country_id, DailySales.type, func.sum(DailySales.units), func.sum(DailySales.revenue))
+        .where(*sales_filter)
+        .group_by(DailySales.country_id, DailySales.type)
+        .order_by(func.sum(DailySales.revenue).desc())
+    )
+    watermarks = await session.execute(select(RollupWatermark.name, RollupWatermark.updated_at))
+
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "series": list(days.values()),
+        "breakdown": [
+            {"country_id": c, "type": t, "units": int(units or 0), "revenue": round(float(revenue or 0), 2)}
+            for c, t, units, revenue in breakdown.all()
+        ],
+        "as_of": {name: updated_at for name, updated_at in watermarks.all()}
+    }
+
+
+class RollupJob:
+    def __init__(self, check_interval: int = 60, lag_seconds: int = 30, batch_size: int = 5000):
+        """
+        Initialize rollup job
+
+        Args:
+            check_interval: Run every N seconds (default: 60)
+            lag_seconds: Only fold rows older than this, so in-flight transactions settle first
+            batch_size: Source rows folded per transaction
+        """
+        self.check_interval = check_interval
+        self.lag_seconds = lag_seconds
+        self.batch_size = batch_size
+        self.is_running = False
+
+    async def roll_sales_batch(self):
+        """Fold the next batch of purchases. Returns units folded, None once caught up."""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.lag_seconds)
+
+        async with async_session() as session:
+            try:
+                last_id = await _lock_watermark(session, SALES)
+                upper = await _batch_upper(session, Purchase.id, Purchase.created_at, last_id, cutoff, self.batch_size)
+                if upper is None:
+                    await session.rollback()
+                    return None
+
+                # Sold accounts may have moved to the archive
+                accounts = union_all(
+                    select(Account.id, Account.country_id, Account.type),
+                    select(AccountArchive.id, AccountArchive.country_id, AccountArchive.type)
+                ).subquery()
+                day = _day(Purchase.created_at)
+                country_id = func.coalesce(accounts.c.country_id, 0)
+                account_type = func.coalesce(accounts.c.type, "ID")
+                totals = await session.execute(
+                    select(day, country_id, account_type, func.count(Purchase.id), func.coalesce(func.sum(Purchase.amount), 0.0))
+                    .select_from(Purchase)
+                    .outerjoin(accounts, accounts.c.id == Purchase.account_id)
+                    .where(Purchase.id > last_id, Purchase.id <= upper)
+                    .group_by(day, country_id, account_type)
+                )
+                rows = [
+                    {"day": d, "country_id": c, "type": t, "units": units, "revenue": revenue}
+                    for d, c, t, units, revenue in totals.all()
+                ]
+                if rows:
+                    stmt = upsert_insert(session)(DailySales)
+                    await session.execute(
+                        stmt.on_conflict_do_update(
+                            index_elements=[DailySales.day, DailySales.country_id, DailySales.type],
+                            set_={
+                                "units": DailySales.units + stmt.excluded.units,
+                                "revenue": DailySales.revenue + stmt.excluded.revenue
+                            }
+                        ),
+                        rows
+                    )
+                await _advance(session, SALES, upper)
+                await session.commit()
+                return sum(row["units"] for row in rows)
+            except Exception:
+                await session.rollback()
+                raise
+
+    async def roll_deposits_batch(self):
+        """
+        Fold the next batch of ledger entries into daily_deposits.
+        Approvals are read from the ledger (deposit credits) so the day is
+        the approval day and a deposit approved long after creation still counts.
+        Approvals from before the ledger existed are seeded by migration 16.
+        Returns approvals folded, None once caught up.
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=self.lag_seconds)
+
+        async with async_session() as session:
+            try:
+                last_id = await _lock_watermark(session, DEPOSITS)
+                upper = await _batch_upper(
+                    session, BalanceTransaction.id, BalanceTransaction.created_at, last_id, cutoff, self.batch_size
+                )
+                if upper is None:
+                    await session.rollback()
+                    return None
+
+                day = _day(BalanceTransaction.created_at)
+                totals = await session.execute(
+                    select(day, func.count(BalanceTransaction.id), func.coalesce(func.sum(BalanceTransaction.amount), 0.0))
+                    .where(
+                        BalanceTransaction.id > last_id,
+                        BalanceTransaction.id <= upper,
+                        BalanceTransaction.type == wallet.DEPOSIT
+                    )
+                    .group_by(day)
+                )
+                rows = [{"day": d, "approved": approved, "amount": amount} for d, approved, amount in totals.all()]
+                if rows:
+                    stmt = upsert_insert(session)(DailyDeposits)
+                    await session.execute(
+                        stmt.on_conflict_do_update(
+                            index_elements=[DailyDeposits.day],
+                            set_={
+                                "approved": DailyDeposits.approved + stmt.excluded.approved,
+                                "amount": DailyDeposits.amount + stmt.excluded.amount
+                            }
+                        ),
+                        rows
+                    )
+                await _advance(session, DEPOSITS, upper)
+                await session.commit()
+                return sum(row["approved"] for row in rows)
+            except Exception:
+                await session.rollback()
+                raise
+
+    async def catch_up(self) -> dict:
+        """Fold everything older than the lag, batch by batch"""
+        folded = {SALES: 0, DEPOSITS: 0}
+        for name, roll_batch in ((SALES, self.roll_sales_batch), (DEPOSITS, self.roll_deposits_batch)):
+            while (count := await roll_batch()) is not None:
+                folded[name] += count
+        return folded
+
+    async def rollup_loop(self):
+        """Main rollup loop"""
+        logger.info(f"📈 Rollup job started (every {self.check_interval}s, lag {self.lag_seconds}s)")
+
+        while self.is_running:
+            try:
+                folded = await self.catch_up()
+                if any(folded.values()):
+                    logger.info(f"📈 Rolled up {folded[SALES]} purchases, {folded[DEPOSITS]} deposit approvals")
+            except Exception as e:
+                logger.error(f"❌ Rollup error: {e}")
+
+            await asyncio.sleep(self.check_interval)
+
+    async def start(self):
+        """Start the rollup job"""
+        if self.is_running:
+            logger.warning("⚠️ Rollup job already running")
+            return
+
+        self.is_running = True
+        await self.rollup_loop()
+
+    def stop(self):
+        """Stop the rollup job"""
+        self.is_running = False
+        logger.info("🛑 Rollup job stopped")
@@ -0,0 +1,140 @@
+"""
+Admin Search
+Ranked lookup of users (telegram id, username, full name) and accounts
+(phone number fragment) for the admin panel.
+
+Every branch is an index lookup: telegram id hits its unique index, names
+use the pg_trgm GIN indexes on Postgres (prefix match on SQLite), and phone
+fragments are a range scan over the normalized accounts.phone_digits.
+"""
+import re
+from sqlalchemy import select, func, or_, and_
+from .models import User, Account, digits_only
+
+MIN_FRAGMENT_LENGTH = 3  # Shorter terms match by prefix only; trigrams need 3 chars
+MAX_TELEGRAM_ID_DIGITS = 19
+
+
+def digits_prefix_range(column, digits: str):
+    """
+    column LIKE 'digits%' written as a range so a plain btree index serves it
+    under any collation: "9198" -> column >= "9198" AND column < "9199"
+    """
+    stripped = digits.rstrip("9")
+    if not stripped:
+        return column >= digits
+    upper = stripped[:-1] + str(int(stripped[-1]) + 1)
+    return and_(column >= digits, column < upper)
+
+
+def escape_like(term: str) -> str:
+    """Make %, _ and the escape character itself match literally (use with escape="\\")"""
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def name_prefix(column, term: str, is_postgres: bool):
+    """
+    lower(column) starts with term (already lowercased). On Postgres a LIKE that
+    the pg_trgm GIN index on lower(column) serves; SQLite cannot use an
+    expression index for LIKE, so a range over ix_*_lower there.
+    """
+    expr = func.lower(column)
+    if is_postgres:
+        return expr.like(escape_like(term) + "%", escape="\\")
+    if ord(term[-1]) == 0x10FFFF:
+        return expr >= term
+    return and_(expr >= term, expr < term[:-1] + chr(ord(term[-1]) + 1))
+
+
+def _text_score(term: str, value) -> float:
+    if not value:
+        return 0.0
+    value = value.lower()
+    if value == term:
+        return 1.0
+    if value.startswith(term):
+        return 0.8 + 0.1 * len(term) / len(value)
+    if term in value:
+        return 0.5 + 0.1 * len(term) / len(value)
+    return 0.0
+
+
+async def search_users(session, term: str, limit: int):
+    term = term.strip().lstrip("@").lower()
+    is_postgres = session.bind.dialect.name == "postgresql"
+
+    conditions = []
+    if term.isdigit() and len(term) <= MAX_TELEGRAM_ID_DIGITS:
+        conditions.append(User.telegram_id == int(term))
+    if is_postgres and len(term) >= MIN_FRAGMENT_LENGTH:
+        conditions += [func.lower(User.username).contains(term, autoescape=True),
+                       func.lower(User.full_name).contains(term, autoescape=True)]
+    elif term:
+        conditions += [name_prefix(User.username, term, is_postgres),
+                       name_prefix(User.full_name, term, is_postgres)]
+
+    stmt = select(User).where(or_(*conditions))
+    if is_postgres and len(term) >= MIN_FRAGMENT_LENGTH:
+        # Best trigram match first so the limit keeps the most relevant rows
+        stmt = stmt.order_by(func.greatest(
+            func.coalesce(func.similarity(func.lower(User.username), term), 0),
+            func.coalesce(func.similarity(func.lower(User.full_name), term), 0)
+        ).desc())
+    result = await session.execute(stmt.limit(limit))
+
+    hits = []
+    for user in result.scalars().all():
+        score = max(_text_score(term, user.username), _text_score(term, user.full_name))
+        if str(user.telegram_id) == term:
+            score = 1.0
+        hits.append({
+            "kind": "user",
+            "id": user.id,
+            "score": round(score, 3),
+            "title": user.full_name or user.username or str(user.telegram_id),
+            "subtitle": f"@{user.username or 'N/A'} • {user.telegram_id}",
+            "telegram_id": user.telegram_id,
+            "username": user.username,
+            "full_name": user.full_name,
+            "balance": user.balance
+        })
+    return hits
+
+
+async def search_accounts(session, term: str, limit: int):
+    digits = digits_only(term.strip())
+    if not digits or len(digits) < MIN_FRAGMENT_LENGTH:
+        return []
+
+    result = await session.execute(
+        select(Account)
+        .where(digits_prefix_range(Account.phone_digits, digits))
+        .order_by(Account.phone_digits)
+        .limit(limit)
+    )
+
+    hits = []
+    for account in result.scalars().all():
+        # Exact number first, then shorter completions; unsold ahead of sold
+        score = 0.6 + 0.3 * len(digits) / len(account.phone_digits) + (0.0 if account.is_sold else 0.05)
+        hits.append({
+            "kind": "account",
+            "id": account.id,
+            "score": round(min(score, 1.0), 3),
+            "title": account.phone_number,
+            "subtitle": f"{account.type} • {'Sold' if account.is_sold else 'Available'}",
+            "country_id": account.country_id,
+            "is_sold": account.is_sold,
+            "type": account.type
+        })
+    return hits
+
+
+async def admin_search(session, term: str, limit: int = 20) -> list:
+    """Users and accounts matching term, best match first"""
+    term = re.sub(r"\s+", " ", term or "").strip()
+    if not term:
+        return []
+    hits = await search_users(session, term, limit) + await search_accounts(session, term, limit)
+    hits.sort(key=lambda hit: hit["score"], reverse=True)
+    return hits[:limit]
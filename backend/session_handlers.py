@@ -12,6 +12,7 @@ import logging
 from .database import async_session
 from .models import Purchase, Account
 from .device_manager import DeviceManager
+from .inventory import purchased_account_stmt
 from sqlalchemy import select
 
 logger = logging.getLogger(__name__)
@@ -34,9 +35,9 @@ def register_session_handlers(dp):
                 await callback.answer("❌ Purchase not found", show_alert=True)
                 return
             
-            account_stmt = select(Account).where(Account.id == purchase.account_id)
+            account_stmt = purchased_account_stmt(purchase.account_id, with_secret=True)
             account_res = await session.execute(account_stmt)
-            account = account_res.scalar_one_or_none()
+            account = account_res.one_or_none()
             
             if not account:
                 await callback.answer("❌ Account not found", show_alert=True)
@@ -118,9 +119,9 @@ def register_session_handlers(dp):
                 await callback.answer("❌ Purchase not found", show_alert=True)
                 return
             
-            account_stmt = select(Account).where(Account.id == purchase.account_id)
+            account_stmt = purchased_account_stmt(purchase.account_id, with_secret=True)
             account_res = await session.execute(account_stmt)
-            account = account_res.scalar_one_or_none()
+            account = account_res.one_or_none()
             
             if not account:
                 await callback.answer("❌ Account not found", show_alert=True)
@@ -0,0 +1,107 @@
+"""
+Settings Cache
+Keeps the settings table in memory per worker.
+
+Writers bump a version row (settings_version) in the same transaction as
+their change. Readers compare that version at most once per
+check_interval, and only reload the table when it moved, so other workers
+see a change within check_interval seconds without a query per update.
+"""
+import os
+import time
+import uuid
+import asyncio
+import logging
+from sqlalchemy import event, select, update
+from .database import async_session
+from .models import Settings, SETTINGS_VERSION_KEY
+
+logger = logging.getLogger(__name__)
+
+
+class SettingsCache:
+    def __init__(self, check_interval: float = 30):
+        """
+        Args:
+            check_interval: Seconds between version checks (max staleness across workers)
+        """
+        self.check_interval = check_interval
+        self._values = {}
+        self._loaded = False
+        self._version = None
+        self._checked_at = float("-inf")
+        self._generation = 0
+        self._lock = asyncio.Lock()
+
+    async def _refresh(self):
+        """Re-check the version row; reload every setting only if it changed"""
+        async with self._lock:
+            # Another caller may have refreshed while we waited
+            if time.monotonic() - self._checked_at < self.check_interval:
+                return
+
+            generation = self._generation
+            async with async_session() as session:
+                version = await session.scalar(
+                    select(Settings.value).where(Settings.key == SETTINGS_VERSION_KEY)
+                )
+                if not self._loaded or version != self._version:
+                    result = await session.execute(select(Settings.key, Settings.value))
+                    self._values = dict(result.all())
+                    self._version = version
+                    self._loaded = True
+                    logger.info(f"⚙️ Settings cache loaded ({len(self._values)} keys, version {version})")
+
+            # An invalidate() during the read may have raced a commit we did not see
+            if generation == self._generation:
+                self._checked_at = time.monotonic()
+
+    async def _ensure_fresh(self):
+        if time.monotonic() - self._checked_at < self.check_interval:
+            return
+        try:
+            await self._refresh()
+        except Exception as e:
+            # Serve the last known values rather than failing the update
+            logger.error(f"❌ Settings cache refresh failed: {e}")
+
+    async def get(self, key: str, default=None):
+        await self._ensure_fresh()
+        value = self._values.get(key)
+        return value if value is not None else default
+
+    async def get_many(self, *keys) -> dict:
+        """Several settings with a single freshness check"""
+        await self._ensure_fresh()
+        return {key: self._values.get(key) for key in keys}
+
+    def invalidate(self):
+        """Force a reload on the next read in this worker"""
+        self._loaded = False
+        self._checked_at = float("-inf")
+        self._generation += 1
+
+
+settings_cache = SettingsCache(check_interval=float(os.getenv("SETTINGS_CACHE_SECONDS", "30")))
+
+
+async def bump_settings_version(session):
+    """
+    Mark settings as changed, in the caller's transaction (does not commit).
+    Once that transaction commits the local cache reloads on its next read;
+    other workers within check_interval. A rollback leaves the cache alone.
+    """
+    result = await session.execute(
+        update(Settings)
+        .where(Settings.key == SETTINGS_VERSION_KEY)
+        .values(value=uuid.uuid4().hex)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        session.add(Settings(key=SETTINGS_VERSION_KEY, value=uuid.uuid4().hex))
+    # Invalidating now would let a read before the commit cache the old values again
+    event.listen(session.sync_session, "after_commit", _invalidate_after_commit, once=True)
+
+
+def _invalidate_after_commit(session):
+    settings_cache.invalidate()
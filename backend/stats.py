@@ -0,0 +1,94 @@
+"""
+Admin Stats Snapshot
+Dashboard figures computed with COUNT/SUM aggregates and shared between
+viewers: the snapshot is rebuilt at most once per TTL, and concurrent
+requests for an expired snapshot wait on the single rebuild in flight
+instead of each running the aggregates.
+"""
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime
+from sqlalchemy import select, func
+from .database import async_read_session
+from .models import User, Country, Purchase, Deposit, CountryStock
+
+logger = logging.getLogger(__name__)
+
+
+async def compute_admin_stats(session) -> dict:
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    total_users = await session.scalar(select(func.count(User.id)))
+    # users.total_spent is kept in step with every purchase (see purchase_account)
+    total_sales = await session.scalar(select(func.coalesce(func.sum(User.total_spent), 0.0)))
+    pending_deposits = await session.scalar(
+        select(func.count(Deposit.id)).where(Deposit.status == "PENDING")
+    )
+    today_row = (await session.execute(
+        select(func.count(Purchase.id), func.coalesce(func.sum(Purchase.amount), 0.0))
+        .where(Purchase.created_at >= today)
+    )).one()
+
+    stock_rows = await session.execute(
+        select(Country.id, Country.name, Country.emoji, CountryStock.type, CountryStock.available)
+        .join(CountryStock, CountryStock.country_id == Country.id)
+        .order_by(Country.name)
+    )
+    stock = {}
+    for country_id, name, emoji, type_, available in stock_rows.all():
+        entry = stock.setdefault(country_id, {
+            "country_id": country_id, "name": name, "emoji": emoji, "available": 0, "by_type": {}
+        })
+        available = max(available or 0, 0)
+        entry["by_type"][type_] = available
+        entry["available"] += available
+
+    return {
+        "total_users": total_users,
+        "total_sales": float(total_sales or 0),
+        "pending_deposits": pending_deposits,
+        "today_sales": today_row[0],
+        "today_revenue": float(today_row[1] or 0),
+        "total_available": sum(entry["available"] for entry in stock.values()),
+        "stock": list(stock.values()),
+        "generated_at": datetime.utcnow().isoformat()
+    }
+
+
+class StatsSnapshot:
+    def __init__(self, ttl: float = 15):
+        """
+        Args:
+            ttl: Seconds a snapshot is served before the next request rebuilds it
+        """
+        self.ttl = ttl
+        self._value = None
+        self._built_at = float("-inf")
+        self._lock = asyncio.Lock()
+
+    def _fresh(self) -> bool:
+        return self._value is not None and time.monotonic() - self._built_at < self.ttl
+
+    async def get(self) -> dict:
+        if self._fresh():
+            return self._value
+
+        async with self._lock:
+            # Whoever held the lock before us already rebuilt it
+            if self._fresh():
+                return self._value
+
+            started = time.perf_counter()
+            async with async_read_session() as session:
+                self._value = await compute_admin_stats(session)
+            self._built_at = time.monotonic()
+            logger.info(f"📊 Admin stats snapshot rebuilt in {(time.perf_counter() - started) * 1000:.0f}ms")
+            return self._value
+
+    def invalidate(self):
+        self._built_at = float("-inf")
+
+
+stats_snapshot = StatsSnapshot(ttl=float(os.getenv("STATS_CACHE_SECONDS", "15")))
@@ -0,0 +1,100 @@
+"""
+Webhook Update Deduplication
+Telegram redelivers an update when the webhook does not answer in time, so
+the same purchase or deposit update can arrive twice. Every update_id is
+checked here before it is queued.
+
+A ring buffer of recent ids catches retries to the same worker for free.
+With UPDATE_DEDUP_DB=1 new ids are also claimed in processed_updates
+(INSERT ... ON CONFLICT DO NOTHING), which catches retries that land on a
+different worker or replica.
+"""
+import os
+import logging
+from collections import deque
+from datetime import datetime, timedelta
+from sqlalchemy import delete
+from .database import async_session
+from .models import ProcessedUpdate
+from .inventory import upsert_insert
+
+logger = logging.getLogger(__name__)
+
+# Telegram keeps undelivered updates for 24 hours; older ids cannot come back
+RETENTION = timedelta(hours=24)
+PRUNE_EVERY = 1000
+
+
+class UpdateDeduplicator:
+    def __init__(self, capacity: int = 10000, use_db: bool = False):
+        """
+        Args:
+            capacity: Recent update_ids remembered in memory
+            use_db: Also claim ids in processed_updates (shared by all workers)
+        """
+        self.capacity = capacity
+        self.use_db = use_db
+        self._ids = set()
+        self._order = deque()
+        self._claims = 0
+        self.duplicates = 0
+
+    def _remember(self, update_id: int):
+        self._ids.add(update_id)
+        self._order.append(update_id)
+        if len(self._order) > self.capacity:
+            self._ids.discard(self._order.popleft())
+
+    async def _claim_in_db(self, update_id: int) -> bool:
+        """True if this worker is the first to see update_id"""
+        async with async_session() as session:
+            result = await session.execute(
+                upsert_insert(session)(ProcessedUpdate)
+                .values(update_id=update_id, received_at=datetime.utcnow())
+                .on_conflict_do_nothing(index_elements=[ProcessedUpdate.update_id])
+                .returning(ProcessedUpdate.update_id)
+            )
+            claimed = result.scalar_one_or_none() is not None
+
+            self._claims += 1
+            if self._claims % PRUNE_EVERY == 0:
+                await session.execute(
+                    delete(ProcessedUpdate).where(ProcessedUpdate.received_at < datetime.utcnow() - RETENTION)
+                )
+            await session.commit()
+            return claimed
+
+    async def is_duplicate(self, update_id: int) -> bool:
+        """Check and record update_id; True means it was already seen and should be dropped"""
+        if update_id in self._ids:
+            self.duplicates += 1
+            return True
+        self._remember(update_id)
+
+        if self.use_db:
+            try:
+                if not await self._claim_in_db(update_id):
+                    self.duplicates += 1
+                    return True
+            except Exception as e:
+                # Fail open: processing twice is rarer than losing an update to a DB blip
+                logger.error(f"❌ Update dedup check failed for {update_id}: {e}")
+        return False
+
+    async def release(self, update_id: int):
+        """Forget update_id so Telegram's redelivery is accepted (used when it could not be queued)"""
+        self._ids.discard(update_id)
+        if not self.use_db:
+            return
+        try:
+            async with async_session() as session:
+                await session.execute(delete(ProcessedUpdate).where(ProcessedUpdate.update_id == update_id))
+                await session.commit()
+        except Exception as e:
+            logger.error(f"❌ Could not release update {update_id}: {e}")
+
+
+update_dedup = UpdateDeduplicator(
+    capacity=int(os.getenv("UPDATE_DEDUP_CAPACITY", "10000")),
+    use_db=os.getenv("UPDATE_DEDUP_DB", "0") == "1"
+)
@@ -0,0 +1,164 @@
+"""
+Webhook Update Queue
+Lets the webhook acknowledge Telegram immediately: updates go onto a bounded
+in-process queue and a pool of workers feeds them to the dispatcher.
+
+Updates are grouped into per-chat lanes. A lane is held by at most one
+worker at a time, so one chat's updates run strictly in order while
+different chats run in parallel. Workers take one update per turn and then
+put the lane back, so a busy chat cannot starve the others.
+"""
+import time
+import asyncio
+import logging
+from collections import deque
+from aiogram.types.update import UpdateTypeLookupError
+
+logger = logging.getLogger(__name__)
+
+
+def chat_key(update):
+    """Ordering key for an aiogram Update: the chat, else the user, else the update itself"""
+    try:
+        event = update.event
+    except UpdateTypeLookupError:
+        return ("update", update.update_id)
+
+    chat = getattr(event, "chat", None)
+    if chat is None:
+        message = getattr(event, "message", None)  # callback_query
+        chat = getattr(message, "chat", None)
+    if chat is not None:
+        return chat.id
+
+    user = getattr(event, "from_user", None) or getattr(event, "user", None)
+    if user is not None:
+        return user.id
+    return ("update", update.update_id)
+
+
+class UpdateQueue:
+    def __init__(self, process, workers: int = 16, max_pending: int = 1000):
+        """
+        Initialize queue
+
+        Args:
+            process: async callable run for each update (e.g. dp.feed_update)
+            workers: Updates processed concurrently (across different chats)
+            max_pending: Queued updates beyond which new ones are refused
+        """
+        self.process = process
+        self.workers = workers
+        self.max_pending = max_pending
+        self.is_running = False
+
+        self._lanes = {}               # chat key -> deque of (update, enqueued_at)
+        self._ready = asyncio.Queue()  # chat keys with work and no worker
+        self._pending = 0
+        self._busy = 0
+        self._tasks = []
+
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.max_wait_ms = 0.0
+        self._recent_waits = deque(maxlen=1000)
+        self._recent_runs = deque(maxlen=1000)
+
+    def put(self, update) -> bool:
+        """Queue an update without waiting. Returns False when the queue is full."""
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            return False
+
+        key = chat_key(update)
+        item = (update, time.perf_counter())
+        lane = self._lanes.get(key)
+        if lane is None:
+            self._lanes[key] = deque([item])
+            self._ready.put_nowait(key)
+        else:
+            # Lane is queued or being worked on; the holder will pick this up in order
+            lane.append(item)
+        self._pending += 1
+        self.enqueued += 1
+        return True
+
+    async def _worker(self, number: int):
+        while True:
+            key = await self._ready.get()
+            lane = self._lanes[key]
+            update, enqueued_at = lane.popleft()
+            self._pending -= 1
+            self._busy += 1
+
+            started = time.perf_counter()
+            wait_ms = (started - enqueued_at) * 1000
+            self._recent_waits.append(wait_ms)
+            if wait_ms > self.max_wait_ms:
+                self.max_wait_ms = wait_ms
+
+            try:
+                await self.process(update)
+                self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"❌ Update {update.update_id} failed in worker {number}: {e}", exc_info=True)
+            finally:
+                self._busy -= 1
+                self._recent_runs.append((time.perf_counter() - started) * 1000)
+                if lane:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._lanes[key]
+
+    async def start(self):
+        """Start the worker pool"""
+        if self.is_running:
+            logger.warning("⚠️ Update queue already running")
+            return
+
+        self.is_running = True
+        self._tasks = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+        logger.info(f"📬 Update queue started ({self.workers} workers, max {self.max_pending} pending)")
+
+    async def stop(self, drain_timeout: float = 10):
+        """Give queued updates up to drain_timeout seconds, then stop the workers"""
+        deadline = time.monotonic() + drain_timeout
+        while (self._pending or self._busy) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.is_running = False
+        logger.info(f"🛑 Update queue stopped ({self._pending} updates left unprocessed)")
+
+    def snapshot(self) -> dict:
+        waits = sorted(self._recent_waits)
+        runs = sorted(self._recent_runs)
+
+        def p95(values):
+            return round(values[min(len(values) - 1, int(len(values) * 0.95))], 2) if values else 0.0
+
+        return {
+            "running": self.is_running,
+            "workers": self.workers,
+            "busy_workers": self._busy,
+            "depth": self._pending,
+            "max_pending": self.max_pending,
+            "active_chats": len(self._lanes),
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(sum(waits) / len(waits), 2) if waits else 0.0,
+            "p95_wait_ms": p95(waits),
+            "max_wait_ms": round(self.max_wait_ms, 2),
+            "avg_run_ms": round(sum(runs) / len(runs), 2) if runs else 0.0,
+            "p95_run_ms": p95(runs)
+        }
@@ -0,0 +1,117 @@
+"""
+Wallet Ledger
+Balance changes happen in SQL and are recorded in an append-only ledger
+"""
+import logging
+from sqlalchemy import update, insert, func, case
+from .models import User, BalanceTransaction
+
+logger = logging.getLogger(__name__)
+
+# Ledger entry types
+DEPOSIT = "deposit"
+PURCHASE = "purchase"
+ADMIN_ADD = "admin_add"
+ADMIN_DEDUCT = "admin_deduct"
+
+
+async def change_balance(session, user_id: int, delta: float, count_as_spent: bool = False):
+    """
+    Apply a balance change in a single UPDATE ... RETURNING.
+
+    Debits carry a "balance >= amount" guard, so two concurrent debits can
+    never both pass on the same funds. With count_as_spent the debit is also
+    added to users.total_spent in the same statement (purchases).
+    Returns the new balance, or None if the user is missing or short of funds.
+    """
+    stmt = update(User).where(User.id == user_id)
+    if delta < 0:
+        stmt = stmt.where(User.balance >= -delta)
+
+    values = {"balance": User.balance + delta}
+    if count_as_spent:
+        values["total_spent"] = func.coalesce(User.total_spent, 0) - delta
+
+    result = await session.execute(
+        stmt.values(**values)
+        .returning(User.balance)
+        .execution_options(synchronize_session=False)
+    )
+    return result.scalar_one_or_none()
+
+
+async def record_transaction(session, user_id: int, tx_type: str, amount: float, balance_after: float,
+                             reference_id: int = None, note: str = None):
+    """Append a ledger entry (does not commit)"""
+    await session.execute(
+        insert(BalanceTransaction).values(
+            user_id=user_id,
+            type=tx_type,
+            amount=amount,
+            balance_after=balance_after,
+            reference_id=reference_id,
+            note=note
+        )
+    )
+
+
+async def credit(session, user_id: int, amount: float, tx_type: str, reference_id: int = None, note: str = None):
+    """Add funds and record them. Returns the new balance (None if user missing)."""
+    new_balance = await change_balance(session, user_id, abs(amount))
+    if new_balance is not None:
+        await record_transaction(session, user_id, tx_type, abs(amount), new_balance, reference_id, note)
+    return new_balance
+
+
+async def debit(session, user_id: int, amount: float, tx_type: str, reference_id: int = None, note: str = None):
+    """Remove funds and record them. Returns the new balance (None if insufficient)."""
+    new_balance = await change_balance(session, user_id, -abs(amount))
+    if new_balance is not None:
+        await record_transaction(session, user_id, tx_type, -abs(amount), new_balance, reference_id, note)
+    return new_balance
+
+
+async def credit_many(session, credits: list, tx_type: str, note: str = None) -> dict:
+    """
+    Add funds for many entries at once: one UPDATE (CASE per user) and one
+    multi-row ledger INSERT, in the caller's transaction (does not commit).
+
+    Args:
+        credits: [(user_id, amount, reference_id), ...]; a user may appear more than once
+
+    Returns:
+        {user_id: new_balance} for users that exist
+    """
+    totals = {}
+    for user_id, amount, _ in credits:
+        totals[user_id] = totals.get(user_id, 0) + abs(amount)
+    if not totals:
+        return {}
+
+    result = await session.execute(
+        update(User)
+        .where(User.id.in_(totals))
+        .values(balance=User.balance + case(totals, value=User.id, else_=0))
+        .returning(User.id, User.balance)
+        .execution_options(synchronize_session=False)
+    )
+    balances = dict(result.all())
+
+    # Running balance per entry, working back from each user's final balance
+    entries = []
+    remaining = dict(balances)
+    for user_id, amount, reference_id in reversed(credits):
+        if user_id not in remaining:
+            continue
+        entries.append({
+            "user_id": user_id,
+            "type": tx_type,
+            "amount": abs(amount),
+            "balance_after": remaining[user_id],
+            "reference_id": reference_id,
+            "note": note
+        })
+        remaining[user_id] -= abs(amount)
+    if entries:
+        await session.execute(insert(BalanceTransaction), entries[::-1])
+    return balances
@@ -0,0 +1,105 @@
+"""
+Webhook Replies
+Telegram lets the webhook HTTP response carry one Bot API call. In reply mode
+(WEBHOOK_REPLY=1) the webhook waits briefly while its update is handled, and
+the first eligible call the handler makes becomes the response body instead of
+a separate HTTPS request. Later calls go out normally.
+
+A call is eligible when the handler can do without its real result (methods
+returning True, such as answerCallbackQuery, editMessageText or deleteMessage)
+and it uploads no files. The handler gets True back. Telegram applies a
+replied call after it reads the response, and API errors for it are never
+reported back.
+"""
+import typing
+import asyncio
+import logging
+import contextvars
+from contextlib import contextmanager
+from urllib.parse import urlencode
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+logger = logging.getLogger(__name__)
+
+# Reply slot of the update being handled in the current task
+_current_slot = contextvars.ContextVar("webhook_reply_slot", default=None)
+
+
+def can_reply(method) -> bool:
+    """True for methods whose result may be faked as True"""
+    returning = method.__returning__
+    return returning is bool or bool in typing.get_args(returning)
+
+
+def encode_reply(bot, method):
+    """Form-encoded webhook response body for method, or None if it uploads files"""
+    files = {}
+    fields = {"method": method.__api_method__}
+    for key, value in method.model_dump(warnings=False).items():
+        value = bot.session.prepare_value(value, bot=bot, files=files)
+        if value:
+            fields[key] = value
+    return None if files else urlencode(fields)
+
+
+class WebhookReplies(BaseRequestMiddleware):
+    def __init__(self, wait_seconds: float = 2.0):
+        """
+        Args:
+            wait_seconds: Longest the webhook response is held waiting for a call
+        """
+        self.wait_seconds = wait_seconds
+        self._slots = {}  # update_id -> Future resolved with a body or None
+        self.replied = 0
+        self.timed_out = 0
+
+    def open(self, update_id: int):
+        """Called by the webhook before the update is queued"""
+        self._slots[update_id] = asyncio.get_running_loop().create_future()
+
+    def discard(self, update_id: int):
+        self._slots.pop(update_id, None)
+
+    @contextmanager
+    def handling(self, update_id: int):
+        """Wrap handler execution so its Bot API calls can find the update's slot"""
+        slot = self._slots.get(update_id)
+        token = _current_slot.set(slot)
+        try:
+            yield
+        finally:
+            _current_slot.reset(token)
+            if slot is not None and not slot.done():
+                slot.set_result(None)  # handled without an eligible call
+
+    async def wait(self, update_id: int):
+        """Response body for the update, or None to acknowledge it empty"""
+        slot = self._slots[update_id]
+        try:
+            return await asyncio.wait_for(asyncio.shield(slot), self.wait_seconds)
+        except asyncio.TimeoutError:
+            if slot.done():
+                return slot.result()  # captured just as the wait expired
+            self.timed_out += 1
+            slot.set_result(None)  # close the slot: later calls go out directly
+            return None
+        finally:
+            self._slots.pop(update_id, None)
+
+    async def __call__(self, make_request, bot, method):
+        slot = _current_slot.get()
+        if slot is not None and not slot.done() and can_reply(method):
+            body = encode_reply(bot, method)
+            if body is not None:
+                slot.set_result(body)
+                self.replied += 1
+                return True
+        return await make_request(bot, method)
+
+    def snapshot(self) -> dict:
+        return {
+            "wait_seconds": self.wait_seconds,
+            "replied": self.replied,
+            "timed_out": self.timed_out,
+            "waiting": len(self._slots)
+        }
@@ -0,0 +1,107 @@
+"""
+Benchmark admin API serialization for large list responses.
+
+Compares, for 10k-row responses:
+  before - ORM objects through jsonable_encoder + JSONResponse (the old path)
+  after  - explicit response models (pydantic-core) + ORJSONResponse
+and reports the gzip size of each payload.
+
+Usage:
+    python benchmark_serialization.py            # 10000 rows
+    python benchmark_serialization.py 50000
+"""
+import os
+import sys
+import gzip
+import time
+import statistics
+from datetime import datetime, timedelta
+
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+
+from typing import List
+from pydantic import TypeAdapter
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from backend.models import User, Account, Deposit
+from backend.main import UserOut, AccountOut, DepositWithUserOut
+
+ROUNDS = 5
+
+
+def build_rows(count: int):
+    now = datetime.utcnow()
+    users = [
+        User(id=i, telegram_id=1_000_000 + i, username=f"user{i}", full_name=f"User Number {i}",
+             balance=i * 1.5, total_spent=i * 0.5, is_admin=False, created_at=now - timedelta(minutes=i))
+        for i in range(1, count + 1)
+    ]
+    accounts = [
+        Account(id=i, country_id=i % 50, phone_number=f"+91{i:010d}", is_sold=bool(i % 3),
+                type="ID", created_at=now - timedelta(minutes=i), twofa_password=None)
+        for i in range(1, count + 1)
+    ]
+    deposits = []
+    for i in range(1, count + 1):
+        deposit = Deposit(id=i, user_id=i, amount=100.0 + i, upi_ref_id=f"UPI{i:012d}",
+                          screenshot_path=None, status="PENDING", created_at=now - timedelta(minutes=i))
+        # Separate User instance: back-populating users[i] would add relationships the
+        # list endpoints never load and send jsonable_encoder round a cycle
+        deposit.user = User(id=i, telegram_id=1_000_000 + i, username=f"user{i}", full_name=f"User Number {i}")
+        deposits.append(deposit)
+    return {"users": (users, UserOut), "accounts": (accounts, AccountOut), "deposits/enhanced": (deposits, DepositWithUserOut)}
+
+
+def legacy_enhanced(d):
+    # The old /admin/deposits/enhanced built these dicts by hand
+    return {
+        "id": d.id, "amount": d.amount, "upi_ref_id": d.upi_ref_id, "screenshot_path": d.screenshot_path,
+        "status": d.status, "created_at": d.created_at,
+        "user": {"id": d.user.id, "telegram_id": d.user.telegram_id, "username": d.user.username, "full_name": d.user.full_name}
+    }
+
+
+def before(rows, model):
+    if model is DepositWithUserOut:
+        rows = [legacy_enhanced(d) for d in rows]
+    return JSONResponse(content=jsonable_encoder(rows)).body
+
+
+def after(rows, model, adapter):
+    # What FastAPI does with response_model: validate, dump in JSON mode, render
+    validated = adapter.validate_python(rows)
+    return ORJSONResponse(content=adapter.dump_python(validated, mode="json")).body
+
+
+def timed(fn, *args):
+    samples = []
+    body = None
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        body = fn(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), body
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    print(f"📊 Serializing {count} rows per endpoint (median of {ROUNDS} runs)\n")
+    print(f"{'endpoint':<20}{'before ms':>12}{'after ms':>12}{'speedup':>10}{'json KB':>10}{'gzip KB':>10}")
+
+    for name, (rows, model) in build_rows(count).items():
+        adapter = TypeAdapter(List[model])
+        before_ms, before_body = timed(before, rows, model)
+        after_ms, after_body = timed(after, rows, model, adapter)
+        print(
+            f"{name:<20}{before_ms:>12.1f}{after_ms:>12.1f}{before_ms / after_ms:>9.1f}x"
+            f"{len(after_body) / 1024:>10.0f}{len(gzip.compress(after_body)) / 1024:>10.0f}"
+        )
+        if b"session_data" in before_body or b"session_data" in after_body:
+            print(f"   ⚠️ session_data present in {name} output")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Benchmark webhook update parsing.
+
+Compares, per update:
+  before - json.loads into a dict (FastAPI `update: dict`) then Update(**update)
+  orjson - orjson.loads into a dict then Update.model_validate
+  after  - Update.model_validate_json on the raw body (what the webhook does now)
+
+The corpus should be real traffic: run the bot with WEBHOOK_RECORD_FILE set and
+the webhook appends every raw update body to that file (one per line). It holds
+user messages, so keep it out of the repo. Without --corpus a synthetic mix of
+callback_query and message payloads is used and labelled as such.
+
+Usage:
+    python benchmark_webhook_parsing.py --corpus updates.jsonl
+    python benchmark_webhook_parsing.py            # synthetic, 5000 updates
+    python benchmark_webhook_parsing.py 20000      # synthetic, 20000 updates
+"""
+import sys
+import json
+import time
+import random
+import statistics
+
+import orjson
+from aiogram import Bot
+from aiogram.types import Update
+
+ROUNDS = 9
+CALLBACK_DATA = [
+    "btn_accounts", "btn_profile", "btn_purchases", "btn_transactions", "btn_help", "btn_main_menu",
+    "btn_deposit", "confirm_deposit", "country_12", "confirm_buy_12_ID", "get_otp_4821", "manage_sess_77",
+]
+
+bot = Bot("123456:benchmark")
+
+
+def user(user_id: int) -> dict:
+    return {
+        "id": user_id, "is_bot": False, "first_name": f"User{user_id}", "last_name": "Example",
+        "username": f"user{user_id}", "language_code": "en"
+    }
+
+
+def bot_message(user_id: int, message_id: int) -> dict:
+    # The menu message a callback button hangs off, inline keyboard included
+    return {
+        "message_id": message_id, "date": 1760000000,
+        "from": {"id": 123456, "is_bot": True, "first_name": "Store Bot", "username": "store_bot"},
+        "chat": {"id": user_id, "first_name": f"User{user_id}", "username": f"user{user_id}", "type": "private"},
+        "text": "🏠 Main Menu\n\n💰 Balance: ₹150.00\n\nChoose an option below:",
+        "reply_markup": {"inline_keyboard": [
+            [{"text": "🛒 Buy Accounts", "callback_data": "btn_accounts"}, {"text": "💰 Deposit", "callback_data": "btn_deposit"}],
+            [{"text": "👤 Profile", "callback_data": "btn_profile"}, {"text": "📜 Purchases", "callback_data": "btn_purchases"}],
+            [{"text": "❓ Help", "callback_data": "btn_help"}],
+        ]}
+    }
+
+
+def callback_update(update_id: int, user_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(4_000_000_000_000 + update_id), "from": user(user_id),
+            "message": bot_message(user_id, update_id % 5000), "chat_instance": str(-7_000_000_000 - user_id),
+            "data": random.choice(CALLBACK_DATA)
+        }
+    }
+
+
+def message_update(update_id: int, user_id: int) -> dict:
+    message = {
+        "message_id": update_id % 5000, "from": user(user_id), "date": 1760000000,
+        "chat": {"id": user_id, "first_name": f"User{user_id}", "username": f"user{user_id}", "type": "private"},
+    }
+    kind = random.random()
+    if kind < 0.4:
+        message["text"] = "/start"
+        message["entities"] = [{"offset": 0, "length": 6, "type": "bot_command"}]
+    elif kind < 0.8:
+        message["text"] = f"UTR{random.randint(10**11, 10**12 - 1)}"
+    else:
+        # Deposit screenshot
+        message["photo"] = [
+            {"file_id": f"AgACAgUAAxkBAAI{update_id}{size}", "file_unique_id": f"AQAD{update_id}{size}",
+             "file_size": size * 90, "width": size, "height": size * 2}
+            for size in (90, 320, 800, 1280)
+        ]
+    return {"update_id": update_id, "message": message}
+
+
+def build_corpus(count: int):
+    random.seed(7)
+    corpus = []
+    for update_id in range(1, count + 1):
+        user_id = random.randint(10**8, 10**10)
+        # Most traffic is menu navigation
+        payload = callback_update(update_id, user_id) if random.random() < 0.7 else message_update(update_id, user_id)
+        corpus.append(json.dumps(payload, ensure_ascii=False).encode())
+    return corpus
+
+
+def load_corpus(path: str):
+    with open(path, "rb") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def before(body: bytes) -> Update:
+    return Update(**json.loads(body))
+
+
+def via_orjson(body: bytes) -> Update:
+    return Update.model_validate(orjson.loads(body), context={"bot": bot})
+
+
+def after(body: bytes) -> Update:
+    return Update.model_validate_json(body, context={"bot": bot})
+
+
+def timed_interleaved(paths, corpus):
+    """
+    CPU µs per update for each path: median and spread over ROUNDS. Paths are
+    run in rotating order within each round so machine noise hits all alike.
+    """
+    samples = {name: [] for name, _ in paths}
+    for round_number in range(ROUNDS):
+        shift = round_number % len(paths)
+        for name, fn in paths[shift:] + paths[:shift]:
+            start = time.process_time()
+            for body in corpus:
+                fn(body)
+            samples[name].append((time.process_time() - start) / len(corpus) * 1_000_000)
+    return {name: (statistics.median(values), min(values), max(values)) for name, values in samples.items()}
+
+
+def main():
+    args = sys.argv[1:]
+    if args[:1] == ["--corpus"]:
+        corpus = load_corpus(args[1])
+        source = f"recorded ({args[1]})"
+    else:
+        corpus = build_corpus(int(args[0]) if args else 5_000)
+        source = "synthetic"
+    avg_kb = sum(map(len, corpus)) / len(corpus) / 1024
+    print(f"📊 Parsing {len(corpus)} {source} updates, avg {avg_kb:.1f} KB (median CPU of {ROUNDS} runs)\n")
+
+    # Every path must produce the same Update
+    for body in corpus[:200]:
+        assert before(body).model_dump() == after(body).model_dump() == via_orjson(body).model_dump()
+
+    results = timed_interleaved([("before", before), ("orjson", via_orjson), ("after", after)], corpus)
+    before_us = results["before"][0]
+    print(f"{'path':<10}{'median µs':>12}{'min-max µs':>16}{'saved µs':>10}{'saved':>8}")
+    for name, (median, low, high) in results.items():
+        saved = "" if name == "before" else f"{before_us - median:>10.1f}{(before_us - median) / before_us:>8.1%}"
+        print(f"{name:<10}{median:>12.1f}{f'{low:.1f}-{high:.1f}':>16}{saved}")
+
+if __name__ == "__main__":
+    main()
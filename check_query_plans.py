@@ -0,0 +1,227 @@
+"""
+Check that the hot bot/admin queries use indexes (no sequential scans).
+
+Seeds a large dataset into a scratch database, runs EXPLAIN on each hot
+query and exits with code 1 if any of them scans a big table.
+
+Usage:
+    python check_query_plans.py                      # temporary SQLite file
+    CHECK_DATABASE_URL=postgresql+asyncpg://... python check_query_plans.py
+
+CHECK_DATABASE_URL must point at an EMPTY scratch database - never production.
+"""
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, insert, text, func, tuple_
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from backend.models import Base, User, Country, Account, Purchase, Deposit, BalanceTransaction, CountryStock
+from backend.inventory import claim_account_stmt, countries_in_stock_stmt
+from backend.search import digits_prefix_range, name_prefix
+
+USERS = 20_000
+COUNTRIES = 50
+ACCOUNTS = 200_000
+PURCHASES = 100_000
+DEPOSITS = 100_000
+
+# Tables big enough that a full scan on a hot path is a bug
+BIG_TABLES = {"users", "accounts", "purchases", "deposits", "balance_transactions"}
+
+
+def hot_queries(is_postgres: bool):
+    """(name, statement) for the queries bot.py/main.py run per request"""
+    user_id = 4242
+    return [
+        ("user by telegram_id", select(User).where(User.telegram_id == 1_004_242)),
+        ("browse countries (ID)", countries_in_stock_stmt("ID")),
+        ("country preview row", select(Account.phone_number).where(
+            Account.country_id == 7, Account.is_sold == False, Account.type == "ID"
+        ).order_by(Account.id).limit(1)),
+        ("claim account", claim_account_stmt(7, "ID")),
+        ("recent purchases", select(Purchase).where(Purchase.user_id == user_id)
+            .order_by(Purchase.created_at.desc()).limit(10)),
+        ("purchase ownership", select(Purchase).where(
+            Purchase.user_id == user_id, Purchase.account_id == 1234
+        )),
+        ("purchase by account", select(Purchase).where(Purchase.account_id == 1234)),
+        ("user total spent", select(func.sum(Purchase.amount)).where(Purchase.user_id == user_id)),
+        ("recent deposits", select(Deposit).where(Deposit.user_id == user_id)
+            .order_by(Deposit.created_at.desc()).limit(10)),
+        ("pending deposits", select(Deposit).where(Deposit.status == "PENDING")
+            .order_by(Deposit.created_at.desc())),
+        ("buyer rank", select(func.count(User.id)).where(User.total_spent > 500)),
+        ("admin users page", select(User)
+            .where(tuple_(User.created_at, User.id) < (datetime(2026, 1, 1), 5000))
+            .order_by(User.created_at.desc(), User.id.desc()).limit(101)),
+        ("admin deposits page", select(Deposit)
+            .where(tuple_(Deposit.created_at, Deposit.id) < (datetime(2026, 1, 1), 5000))
+            .order_by(Deposit.created_at.desc(), Deposit.id.desc()).limit(101)),
+        ("admin accounts page", select(Account).where(Account.id < 5000)
+            .order_by(Account.id.desc()).limit(101)),
+        ("today revenue", select(func.sum(Purchase.amount)).where(Purchase.created_at >= datetime(2030, 1, 1))),
+        ("admin search phone", select(Account).where(digits_prefix_range(Account.phone_digits, "9198"))
+            .order_by(Account.phone_digits).limit(20)),
+        ("admin search users", select(User)
+            .where(name_prefix(User.username, "user12", is_postgres) | name_prefix(User.full_name, "user12", is_postgres))
+            .order_by(User.created_at.desc(), User.id.desc()).limit(101)),
+        ("user ledger", select(BalanceTransaction).where(BalanceTransaction.user_id == user_id)
+            .order_by(BalanceTransaction.id.desc()).limit(100)),
+    ]
+
+
+async def seed(conn):
+    """Bulk-insert a realistic spread: mostly sold stock, mostly approved deposits"""
+    rng = random.Random(42)
+    now = datetime.utcnow()
+
+    await conn.execute(insert(User), [
+        {"id": i, "telegram_id": 1_000_000 + i, "balance": 0.0} for i in range(1, USERS + 1)
+    ])
+    await conn.execute(insert(Country), [
+        {"id": i, "name": f"Country {i}", "emoji": "🏳️", "price": 50.0} for i in range(1, COUNTRIES + 1)
+    ])
+    await conn.execute(insert(Account), [
+        {
+            "id": i,
+            "country_id": rng.randint(1, COUNTRIES),
+            "phone_number": f"+1{i:010d}",
+            "phone_digits": f"1{i:010d}",
+            "type": "ID" if i % 5 else "Session",
+            "is_sold": i <= ACCOUNTS * 0.9,
+            "created_at": now - timedelta(minutes=i),
+        }
+        for i in range(1, ACCOUNTS + 1)
+    ])
+    await conn.execute(insert(Purchase), [
+        {
+            "user_id": rng.randint(1, USERS),
+            "account_id": i,
+            "amount": 50.0,
+            "created_at": now - timedelta(minutes=i),
+        }
+        for i in range(1, PURCHASES + 1)
+    ])
+    await conn.execute(insert(Deposit), [
+        {
+            "user_id": rng.randint(1, USERS),
+            "amount": 100.0,
+            "upi_ref_id": f"UPI{i}",
+            "status": "PENDING" if i % 200 == 0 else "APPROVED",
+            "created_at": now - timedelta(minutes=i),
+        }
+        for i in range(1, DEPOSITS + 1)
+    ])
+    await conn.execute(insert(BalanceTransaction), [
+        {
+            "user_id": rng.randint(1, USERS),
+            "type": "deposit",
+            "amount": 100.0,
+            "balance_after": 100.0,
+            "created_at": now - timedelta(minutes=i),
+        }
+        for i in range(1, DEPOSITS + 1)
+    ])
+    counts = await conn.execute(
+        select(Account.country_id, Account.type, func.count(Account.id))
+        .where(Account.is_sold == False)
+        .group_by(Account.country_id, Account.type)
+    )
+    await conn.execute(insert(CountryStock), [
+        {"country_id": c, "type": t, "available": n} for c, t, n in counts.all()
+    ])
+
+
+def sqlite_scans(rows):
+    """EXPLAIN QUERY PLAN detail lines like 'SCAN accounts' (no index)"""
+    scans = []
+    for row in rows:
+        detail = row[-1]
+        words = detail.split()
+        if len(words) >= 2 and words[0] == "SCAN" and "USING" not in words:
+            scans.append(words[1])
+    return scans
+
+
+def postgres_scans(plan):
+    """Walk an EXPLAIN (FORMAT JSON) tree collecting Seq Scan relations"""
+    scans = []
+    stack = [plan[0]["Plan"]]
+    while stack:
+        node = stack.pop()
+        if node.get("Node Type") == "Seq Scan":
+            scans.append(node.get("Relation Name"))
+        stack.extend(node.get("Plans", []))
+    return scans
+
+
+async def explain(conn, stmt):
+    dialect = conn.dialect
+    sql = str(stmt.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+    if dialect.name == "postgresql":
+        result = await conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))
+        plan = result.scalar_one()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return postgres_scans(plan), json.dumps(plan[0]["Plan"]["Node Type"])
+    result = await conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"))
+    rows = result.all()
+    return sqlite_scans(rows), " | ".join(row[-1] for row in rows)
+
+
+async def main():
+    url = os.getenv("CHECK_DATABASE_URL")
+    tmp_path = None
+    if not url:
+        fd, tmp_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        url = f"sqlite+aiosqlite:///{tmp_path}"
+
+    engine = create_async_engine(url)
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            # Expression indexes come from migration 12, not the models
+            for name, column in (("ix_users_username_lower", "username"), ("ix_users_full_name_lower", "full_name")):
+                await conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON users (lower({column}))"))
+            existing = await conn.scalar(select(func.count(Account.id)))
+            if existing:
+                print("❌ CHECK_DATABASE_URL already has accounts - point it at an empty scratch database")
+                return 2
+
+        print(f"🌱 Seeding {ACCOUNTS} accounts, {PURCHASES} purchases, {DEPOSITS} deposits...")
+        async with engine.begin() as conn:
+            await seed(conn)
+        async with engine.begin() as conn:
+            await conn.execute(text("ANALYZE"))
+
+        failures = 0
+        async with engine.connect() as conn:
+            for name, stmt in hot_queries(engine.dialect.name == "postgresql"):
+                scans, plan = await explain(conn, stmt)
+                bad = sorted(set(scans) & BIG_TABLES)
+                if bad:
+                    failures += 1
+                    print(f"❌ {name}: sequential scan on {', '.join(bad)}\n   {plan}")
+                else:
+                    print(f"✅ {name}: {plan}")
+
+        if failures:
+            print(f"\n❌ {failures} hot queries fall back to sequential scans")
+            return 1
+        print("\n✅ All hot queries use indexes")
+        return 0
+    finally:
+        await engine.dispose()
+        if tmp_path:
+            os.remove(tmp_path)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
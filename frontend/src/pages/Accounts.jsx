@@ -35,6 +35,8 @@ const Accounts = () => {
     const [phoneNumber, setPhoneNumber] = useState('');
     const [searchTerm, setSearchTerm] = useState('');
     const [filterCountry, setFilterCountry] = useState('');
+    const [nextCursor, setNextCursor] = useState(null);
+    const [total, setTotal] = useState(0);
     const [loading, setLoading] = useState(false);
     const [message, setMessage] = useState({ type: '', text: '' });
 
@@ -50,13 +52,25 @@ const Accounts = () => {
     const [detected2FA, setDetected2FA] = useState(false);
 
     useEffect(() => {
-        fetchAccounts();
         fetchCountries();
     }, []);
 
-    const fetchAccounts = async () => {
-        const res = await axios.get(`${API_BASE}/admin/accounts`);
-        setAccounts(res.data);
+    useEffect(() => {
+        // Filters run server-side; debounce typing in the phone search
+        const timer = setTimeout(() => fetchAccounts(), 300);
+        return () => clearTimeout(timer);
+    }, [searchTerm, filterCountry]);
+
+    const fetchAccounts = async (cursor = null) => {
+        const params = {};
+        if (filterCountry) params.country_id = filterCountry;
+        if (searchTerm) params.phone = searchTerm.trim();
+        if (cursor) params.cursor = cursor;
+
+        const res = await axios.get(`${API_BASE}/admin/accounts`, { params });
+        setAccounts(prev => cursor ? [...prev, ...res.data] : res.data);
+        setNextCursor(res.headers['x-next-cursor'] || null);
+        if (res.headers['x-total-count']) setTotal(parseInt(res.headers['x-total-count']));
     };
 
     const fetchCountries = async () => {
@@ -184,15 +198,6 @@ const Accounts = () => {
 
     const getCountryById = (id) => countries.find(c => c.id === id);
 
-    const filteredAccounts = accounts.filter(acc => {
-        const country = getCountryById(acc.country_id);
-        const matchesCountry = !filterCountry || acc.country_id === parseInt(filterCountry);
-        const matchesSearch = !searchTerm ||
-            acc.phone_number.includes(searchTerm) ||
-            country?.name.toLowerCase().includes(searchTerm.toLowerCase());
-        return matchesCountry && matchesSearch;
-    });
-
     return (
         <div className="space-y-6 max-w-7xl mx-auto">
             {/* Header */}
@@ -268,7 +273,7 @@ const Accounts = () => {
                             type="text"
                             value={searchTerm}
                             onChange={e => setSearchTerm(e.target.value)}
-                            placeholder="Search accounts..."
+                            placeholder="Search by phone..."
                             className="w-full bg-gray-700 border-none rounded-xl p-3 pl-10 ring-1 ring-gray-600 focus:ring-2 focus:ring-blue-500 outline-none transition-all text-white placeholder:text-gray-500"
                         />
                     </div>
@@ -287,13 +292,13 @@ const Accounts = () => {
             <div className="bg-gray-800 p-4 rounded-2xl border border-gray-700">
                 <h3 className="text-lg font-semibold text-white mb-4 flex items-center gap-2">
                     <Package size={20} />
-                    All Accounts ({filteredAccounts.length})
+                    All Accounts ({total})
                 </h3>
                 <div className="space-y-2 max-h-96 overflow-y-auto">
-                    {filteredAccounts.length === 0 ? (
+                    {accounts.length === 0 ? (
                         <p className="text-gray-400 text-center py-8">No accounts found</p>
                     ) : (
-                        filteredAccounts.map(acc => {
+                        accounts.map(acc => {
                             const country = getCountryById(acc.country_id);
                             return (
                                 <div key={acc.id} className="bg-gray-700/50 p-3 rounded-lg hover:bg-gray-700 transition-colors">
@@ -323,6 +328,14 @@ const Accounts = () => {
                             );
                         })
                     )}
+                    {nextCursor && (
+                        <button
+                            onClick={() => fetchAccounts(nextCursor)}
+                            className="w-full py-2 rounded-lg text-sm font-medium text-gray-300 bg-gray-700/50 hover:bg-gray-700 transition-all"
+                        >
+                            Load more
+                        </button>
+                    )}
                 </div>
             </div>
 
@@ -7,7 +7,11 @@ const Dashboard = () => {
     const [stats, setStats] = useState({
         total_sales: 0,
         total_users: 0,
-        pending_deposits: 0
+        pending_deposits: 0,
+        today_revenue: 0,
+        today_sales: 0,
+        total_available: 0,
+        stock: []
     });
     const [loading, setLoading] = useState(true);
 
@@ -38,7 +42,22 @@ const Dashboard = () => {
                 <StatCard label="Total Sales" value={loading ? "..." : `₹${stats.total_sales.toFixed(2)}`} />
                 <StatCard label="Total Users" value={loading ? "..." : stats.total_users} />
                 <StatCard label="Pending Deposits" value={loading ? "..." : stats.pending_deposits} highlight />
+                <StatCard label="Today's Revenue" value={loading ? "..." : `₹${stats.today_revenue.toFixed(2)} (${stats.today_sales})`} />
+                <StatCard label="Available Stock" value={loading ? "..." : stats.total_available} />
             </div>
+            {!loading && stats.stock.length > 0 && (
+                <div className="mt-6 bg-gray-800 p-5 rounded-2xl border border-gray-700">
+                    <p className="text-gray-400 text-sm mb-3 uppercase tracking-wider font-semibold">Stock by Country</p>
+                    <div className="grid grid-cols-2 sm:grid-cols-3 lg:grid-cols-4 gap-2">
+                        {stats.stock.map(c => (
+                            <div key={c.country_id} className="flex items-center justify-between bg-gray-700/30 px-3 py-2 rounded-lg text-sm">
+                                <span className="text-white">{c.emoji} {c.name}</span>
+                                <span className={c.available > 0 ? 'text-green-400 font-semibold' : 'text-gray-500'}>{c.available}</span>
+                            </div>
+                        ))}
+                    </div>
+                </div>
+            )}
         </div>
     );
 };
@@ -18,11 +18,10 @@ export default function DepositDetail() {
     const fetchDeposit = async () => {
         try {
             const token = localStorage.getItem('adminToken');
-            const { data } = await axios.get(`${API_BASE}/admin/deposits/enhanced`, {
+            const { data } = await axios.get(`${API_BASE}/admin/deposits/${id}`, {
                 headers: { Authorization: `Bearer ${token}` }
             });
-            const foundDeposit = data.find(d => d.id === parseInt(id));
-            setDeposit(foundDeposit);
+            setDeposit(data);
         } catch (err) {
             console.error(err);
         } finally {
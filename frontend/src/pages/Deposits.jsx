@@ -10,18 +10,39 @@ export default function Deposits() {
     const [loading, setLoading] = useState(true);
     const [activeTab, setActiveTab] = useState('PENDING');
     const [currentPage, setCurrentPage] = useState(1);
+    const [total, setTotal] = useState(0);
+    // cursors[n] fetches page n + 1; filled in as the server hands out X-Next-Cursor
+    const [cursors, setCursors] = useState([null]);
 
     useEffect(() => {
-        fetchDeposits();
-    }, []);
+        let stale = false;
+        fetchDeposits(() => stale);
+        // A slow response for the previous tab/page must not overwrite this one
+        return () => { stale = true; };
+    }, [activeTab, currentPage]);
 
-    const fetchDeposits = async () => {
+    const fetchDeposits = async (isStale) => {
         try {
             const token = localStorage.getItem('adminToken');
-            const { data } = await axios.get(`${API_BASE}/admin/deposits/enhanced`, {
-                headers: { Authorization: `Bearer ${token}` }
+            const params = { status: activeTab, limit: PER_PAGE };
+            const cursor = cursors[currentPage - 1];
+            if (cursor) params.cursor = cursor;
+
+            const res = await axios.get(`${API_BASE}/admin/deposits/enhanced`, {
+                headers: { Authorization: `Bearer ${token}` },
+                params
             });
-            setDeposits(data);
+            if (isStale()) return;
+            setDeposits(res.data);
+            if (res.headers['x-total-count']) setTotal(parseInt(res.headers['x-total-count']));
+            const next = res.headers['x-next-cursor'];
+            if (next) {
+                setCursors(prev => {
+                    const updated = prev.slice(0, currentPage);
+                    updated[currentPage] = next;
+                    return updated;
+                });
+            }
             setLoading(false);
         } catch (err) {
             console.error(err);
@@ -29,18 +50,17 @@ export default function Deposits() {
         }
     };
 
-    // Filter and paginate
-    const filteredDeposits = deposits.filter(d => d.status === activeTab);
-    const totalPages = Math.ceil(filteredDeposits.length / PER_PAGE);
-    const paginatedDeposits = filteredDeposits.slice(
-        (currentPage - 1) * PER_PAGE,
-        currentPage * PER_PAGE
-    );
+    // Server filters by tab and returns one page at a time
+    const totalPages = Math.ceil(total / PER_PAGE);
+    const paginatedDeposits = deposits;
 
-    // Reset to page 1 when changing tabs
-    useEffect(() => {
+    // Reset paging in the same update as the tab, so the fetch never sees the old tab's cursor
+    const changeTab = (tab) => {
+        if (tab === activeTab) return;
+        setCursors([null]);
         setCurrentPage(1);
-    }, [activeTab]);
+        setActiveTab(tab);
+    };
 
     const getStatusIcon = (status) => {
         switch (status) {
@@ -70,7 +90,7 @@ export default function Deposits() {
                 {['PENDING', 'APPROVED', 'REJECTED'].map(tab => (
                     <button
                         key={tab}
-                        onClick={() => setActiveTab(tab)}
+                        onClick={() => changeTab(tab)}
                         className={`px-4 py-2 rounded-lg font-medium transition-all whitespace-nowrap ${activeTab === tab
                             ? 'bg-blue-600 text-white'
                             : 'bg-gray-800 text-gray-400 hover:bg-gray-700'
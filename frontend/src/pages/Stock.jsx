@@ -7,6 +7,8 @@ const API_BASE = import.meta.env.VITE_API_BASE_URL || 'https://welldecked-deflec
 const Stock = () => {
     const [accounts, setAccounts] = useState([]);
     const [countries, setCountries] = useState([]);
+    const [summary, setSummary] = useState({ total: 0, available: 0, sold: 0, by_country: [] });
+    const [nextCursor, setNextCursor] = useState(null);
     const [searchTerm, setSearchTerm] = useState('');
     const [filterCountry, setFilterCountry] = useState('');
     const [filterStatus, setFilterStatus] = useState('all');
@@ -15,41 +17,44 @@ const Stock = () => {
         fetchData();
     }, []);
 
+    useEffect(() => {
+        // Filters run server-side; debounce typing in the phone search
+        const timer = setTimeout(() => fetchAccounts(), 300);
+        return () => clearTimeout(timer);
+    }, [searchTerm, filterCountry, filterStatus]);
+
     const fetchData = async () => {
-        const [accountsRes, countriesRes] = await Promise.all([
-            axios.get(`${API_BASE}/admin/accounts`),
+        const [summaryRes, countriesRes] = await Promise.all([
+            axios.get(`${API_BASE}/admin/accounts/summary`),
             axios.get(`${API_BASE}/admin/countries`)
         ]);
-        setAccounts(accountsRes.data);
+        setSummary(summaryRes.data);
         setCountries(countriesRes.data);
     };
 
+    const fetchAccounts = async (cursor = null) => {
+        const params = {};
+        if (filterCountry) params.country_id = filterCountry;
+        if (filterStatus !== 'all') params.is_sold = filterStatus === 'sold';
+        if (searchTerm) params.phone = searchTerm.trim();
+        if (cursor) params.cursor = cursor;
+
+        const res = await axios.get(`${API_BASE}/admin/accounts`, { params });
+        setAccounts(prev => cursor ? [...prev, ...res.data] : res.data);
+        setNextCursor(res.headers['x-next-cursor'] || null);
+    };
+
     const getCountryById = (id) => countries.find(c => c.id === id);
+    const getCountryCounts = (id) => summary.by_country.find(c => c.country_id === id) || { available: 0, sold: 0 };
 
-    const filteredAccounts = accounts.filter(acc => {
-        const country = getCountryById(acc.country_id);
-        const matchesCountry = !filterCountry || acc.country_id === parseInt(filterCountry);
-        const matchesStatus = filterStatus === 'all' ||
-            (filterStatus === 'available' && acc.is_sold === false) ||
-            (filterStatus === 'sold' && acc.is_sold === true);
-        const matchesSearch = !searchTerm ||
-            acc.phone_number.includes(searchTerm) ||
-            country?.name.toLowerCase().includes(searchTerm.toLowerCase());
-        return matchesCountry && matchesStatus && matchesSearch;
-    });
-
-    const groupedByCountry = filteredAccounts.reduce((acc, account) => {
+    const groupedByCountry = accounts.reduce((acc, account) => {
         const countryId = account.country_id;
         if (!acc[countryId]) acc[countryId] = [];
         acc[countryId].push(account);
         return acc;
     }, {});
 
-    const stats = {
-        total: accounts.length,
-        available: accounts.filter(a => a.is_sold === false).length,
-        sold: accounts.filter(a => a.is_sold === true).length
-    };
+    const stats = summary;
 
     return (
         <div className="space-y-4 max-w-7xl mx-auto">
@@ -76,7 +81,7 @@ const Stock = () => {
                             type="text"
                             value={searchTerm}
                             onChange={e => setSearchTerm(e.target.value)}
-                            placeholder="Search phone or country..."
+                            placeholder="Search phone number..."
                             className="w-full bg-gray-700/50 border-none rounded-lg py-2 pl-9 pr-3 text-sm ring-1 ring-gray-600/50 focus:ring-2 focus:ring-blue-500/50 outline-none transition-all text-white placeholder:text-gray-500"
                         />
                     </div>
@@ -143,8 +148,7 @@ const Stock = () => {
                 ) : (
                     Object.entries(groupedByCountry).map(([countryId, countryAccounts]) => {
                         const country = getCountryById(parseInt(countryId));
-                        const availableCount = countryAccounts.filter(a => a.is_sold === false).length;
-                        const soldCount = countryAccounts.filter(a => a.is_sold === true).length;
+                        const { available: availableCount, sold: soldCount } = getCountryCounts(parseInt(countryId));
 
                         return (
                             <div key={countryId} className="bg-gray-800/50 rounded-xl border border-gray-700/50 overflow-hidden backdrop-blur-sm">
@@ -198,6 +202,14 @@ const Stock = () => {
                         );
                     })
                 )}
+                {nextCursor && (
+                    <button
+                        onClick={() => fetchAccounts(nextCursor)}
+                        className="w-full py-2 rounded-lg text-sm font-medium text-gray-300 bg-gray-800/50 hover:bg-gray-700/50 border border-gray-700/50 transition-all"
+                    >
+                        Load more
+                    </button>
+                )}
             </div>
         </div>
     );
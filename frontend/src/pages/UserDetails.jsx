@@ -25,10 +25,21 @@ const UserDetails = () => {
         fetchDetails();
     }, [id]);
 
+    // Older history pages; kind is 'purchases' or 'deposits'
+    const loadMore = async (kind) => {
+        const cursor = data[`${kind}_next_cursor`];
+        const res = await axios.get(`${API_BASE}/admin/users/${id}/${kind}`, { params: { cursor } });
+        setData(prev => ({
+            ...prev,
+            [kind]: [...prev[kind], ...res.data],
+            [`${kind}_next_cursor`]: res.headers['x-next-cursor'] || null
+        }));
+    };
+
     if (loading) return <div className="text-center text-gray-400 py-10">Loading profile...</div>;
     if (!data) return <div className="text-center text-red-400 py-10">User not found.</div>;
 
-    const { user, purchases, deposits } = data;
+    const { user, purchases, deposits, purchases_total, deposits_total } = data;
 
     return (
         <div className="space-y-6 animate-in pb-10">
@@ -68,7 +79,7 @@ const UserDetails = () => {
                 <div className="space-y-4">
                     <div className="flex items-center space-x-2">
                         <ShoppingBag className="text-blue-400" size={20} />
-                        <h3 className="text-xl font-bold">Purchase History</h3>
+                        <h3 className="text-xl font-bold">Purchase History ({purchases_total})</h3>
                     </div>
                     <div className="bg-gray-800/30 rounded-2xl overflow-hidden border border-gray-700">
                         {purchases.length > 0 ? (
@@ -86,6 +97,14 @@ const UserDetails = () => {
                         ) : (
                             <div className="p-10 text-center text-gray-500">No purchases found.</div>
                         )}
+                        {data.purchases_next_cursor && (
+                            <button
+                                onClick={() => loadMore('purchases')}
+                                className="w-full py-3 text-sm font-medium text-gray-300 bg-gray-800/50 hover:bg-gray-700/50 border-t border-gray-700 transition-all"
+                            >
+                                Load more
+                            </button>
+                        )}
                     </div>
                 </div>
 
@@ -93,7 +112,7 @@ const UserDetails = () => {
                 <div className="space-y-4">
                     <div className="flex items-center space-x-2">
                         <CreditCard className="text-green-400" size={20} />
-                        <h3 className="text-xl font-bold">Deposit History</h3>
+                        <h3 className="text-xl font-bold">Deposit History ({deposits_total})</h3>
                     </div>
                     <div className="bg-gray-800/30 rounded-2xl overflow-hidden border border-gray-700">
                         {deposits.length > 0 ? (
@@ -119,6 +138,14 @@ const UserDetails = () => {
                         ) : (
                             <div className="p-10 text-center text-gray-500">No deposits found.</div>
                         )}
+                        {data.deposits_next_cursor && (
+                            <button
+                                onClick={() => loadMore('deposits')}
+                                className="w-full py-3 text-sm font-medium text-gray-300 bg-gray-800/50 hover:bg-gray-700/50 border-t border-gray-700 transition-all"
+                            >
+                                Load more
+                            </button>
+                        )}
                     </div>
                 </div>
             </div>
@@ -14,15 +14,22 @@ const Users = () => {
     const [adjustType, setAdjustType] = useState('admin_add');
     const [amount, setAmount] = useState('');
     const [toast, setToast] = useState(null);
+    const [nextCursor, setNextCursor] = useState(null);
 
     useEffect(() => {
-        fetchUsers();
-    }, []);
+        // Search runs server-side; debounce typing
+        const timer = setTimeout(() => fetchUsers(), 300);
+        return () => clearTimeout(timer);
+    }, [search]);
 
-    const fetchUsers = async () => {
+    const fetchUsers = async (cursor = null) => {
         try {
-            const res = await axios.get(`${API_BASE}/admin/users`);
-            setUsers(res.data);
+            const params = {};
+            if (search) params.search = search.trim();
+            if (cursor) params.cursor = cursor;
+            const res = await axios.get(`${API_BASE}/admin/users`, { params });
+            setUsers(prev => cursor ? [...prev, ...res.data] : res.data);
+            setNextCursor(res.headers['x-next-cursor'] || null);
         } catch (err) {
             console.error("Error fetching users:", err);
         } finally {
@@ -68,11 +75,7 @@ const Users = () => {
         setShowModal(true);
     };
 
-    const filteredUsers = users.filter(u =>
-        (u.username && u.username.toLowerCase().includes(search.toLowerCase())) ||
-        (u.telegram_id.toString().includes(search)) ||
-        (u.full_name && u.full_name.toLowerCase().includes(search.toLowerCase()))
-    );
+    const filteredUsers = users;
 
     if (loading) return <div className="text-center text-gray-400 py-10">Loading users...</div>;
 
@@ -139,6 +142,15 @@ const Users = () => {
                         No users found matching "{search}"
                     </div>
                 )}
+
+                {nextCursor && (
+                    <button
+                        onClick={() => fetchUsers(nextCursor)}
+                        className="w-full py-3 rounded-2xl text-sm font-medium text-gray-300 bg-gray-800/50 hover:bg-gray-700/50 border border-gray-700 transition-all"
+                    >
+                        Load more
+                    </button>
+                )}
             </div>
 
             {/* Balance Adjustment Modal */}
@@ -0,0 +1,30 @@
+"""
+Test setup: a throwaway SQLite database and dummy bot credentials, set
+before any backend module is imported.
+"""
+import os
+import sys
+import asyncio
+import tempfile
+
+import pytest
+
+_db_dir = tempfile.mkdtemp(prefix="bot_tests_")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_db_dir}/test.db"
+os.environ.setdefault("BOT_TOKEN", "123456:test")
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# One loop for the whole run: pyrogram needs a current loop at import time and
+# pooled aiosqlite connections are bound to the loop that opened them
+loop = asyncio.new_event_loop()
+asyncio.set_event_loop(loop)
+
+
+@pytest.fixture(scope="session")
+def run():
+    from backend.database import init_db
+    loop.run_until_complete(init_db())
+    return loop.run_until_complete
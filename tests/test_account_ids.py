@@ -0,0 +1,72 @@
+"""
+Account ids must never be reused on SQLite: accounts_archive keys archived
+accounts by their old id, and purchased_account_stmt looks in both tables.
+"""
+import os
+import tempfile
+
+from sqlalchemy import insert, select, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from backend.inventory import purchased_account_stmt
+from backend.migrations import accounts_sqlite_autoincrement
+from backend.models import Account, AccountArchive, AccountSecret, Base
+
+
+async def legacy_database():
+    """Engine on a fresh file whose accounts table predates AUTOINCREMENT"""
+    path = os.path.join(tempfile.mkdtemp(prefix="account_ids_"), "legacy.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        table_sql = await conn.scalar(text("SELECT sql FROM sqlite_master WHERE name = 'accounts'"))
+        await conn.execute(text("PRAGMA writable_schema = ON"))
+        await conn.execute(
+            text("UPDATE sqlite_master SET sql = :sql WHERE name = 'accounts'"),
+            {"sql": table_sql.replace("AUTOINCREMENT", "")}
+        )
+        await conn.execute(text("PRAGMA writable_schema = OFF"))
+    await engine.dispose()
+    return create_async_engine(f"sqlite+aiosqlite:///{path}")
+
+
+async def add_account(conn, phone: str) -> int:
+    result = await conn.execute(
+        insert(Account).values(country_id=1, phone_number=phone, type="ID", is_sold=False).returning(Account.id)
+    )
+    return result.scalar_one()
+
+
+def test_archived_ids_are_not_reused(run):
+    async def scenario():
+        engine = await legacy_database()
+        async with engine.begin() as conn:
+            for n in range(3):
+                await add_account(conn, f"+1000000000{n}")
+            # Archive the newest account, as the archiver does
+            await conn.execute(insert(AccountArchive).values(id=3, country_id=1, phone_number="+10000000002", type="ID"))
+            await conn.execute(text("DELETE FROM accounts WHERE id = 3"))
+            reused = await add_account(conn, "+19999999999")
+            await conn.execute(insert(AccountSecret).values(account_id=reused, session_data="secret"))
+
+        async with engine.begin() as conn:
+            await accounts_sqlite_autoincrement(conn)
+
+        async with engine.begin() as conn:
+            renumbered = await conn.scalar(select(Account.id).where(Account.phone_number == "+19999999999"))
+            secret_owner = await conn.scalar(select(AccountSecret.account_id))
+            next_id = await add_account(conn, "+18888888888")
+            archived = (await conn.execute(purchased_account_stmt(3))).all()
+            indexes = (await conn.execute(text(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'accounts'"
+            ))).scalars().all()
+        await engine.dispose()
+        return reused, renumbered, secret_owner, next_id, archived, indexes
+
+    reused, renumbered, secret_owner, next_id, archived, indexes = run(scenario())
+
+    assert reused == 3  # the bug: the archived id was handed out again
+    assert renumbered == secret_owner == 4
+    assert next_id == 5
+    assert [row.phone_number for row in archived] == ["+10000000002"]
+    assert "ix_accounts_unsold" in indexes
@@ -0,0 +1,60 @@
+"""
+Long-running handler loops must not hold the chat's update lane: the
+handler returns at once and a later press in the same chat can stop the loop.
+"""
+import asyncio
+from types import SimpleNamespace
+
+from backend import bot as bot_module
+from backend.update_queue import UpdateQueue
+
+
+class FakeSessionManager:
+    async def check_login_status(self, phone_number):
+        return None
+
+    async def check_latest_otp(self, phone_number):
+        return None
+
+
+def make_message(chat_id: int, message_id: int):
+    async def edit_text(*args, **kwargs):
+        edits.append(args[0] if args else kwargs.get("text"))
+
+    edits = []
+    return SimpleNamespace(chat=SimpleNamespace(id=chat_id), message_id=message_id, edit_text=edit_text), edits
+
+
+def test_otp_wait_releases_the_lane_and_stops(run, monkeypatch):
+    monkeypatch.setattr(bot_module, "get_session_manager", lambda: FakeSessionManager())
+    message, edits = make_message(chat_id=42, message_id=7)
+    order = []
+
+    async def process(update):
+        if update.kind == "start":
+            bot_module.start_otp_waiting(message, "+10000000000", purchase_id=1)
+        else:
+            bot_module.stop_otp_waiting(message)
+        order.append(update.kind)
+
+    def update(update_id, kind):
+        return SimpleNamespace(update_id=update_id, kind=kind, event=SimpleNamespace(chat=SimpleNamespace(id=42)))
+
+    async def scenario():
+        queue = UpdateQueue(process, workers=1)
+        await queue.start()
+        queue.put(update(1, "start"))
+        await asyncio.sleep(0.1)
+        waiting_before = (42, 7) in bot_module.otp_waits
+        queue.put(update(2, "stop"))
+        await asyncio.sleep(0.1)
+        waiting_after = (42, 7) in bot_module.otp_waits
+        await queue.stop()
+        return waiting_before, waiting_after
+
+    waiting_before, waiting_after = run(scenario())
+
+    # The wait was polling when the stop press arrived (not 2 minutes later) and was cancelled
+    assert order == ["start", "stop"]
+    assert waiting_before and not waiting_after
+    assert len(edits) == 1
@@ -0,0 +1,40 @@
+"""
+DELETE /admin/accounts/{id} only removes unsold stock: a sold account is
+still looked up for delivery, OTPs and purchase history.
+"""
+from fastapi.testclient import TestClient
+
+from backend import main
+from backend.database import async_session
+from backend.inventory import purchased_account_stmt
+from backend.models import Account, Country
+
+
+async def seed():
+    async with async_session() as session:
+        country = Country(name="Deletia", emoji="🏳️", price=10.0)
+        session.add(country)
+        await session.flush()
+        sold = Account(country_id=country.id, phone_number="+15550000001", type="ID", is_sold=True)
+        unsold = Account(country_id=country.id, phone_number="+15550000002", type="ID", is_sold=False)
+        session.add_all([sold, unsold])
+        await session.commit()
+        return sold.id, unsold.id
+
+
+async def still_there(account_id):
+    async with async_session() as session:
+        return (await session.execute(purchased_account_stmt(account_id))).first() is not None
+
+
+def test_sold_accounts_are_kept(run):
+    sold_id, unsold_id = run(seed())
+    client = TestClient(main.app)
+
+    response = client.delete(f"/admin/accounts/{sold_id}")
+    assert response.status_code == 409
+    assert run(still_there(sold_id))
+
+    assert client.delete(f"/admin/accounts/{unsold_id}").status_code == 200
+    assert not run(still_there(unsold_id))
+    assert client.delete(f"/admin/accounts/{unsold_id}").status_code == 404
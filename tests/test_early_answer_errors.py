@@ -0,0 +1,40 @@
+"""
+Handlers that keep the early callback answer cannot report errors with their
+own callback.answer() (DropLateAnswers drops it); the error must reach the
+chat through the message instead.
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from backend import bot as bot_module
+from backend.callback_answer import early_answer_middleware
+
+from test_purchase_failures import Recorder
+
+MISSING = 999_999
+
+HANDLERS = [
+    ("process_country_selection", f"country_{MISSING}"),
+    ("process_session_country", f"session_{MISSING}"),
+    ("process_confirm_purchase", f"confirm_buy_{MISSING}"),
+    ("process_profile", "btn_profile"),
+    ("process_resend_otp", f"resend_otp_{MISSING}"),
+    ("handle_check_otp", f"check_otp_{MISSING}"),
+    ("handle_check_login", f"check_login_{MISSING}"),
+]
+
+
+@pytest.mark.parametrize("handler_name, data", HANDLERS)
+def test_errors_reach_the_chat(run, handler_name, data):
+    handler = getattr(bot_module, handler_name)
+    toasts, chat = Recorder(), Recorder()
+    message = SimpleNamespace(chat=SimpleNamespace(id=MISSING), edit_text=chat, answer=chat)
+    callback = SimpleNamespace(id="q1", data=data, from_user=SimpleNamespace(id=MISSING), message=message, answer=toasts)
+
+    # The handler object carries its flags, as the dispatcher would pass it
+    resolved = next(h for h in bot_module.dp.callback_query.handlers if h.callback is handler)
+    run(early_answer_middleware(lambda event, data: handler(event), callback, {"handler": resolved}))
+
+    assert len(toasts.texts) >= 1  # the early answer
+    assert any("not found" in text for text in chat.texts)
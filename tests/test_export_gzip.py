@@ -0,0 +1,41 @@
+"""
+/admin/export?gzip=true already streams a .gz file; the GZip middleware must
+pass it through instead of compressing it a second time.
+"""
+import gzip
+
+from fastapi.testclient import TestClient
+
+from backend import main
+from backend.database import async_session
+from backend.models import User
+
+
+async def seed():
+    async with async_session() as session:
+        session.add_all([
+            User(telegram_id=820_000 + n, username=f"export{n}", full_name=f"Export {n}", balance=0.0, is_admin=False)
+            for n in range(50)
+        ])
+        await session.commit()
+
+
+def export(client, **params):
+    response = client.get("/admin/export/users", params=params, headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    return response
+
+
+def test_gzip_export_is_compressed_once(run):
+    run(seed())
+    client = TestClient(main.app)
+
+    response = export(client, gzip="true")
+    assert "content-encoding" not in response.headers
+    assert response.headers["content-type"] == "application/gzip"
+    assert gzip.decompress(response.content).startswith(b"id,telegram_id,username")
+
+    # Plain exports still get compressed on the wire
+    response = export(client)
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.text.startswith("id,telegram_id,username")
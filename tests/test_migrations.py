@@ -0,0 +1,27 @@
+"""
+Without the session advisory lock (DB_POOLER_MODE) a worker can read a stale
+schema version; it must skip migrations another worker already recorded
+instead of failing on the schema_version primary key.
+"""
+from sqlalchemy import func, select
+
+from backend import migrations
+from backend.database import engine
+from backend.models import SchemaVersion
+
+
+def test_stale_version_skips_applied_migrations(run, monkeypatch):
+    async def versions():
+        async with engine.connect() as conn:
+            return await conn.scalar(select(func.count(SchemaVersion.version)))
+
+    before = run(versions())
+
+    async def stale_version(engine):
+        # What a worker sees if it read the version just before another finished
+        return migrations.LATEST_VERSION - 3
+
+    monkeypatch.setattr(migrations, "get_schema_version", stale_version)
+
+    assert run(migrations.run_migrations(engine, use_advisory_lock=False)) == migrations.LATEST_VERSION
+    assert run(versions()) == before
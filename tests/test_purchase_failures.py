@@ -0,0 +1,94 @@
+"""
+Purchase handlers must report a failed purchase to the buyer even though
+purchase_account rolls back (and so expires) the user and country they loaded.
+"""
+import itertools
+from types import SimpleNamespace
+
+import pytest
+
+from backend import bot as bot_module
+from backend.database import async_session
+from backend.models import Country, User
+
+_ids = itertools.count(1)
+
+
+class Recorder:
+    """Stands in for a Bot API method: remembers every text it was called with"""
+
+    def __init__(self):
+        self.texts = []
+
+    async def __call__(self, *args, **kwargs):
+        texts = [arg for arg in args if isinstance(arg, str)]
+        self.texts.append(kwargs.get("text") or (texts[0] if texts else ""))
+        return True
+
+
+def make_callback(telegram_id: int, data: str):
+    recorder = Recorder()
+    message = SimpleNamespace(
+        chat=SimpleNamespace(id=telegram_id),
+        edit_text=recorder, delete=Recorder(), answer=recorder
+    )
+    callback = SimpleNamespace(
+        data=data, from_user=SimpleNamespace(id=telegram_id), message=message,
+        answer=recorder, bot=SimpleNamespace(send_message=recorder)
+    )
+    return callback, recorder
+
+
+async def seed(balance: float, price: float):
+    """A user and a country with no stock; returns (telegram_id, country_id)"""
+    n = next(_ids)
+    async with async_session() as session:
+        country = Country(name=f"Testland {n}", emoji="🏳️", price=price)
+        user = User(telegram_id=900_000 + n, username=f"buyer{n}", full_name="Buyer", balance=balance, is_admin=False)
+        session.add_all([country, user])
+        await session.commit()
+        return user.telegram_id, country.id
+
+
+HANDLERS = [
+    ("confirm_purchase_handler", "confirm_buy_{}_ID"),
+    ("process_buy_id", "buy_id_{}"),
+    ("process_confirm_purchase", "confirm_buy_{}"),
+]
+
+
+@pytest.mark.parametrize("handler_name, data", HANDLERS)
+def test_insufficient_balance_is_reported(run, handler_name, data):
+    telegram_id, country_id = run(seed(balance=4.0, price=10.0))
+    callback, recorder = make_callback(telegram_id, data.format(country_id))
+
+    run(getattr(bot_module, handler_name)(callback))
+
+    reply = " ".join(recorder.texts)
+    assert "nsufficient" in reply
+    assert "6.0" in reply  # short by price - balance
+
+
+@pytest.mark.parametrize("handler_name, data", HANDLERS)
+def test_out_of_stock_is_reported(run, handler_name, data):
+    telegram_id, country_id = run(seed(balance=100.0, price=10.0))
+    callback, recorder = make_callback(telegram_id, data.format(country_id))
+
+    run(getattr(bot_module, handler_name)(callback))
+
+    assert "out of stock" in " ".join(recorder.texts).lower()
+
+
+def test_failed_purchase_reports_current_balance(run):
+    from sqlalchemy import select
+    from backend.inventory import purchase_account
+
+    telegram_id, country_id = run(seed(balance=4.0, price=10.0))
+
+    async def attempt():
+        async with async_session() as session:
+            user_id = await session.scalar(select(User.id).where(User.telegram_id == telegram_id))
+            return await purchase_account(session, user_id, country_id, 10.0, "ID")
+
+    result = run(attempt())
+    assert result == {"success": False, "status": "INSUFFICIENT_BALANCE", "balance": 4.0}
@@ -0,0 +1,34 @@
+"""
+WEBHOOK_RECORD_FILE capture: one update per line, written off the event loop.
+"""
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+from backend import main
+
+
+def test_updates_are_recorded_in_a_worker_thread(run, tmp_path, monkeypatch):
+    path = tmp_path / "updates.ndjson"
+    on_loop = []
+    record = main.record_update
+
+    def spy(body):
+        try:
+            asyncio.get_running_loop()
+            on_loop.append(True)
+        except RuntimeError:
+            on_loop.append(False)
+        record(body)
+
+    monkeypatch.setattr(main, "WEBHOOK_RECORD_FILE", str(path))
+    monkeypatch.setattr(main, "record_update", spy)
+
+    body = json.dumps({"update_id": 830_001}, indent=2)
+    response = TestClient(main.app).post(main.WEBHOOK_PATH, content=body)
+
+    assert response.status_code == 200
+    assert path.read_bytes().count(b"\n") == 1
+    assert json.loads(path.read_text()) == {"update_id": 830_001}
+    assert on_loop == [False]
@@ -0,0 +1,52 @@
+"""
+Admin endpoints that used to return ORM objects or bare dicts now go through
+explicit response models; the JSON keeps its shape.
+"""
+from fastapi.testclient import TestClient
+
+from backend import main
+from backend.database import async_session
+from backend.models import Country, Deposit, User
+
+
+async def seed():
+    async with async_session() as session:
+        user = User(telegram_id=840_001, username="modelled", full_name="Modelled User", balance=10.0, is_admin=False)
+        session.add_all([user, Country(name="Modelland", emoji="🏳️", price=5.0)])
+        await session.flush()
+        deposit = Deposit(user_id=user.id, amount=20.0, upi_ref_id="MODEL-1", status="PENDING")
+        session.add(deposit)
+        await session.commit()
+        return user.id, deposit.id
+
+
+async def no_send(*args, **kwargs):
+    return None
+
+
+def test_admin_responses_keep_their_shape(run, monkeypatch):
+    user_id, deposit_id = run(seed())
+    monkeypatch.setattr(main.bot, "send_message", no_send)
+    monkeypatch.setattr(main, "send_deposit_notifications", no_send)
+    client = TestClient(main.app)
+
+    adjusted = client.post(f"/admin/users/{user_id}/adjust-balance", json={"amount": 5.0, "reason": "admin_add"}).json()
+    assert adjusted["status"] == "success"
+    assert adjusted["new_balance"] == 15.0
+    assert adjusted["user"]["id"] == user_id and adjusted["user"]["balance"] == 15.0
+
+    batch = client.post("/admin/deposits/batch", json={"ids": [deposit_id, 0], "status": "approved"}).json()
+    assert batch == {
+        "status": "SUCCESS", "updated": 1, "skipped": [0],
+        "deposits": [{"id": deposit_id, "user_id": user_id, "amount": 20.0, "status": "APPROVED"}]
+    }
+
+    hits = client.get("/admin/search", params={"q": "modelled"}).json()
+    user_hit = next(hit for hit in hits if hit["kind"] == "user" and hit["id"] == user_id)
+    assert user_hit["username"] == "modelled" and "country_id" not in user_hit
+
+    stock = client.post("/admin/stock/rebuild").json()
+    assert all(set(row) == {"country_id", "type", "available"} for row in stock)
+
+    stats = client.get("/admin/stats").json()
+    assert {"total_users", "total_sales", "pending_deposits", "stock", "generated_at"} <= set(stats)
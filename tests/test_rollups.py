@@ -0,0 +1,86 @@
+"""
+Deposit rollups must count every approved deposit: ledger credits through the
+rollup job, and approvals from before the ledger through migration 16.
+Batches must never move the watermark past a row that is not folded yet.
+"""
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, select
+
+from backend import wallet
+from backend.database import async_session, engine
+from backend.migrations import backfill_legacy_deposit_rollups
+from backend.models import BalanceTransaction, DailyDeposits, Deposit, Purchase, User
+from backend.rollups import RollupJob, _batch_upper, get_timeseries
+
+DAY = date(2020, 3, 14)
+
+
+async def seed():
+    at = datetime.combine(DAY, datetime.min.time()) + timedelta(hours=10)
+    async with async_session() as session:
+        user = User(telegram_id=700_001, username="depositor", full_name="Depositor", balance=0.0, is_admin=False)
+        session.add(user)
+        await session.flush()
+        session.add_all([
+            # Approved before the ledger: no deposit credit
+            Deposit(user_id=user.id, amount=100.0, upi_ref_id="LEGACY-1", status="APPROVED", created_at=at),
+            Deposit(user_id=user.id, amount=50.0, upi_ref_id="LEGACY-2", status="APPROVED", created_at=at),
+            Deposit(user_id=user.id, amount=999.0, upi_ref_id="LEGACY-3", status="REJECTED", created_at=at),
+        ])
+        ledgered = Deposit(user_id=user.id, amount=25.0, upi_ref_id="LEDGER-1", status="APPROVED", created_at=at)
+        session.add(ledgered)
+        await session.flush()
+        session.add(BalanceTransaction(
+            user_id=user.id, type=wallet.DEPOSIT, amount=25.0, balance_after=175.0,
+            reference_id=ledgered.id, created_at=at
+        ))
+        await session.commit()
+
+
+async def day_totals():
+    async with async_session() as session:
+        row = await session.get(DailyDeposits, DAY)
+        return (row.approved, row.amount) if row else None
+
+
+def test_pre_ledger_deposits_are_backfilled(run):
+    run(seed())
+    run(RollupJob(lag_seconds=0).catch_up())
+    assert run(day_totals()) == (1, 25.0)  # ledger credit only
+
+    async def migrate():
+        async with engine.begin() as conn:
+            await backfill_legacy_deposit_rollups(conn)
+
+    run(migrate())
+    assert run(day_totals()) == (3, 175.0)
+
+    async def series():
+        async with async_session() as session:
+            return await get_timeseries(session, DAY, DAY)
+
+    (point,) = run(series())["series"]
+    assert (point["deposits_approved"], point["deposit_amount"]) == (3, 175.0)
+
+
+def test_batch_stops_before_rows_newer_than_the_cutoff(run):
+    cutoff = datetime(2021, 6, 1)
+
+    async def scenario():
+        async with async_session() as session:
+            last_id = await session.scalar(select(func.coalesce(func.max(Purchase.id), 0)))
+            # The middle row is past the cutoff; the older row after it must wait for it
+            session.add_all([
+                Purchase(user_id=None, account_id=None, amount=1.0, created_at=cutoff - timedelta(minutes=5)),
+                Purchase(user_id=None, account_id=None, amount=1.0, created_at=cutoff + timedelta(seconds=1)),
+                Purchase(user_id=None, account_id=None, amount=1.0, created_at=cutoff - timedelta(seconds=1)),
+            ])
+            await session.commit()
+            before = await _batch_upper(session, Purchase.id, Purchase.created_at, last_id, cutoff, 100)
+            after = await _batch_upper(session, Purchase.id, Purchase.created_at, last_id, cutoff + timedelta(minutes=1), 100)
+            return last_id, before, after
+
+    last_id, before, after = run(scenario())
+    assert before == last_id + 1
+    assert after == last_id + 3
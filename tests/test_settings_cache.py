@@ -0,0 +1,57 @@
+"""
+bump_settings_version must invalidate the worker's cache only once the
+writer's transaction commits, or a read in between caches the old values.
+"""
+import pytest
+from sqlalchemy import select
+
+from backend.database import async_session
+from backend.models import Settings
+from backend.settings_cache import bump_settings_version, settings_cache
+
+KEY = "test_cache_key"
+
+
+@pytest.fixture
+def cache(run):
+    interval = settings_cache.check_interval
+    settings_cache.check_interval = 3600
+    settings_cache.invalidate()
+    yield settings_cache
+    settings_cache.check_interval = interval
+    settings_cache.invalidate()
+
+
+async def write(value: str, commit: bool, read_before_commit=None):
+    async with async_session() as session:
+        setting = await session.scalar(select(Settings).where(Settings.key == KEY))
+        if setting:
+            setting.value = value
+        else:
+            session.add(Settings(key=KEY, value=value))
+        await bump_settings_version(session)
+        await session.flush()
+        seen = await read_before_commit() if read_before_commit else None
+        if commit:
+            await session.commit()
+        else:
+            await session.rollback()
+        return seen
+
+
+def test_cache_is_invalidated_after_commit(run, cache):
+    run(write("old", commit=True))
+    assert run(cache.get(KEY)) == "old"
+
+    seen = run(write("new", commit=True, read_before_commit=lambda: cache.get(KEY)))
+    assert seen == "old"
+    assert run(cache.get(KEY)) == "new"
+
+
+def test_rollback_keeps_the_cache(run, cache):
+    run(write("kept", commit=True))
+    assert run(cache.get(KEY)) == "kept"
+
+    run(write("discarded", commit=False))
+    assert cache._loaded
+    assert run(cache.get(KEY)) == "kept"
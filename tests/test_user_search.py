@@ -0,0 +1,46 @@
+"""
+/admin/users search: a case-insensitive prefix match where % and _ are
+literal characters, written so the lower(username) / lower(full_name)
+indexes can serve it.
+"""
+from fastapi.testclient import TestClient
+from sqlalchemy.dialects import postgresql
+
+from backend import main
+from backend.database import async_session
+from backend.models import User
+from backend.search import name_prefix
+
+NAMES = ["a_b", "axb", "50%off", "500club", "Alice"]
+
+
+async def seed():
+    async with async_session() as session:
+        session.add_all([
+            User(telegram_id=810_000 + n, username=name, full_name=f"Search {name}", balance=0.0, is_admin=False)
+            for n, name in enumerate(NAMES)
+        ])
+        await session.commit()
+
+
+def search(client, term):
+    response = client.get("/admin/users", params={"search": term, "limit": 50})
+    assert response.status_code == 200
+    return sorted(user["username"] for user in response.json() if user["username"] in NAMES)
+
+
+def test_wildcards_are_literal_and_case_is_ignored(run):
+    run(seed())
+    client = TestClient(main.app)
+
+    assert search(client, "a_b") == ["a_b"]
+    assert search(client, "50%") == ["50%off"]
+    assert search(client, "@ALI") == ["Alice"]
+    assert search(client, "a") == ["Alice", "a_b", "axb"]
+
+
+def test_postgres_filter_is_an_escaped_like_on_lower():
+    compiled = name_prefix(User.username, "50%_", True).compile(dialect=postgresql.dialect())
+    assert str(compiled).startswith("lower(users.username) LIKE ")
+    assert " ESCAPE " in str(compiled)
+    assert list(compiled.params.values()) == ["50\\%\\_%"]